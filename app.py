@@ -3,18 +3,32 @@ import hmac
 import hashlib
 import json
 import time
-import sqlite3
-import secrets
+from threading import Lock
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List
+from functools import lru_cache
+from typing import Optional, Dict, List, Tuple
 from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from marshmallow import Schema, fields, validate, ValidationError
-import requests
-from threading import Lock
 import logging
+import db
+import user_stats
+import lottery_engine
+from room_store import create_room_store
+from room_model import FINISHED_STATUSES, Participant, Room
+from room_expiry import RoomExpiry
+from broadcast import RoomBroadcaster, Subscription
+from scheduler import LotteryScheduler
+from telegram_client import TelegramError, get_client
+from update_pipeline import UpdatePipeline
+from group_commit import get_writer
+from cache import TTLCache
+from global_stats import get_global_stats
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, next_cursor
+import metrics
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -34,6 +48,7 @@ limiter = Limiter(
 # Конфигурация
 BOT_TOKEN = os.environ.get('BOT_TOKEN', '')
 ADMIN_USERNAME = 'klimaz'
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')  # заголовок X-Admin-Token для /api/stats
 WEBHOOK_URL = os.environ.get('WEBHOOK_URL', '')
 
 # Константы
@@ -42,13 +57,30 @@ MAX_ROOM_SIZE = 6
 WINNER_PERCENTAGE = 0.80  # 80% победителю
 ADMIN_PERCENTAGE = 0.20   # 20% админу
 LOTTERY_DURATION = 10     # Секунд анимации розыгрыша
+# Задержка между заполнением комнаты и розыгрышем (например, LOTTERY_DURATION для анимации)
+DRAW_DELAY = float(os.environ.get('DRAW_DELAY', 0))
+PAYMENT_WRITE_TIMEOUT = 10  # Секунд ожидания фиксации платежа
+HISTORY_EXPORT_CHUNK = 500  # Участий за один запрос при выгрузке истории в NDJSON
+INIT_DATA_MAX_AGE = 3600    # Секунд действия initData после auth_date
+# Снимок и журнал комнат (ROOM_STORE=memory) для восстановления после перезапуска
+ROOM_JOURNAL_PATH = os.environ.get('ROOM_JOURNAL_PATH', f'{db.DB_PATH}.rooms')
+# Сколько long-poll /api/room/<room_id>?since= ждет изменения комнаты
+ROOM_POLL_TIMEOUT = float(os.environ.get('ROOM_POLL_TIMEOUT', 25))
+
+broadcaster = RoomBroadcaster()  # SSE-подписчики комнат и long-poll
+room_not_modified = metrics.counter('rooms.poll_not_modified_total')
+room_polls_parked = metrics.counter('rooms.poll_parked_total')
 
-# Глобальное состояние комнат (в продакшене использовать Redis)
-rooms: Dict[str, Dict] = {}
-rooms_lock = Lock()
+# Уже проверенные строки initData -> данные пользователя (живут до auth_date + INIT_DATA_MAX_AGE)
+verified_init_data = TTLCache(maxsize=int(os.environ.get('INIT_DATA_CACHE_SIZE', 10000)))
+# Пользователи, чей профиль уже записан в БД: user_id -> (username, first_name, last_name)
+known_users = TTLCache(maxsize=int(os.environ.get('KNOWN_USERS_CACHE_SIZE', 100000)))
+metrics.gauge('users.known_cache_size', lambda: len(known_users))
+metrics.gauge('auth.init_data_cache_hits', lambda: verified_init_data.hits)
+metrics.gauge('auth.init_data_cache_misses', lambda: verified_init_data.misses)
 
-# База данных
-DB_PATH = 'lottery.db'
+# База данных (доступ только через модуль db: пул соединений, WAL)
+DB_PATH = db.DB_PATH
 
 # Validation Schemas
 class CreateInvoiceSchema(Schema):
@@ -58,99 +90,39 @@ class CreateInvoiceSchema(Schema):
 class UserInfoSchema(Schema):
     initData = fields.Str(required=True)
 
+class UserHistorySchema(Schema):
+    initData = fields.Str(required=True)
+    cursor = fields.Str(load_default=None)
+    limit = fields.Int(load_default=DEFAULT_PAGE_SIZE, validate=validate.Range(1, MAX_PAGE_SIZE))
+    format = fields.Str(load_default='json', validate=validate.OneOf(['json', 'ndjson']))
+
+class ReferralStatsSchema(Schema):
+    initData = fields.Str(required=True)
+    cursor = fields.Str(load_default=None)
+    limit = fields.Int(load_default=DEFAULT_PAGE_SIZE, validate=validate.Range(1, MAX_PAGE_SIZE))
+
 def init_db():
-    """Инициализация базы данных"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # Таблица пользователей
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
-        user_id INTEGER PRIMARY KEY,
-        username TEXT,
-        first_name TEXT,
-        last_name TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )''')
-    
-    # Таблица платежей
-    c.execute('''CREATE TABLE IF NOT EXISTS payments (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        amount INTEGER,
-        telegram_payment_charge_id TEXT UNIQUE,
-        status TEXT,
-        room_id TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users(user_id)
-    )''')
-    
-    # Таблица комнат
-    c.execute('''CREATE TABLE IF NOT EXISTS rooms (
-        room_id TEXT PRIMARY KEY,
-        entry_fee INTEGER,
-        status TEXT,
-        winner_user_id INTEGER,
-        total_pool INTEGER,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        completed_at TIMESTAMP,
-        FOREIGN KEY (winner_user_id) REFERENCES users(user_id)
-    )''')
-    
-    # Таблица участников комнат
-    c.execute('''CREATE TABLE IF NOT EXISTS room_participants (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        room_id TEXT,
-        user_id INTEGER,
-        payment_id INTEGER,
-        joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (room_id) REFERENCES rooms(room_id),
-        FOREIGN KEY (user_id) REFERENCES users(user_id),
-        FOREIGN KEY (payment_id) REFERENCES payments(id)
-    )''')
-    
-    # Таблица транзакций (для аудита)
-    c.execute('''CREATE TABLE IF NOT EXISTS transactions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        room_id TEXT,
-        from_user_id INTEGER,
-        to_user_id INTEGER,
-        amount INTEGER,
-        transaction_type TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (room_id) REFERENCES rooms(room_id)
-    )''')
-    
-    # Таблица рефералов
-    c.execute('''CREATE TABLE IF NOT EXISTS referrals (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        referrer_user_id INTEGER,
-        referred_user_id INTEGER UNIQUE,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (referrer_user_id) REFERENCES users(user_id),
-        FOREIGN KEY (referred_user_id) REFERENCES users(user_id)
-    )''')
-    
-    # Таблица реферальных бонусов
-    c.execute('''CREATE TABLE IF NOT EXISTS referral_bonuses (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        referrer_user_id INTEGER,
-        referred_user_id INTEGER,
-        bonus_amount INTEGER,
-        bonus_type TEXT,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (referrer_user_id) REFERENCES users(user_id),
-        FOREIGN KEY (referred_user_id) REFERENCES users(user_id)
-    )''')
-    
-    conn.commit()
-    conn.close()
-    logger.info("Database initialized successfully")
+    """Инициализация базы данных (применяет недостающие миграции)"""
+    version = db.migrate(DB_PATH)
+    logger.info(f"Database initialized successfully (schema version {version})")
+
+@lru_cache(maxsize=4)
+def _webapp_secret_key(bot_token: str) -> bytes:
+    """Ключ проверки initData: HMAC-SHA256("WebAppData", BOT_TOKEN), считается один раз на токен"""
+    return hmac.new("WebAppData".encode(), bot_token.encode(), hashlib.sha256).digest()
 
 def validate_telegram_init_data(init_data: str) -> Optional[Dict]:
     """
     Валидация initData от Telegram WebApp
     Возвращает распарсенные данные пользователя или None если невалидно
     """
+    # Mini App присылает одну и ту же initData на каждый запрос сессии:
+    # уже проверенная строка берется из кеша до истечения auth_date
+    cache_key = (BOT_TOKEN, init_data)
+    cached = verified_init_data.get(cache_key)
+    if cached is not None:
+        return dict(cached)
+    
     try:
         # Парсинг init_data
         params = {}
@@ -165,7 +137,7 @@ def validate_telegram_init_data(init_data: str) -> Optional[Dict]:
         
         # Проверяем auth_date (не старше 1 часа)
         auth_date = int(params.get('auth_date', 0))
-        if time.time() - auth_date > 3600:
+        if time.time() - auth_date > INIT_DATA_MAX_AGE:
             logger.warning("Init data expired")
             return None
         
@@ -173,133 +145,180 @@ def validate_telegram_init_data(init_data: str) -> Optional[Dict]:
         data_check_arr = [f"{k}={v}" for k, v in sorted(params.items())]
         data_check_string = '\n'.join(data_check_arr)
         
-        # Вычисляем secret_key
-        secret_key = hmac.new(
-            "WebAppData".encode(),
-            BOT_TOKEN.encode(),
-            hashlib.sha256
-        ).digest()
-        
         # Вычисляем hash
         calculated_hash = hmac.new(
-            secret_key,
+            _webapp_secret_key(BOT_TOKEN),
             data_check_string.encode(),
             hashlib.sha256
         ).hexdigest()
         
         # Сравниваем хеши
-        if calculated_hash != received_hash:
+        if not hmac.compare_digest(calculated_hash, received_hash):
             logger.warning("Invalid hash")
             return None
         
         # Парсим user данные
         user_data = json.loads(params.get('user', '{}'))
-        return user_data
+        verified_init_data.set(cache_key, user_data, expires_at=auth_date + INIT_DATA_MAX_AGE)
+        return dict(user_data)
     
     except Exception as e:
         logger.error(f"Error validating init data: {e}")
         return None
 
+def room_changed(room: Room):
+    """
+    Комната изменилась: разослать состояние подписчикам
+    Вызывается хранилищем комнат после каждого изменения, в том числе
+    сделанного другим процессом (ROOM_STORE=sqlite), и ставит срок
+    истечения комнаты.
+    """
+    broadcaster.publish(room['room_id'], room, final=room['status'] in FINISHED_STATUSES)
+    room_expiry.track(room)
+
+# Состояние комнат: memory — в памяти процесса, sqlite — общее для всех воркеров (ROOM_STORE)
+room_store = create_room_store(None, DB_PATH, MAX_ROOM_SIZE, on_change=room_changed,
+                               journal_path=ROOM_JOURNAL_PATH)
+
+# Планировщик розыгрышей; запускается в start_worker, комнаты получает из seat_paid
+scheduler = LotteryScheduler(room_store, DB_PATH, draw_delay=DRAW_DELAY)
+
+# Удаление завершенных комнат и закрытие зависших с возвратом Stars; запускается в start_worker
+room_expiry = RoomExpiry(room_store, DB_PATH, on_removed=broadcaster.forget)
+
+def _upsert_user(user_id: int, profile: Tuple[str, str, str]):
+    """Единица работы для потока записи: создать пользователя или обновить профиль"""
+    def write(conn):
+        conn.execute('''INSERT INTO users (user_id, username, first_name, last_name)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT(user_id) DO UPDATE SET
+                            username = excluded.username,
+                            first_name = excluded.first_name,
+                            last_name = excluded.last_name
+                        WHERE users.username IS NOT excluded.username
+                           OR users.first_name IS NOT excluded.first_name
+                           OR users.last_name IS NOT excluded.last_name''',
+                     (user_id, *profile))
+    return write
+
 def get_or_create_user(user_data: Dict) -> int:
     """Получить или создать пользователя в БД"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
     user_id = user_data.get('id')
-    username = user_data.get('username', '')
-    first_name = user_data.get('first_name', '')
-    last_name = user_data.get('last_name', '')
+    profile = (
+        user_data.get('username', ''),
+        user_data.get('first_name', ''),
+        user_data.get('last_name', '')
+    )
     
-    # Проверяем существование
-    c.execute('SELECT user_id FROM users WHERE user_id = ?', (user_id,))
-    if c.fetchone() is None:
-        # Создаем нового пользователя
-        c.execute('''INSERT INTO users (user_id, username, first_name, last_name)
-                     VALUES (?, ?, ?, ?)''',
-                  (user_id, username, first_name, last_name))
-        conn.commit()
-        logger.info(f"Created new user: {user_id}")
+    # Вернувшийся пользователь с тем же профилем — без обращения к БД
+    if known_users.get(user_id) == profile:
+        return user_id
+    
+    # Новый пользователь или изменился профиль: upsert уходит в поток записи,
+    # ответ его не ждет; при ошибке запись забывается и повторится в следующий раз
+    known_users.set(user_id, profile)
+    
+    def forget_on_error(future):
+        if future.exception() is not None:
+            logger.error(f"Error saving user {user_id}: {future.exception()}")
+            known_users.pop(user_id)
+    
+    get_writer(DB_PATH).submit(_upsert_user(user_id, profile)).add_done_callback(forget_on_error)
     
-    conn.close()
     return user_id
 
+def find_payment(room_id: str, user_id: int) -> Optional[int]:
+    """Записанный платеж участника комнаты (сверка мест при восстановлении комнат)"""
+    return db.fetch_value('SELECT payment_id FROM room_participants WHERE user_id = ? AND room_id = ?',
+                          (user_id, room_id), DB_PATH)
+
 def find_or_create_room(entry_fee: int) -> str:
     """Найти доступную комнату или создать новую"""
-    with rooms_lock:
-        # Ищем незаполненную комнату с таким же entry_fee
-        for room_id, room in rooms.items():
-            if (room['entry_fee'] == entry_fee and 
-                room['status'] == 'waiting' and 
-                len(room['participants']) < MAX_ROOM_SIZE):
-                return room_id
-        
-        # Создаем новую комнату
-        room_id = secrets.token_urlsafe(16)
-        rooms[room_id] = {
-            'room_id': room_id,
-            'entry_fee': entry_fee,
-            'status': 'waiting',  # waiting, drawing, completed
-            'participants': [],
-            'total_pool': 0,
-            'winner': None,
-            'created_at': datetime.now().isoformat()
-        }
-        
-        # Сохраняем в БД
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('''INSERT INTO rooms (room_id, entry_fee, status, total_pool)
-                     VALUES (?, ?, ?, ?)''',
-                  (room_id, entry_fee, 'waiting', 0))
-        conn.commit()
-        conn.close()
-        
-        logger.info(f"Created new room: {room_id} with entry fee: {entry_fee}")
-        return room_id
-
-def add_participant_to_room(room_id: str, user_id: int, payment_id: int, user_data: Dict):
-    """Добавить участника в комнату"""
-    with rooms_lock:
-        if room_id not in rooms:
-            return False
-        
-        room = rooms[room_id]
-        
-        # Проверяем, что пользователь еще не в комнате
-        if any(p['user_id'] == user_id for p in room['participants']):
-            logger.warning(f"User {user_id} already in room {room_id}")
-            return False
-        
-        # Добавляем участника
-        participant = {
-            'user_id': user_id,
-            'username': user_data.get('username', ''),
-            'first_name': user_data.get('first_name', ''),
-            'payment_id': payment_id,
-            'joined_at': datetime.now().isoformat()
-        }
-        room['participants'].append(participant)
-        room['total_pool'] += room['entry_fee']
-        
-        # Сохраняем в БД
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('''INSERT INTO room_participants (room_id, user_id, payment_id)
-                     VALUES (?, ?, ?)''',
-                  (room_id, user_id, payment_id))
-        c.execute('''UPDATE rooms SET total_pool = ? WHERE room_id = ?''',
-                  (room['total_pool'], room_id))
-        conn.commit()
-        conn.close()
-        
-        logger.info(f"Added user {user_id} to room {room_id}. Participants: {len(room['participants'])}/{MAX_ROOM_SIZE}")
-        
-        # Если комната заполнена, запускаем розыгрыш
-        if len(room['participants']) >= MAX_ROOM_SIZE:
-            room['status'] = 'drawing'
-            logger.info(f"Room {room_id} is full. Starting lottery...")
-        
-        return True
+    return room_store.open_room(entry_fee)['room_id']
+
+def reserve_seat(entry_fee: int, user_data: Dict) -> Tuple[Room, Optional[Participant]]:
+    """
+    Занять место в открытой комнате (только в хранилище комнат)
+    Возвращает (снимок комнаты, участник); участник None — пользователь уже в этой комнате.
+    """
+    # payment_id появится после записи платежа
+    participant = Participant(user_data['id'], user_data.get('username', ''), user_data.get('first_name', ''))
+    room, joined = room_store.join(entry_fee, participant)
+    return room, participant if joined else None
+
+def release_seat(room_id: str, user_id: int):
+    """Освободить место, если платеж не удалось записать"""
+    room_store.leave(room_id, user_id)
+
+def seat_paid(room_id: str, user_id: int, payment_id: int):
+    """Платеж записан: привязать его к участнику и запустить розыгрыш заполненной комнаты"""
+    if room_store.mark_paid(room_id, user_id, payment_id):
+        logger.info(f"Room {room_id} is full. Starting lottery...")
+        scheduler.notify_room_full(room_id)
+
+def settle_late_payment(future: Future, room_id: str, user_id: int):
+    """Запись платежа завершилась после таймаута ingest_payment: привязать место или освободить"""
+    if future.cancelled() or future.exception() is not None:
+        release_seat(room_id, user_id)
+        return
+    get_global_stats(DB_PATH).mark_stale()
+    seat_paid(room_id, user_id, future.result())
+
+def ingest_payment(user_data: Dict, entry_fee: int, charge_id: str) -> Tuple[str, int]:
+    """
+    Принять оплату: платеж, комната, участник и пул записываются одной
+    единицей работы через поток групповой фиксации. Возвращает (room_id,
+    payment_id) после того, как запись надежно зафиксирована.
+    """
+    user_id = user_data['id']
+    recorded = db.fetch_one('SELECT room_id, id FROM payments WHERE telegram_payment_charge_id = ? AND user_id = ?',
+                            (charge_id, user_id), DB_PATH)
+    if recorded is not None:
+        # Повтор обновления: платеж уже записан, место привязала его запись
+        return recorded[0], recorded[1]
+    
+    room, participant = reserve_seat(entry_fee, user_data)
+    room_id = room['room_id']
+    
+    def write(conn):
+        cursor = conn.execute('''INSERT INTO payments (user_id, amount, telegram_payment_charge_id, status, room_id)
+                                 VALUES (?, ?, ?, ?, ?)''',
+                              (user_id, entry_fee, charge_id, 'completed', room_id))
+        if participant is not None:
+            # Комнату создает первый записанный платеж, в каком бы порядке ни пришли пачки
+            conn.execute('''INSERT OR IGNORE INTO rooms (room_id, entry_fee, status, total_pool)
+                            VALUES (?, ?, ?, 0)''', (room_id, entry_fee, 'waiting'))
+            conn.execute('''INSERT INTO room_participants (room_id, user_id, payment_id)
+                            VALUES (?, ?, ?)''', (room_id, user_id, cursor.lastrowid))
+            conn.execute('UPDATE rooms SET total_pool = total_pool + ? WHERE room_id = ?',
+                         (entry_fee, room_id))
+        user_stats.record_payment(conn, user_id, entry_fee, joined_room=participant is not None)
+        return cursor.lastrowid
+    
+    future = get_writer(DB_PATH).submit(write)
+    try:
+        payment_id = future.result(timeout=PAYMENT_WRITE_TIMEOUT)
+    except FutureTimeoutError:
+        if future.cancel():
+            # Задача снята с очереди: платеж точно не попадет в БД
+            if participant is not None:
+                release_seat(room_id, user_id)
+        elif participant is not None:
+            # Запись уже выполняется: место привяжет или освободит ее исход,
+            # обработчик обновлений повторит update (повтор найдет записанный платеж)
+            logger.warning(f"Payment {charge_id} still being written after {PAYMENT_WRITE_TIMEOUT}s")
+            future.add_done_callback(lambda done: settle_late_payment(done, room_id, user_id))
+        raise
+    except Exception:
+        # Пачка завершилась ошибкой и откатана
+        if participant is not None:
+            release_seat(room_id, user_id)
+        raise
+    
+    get_global_stats(DB_PATH).mark_stale()
+    if participant is not None:
+        seat_paid(room_id, user_id, payment_id)
+    return room_id, payment_id
 
 def send_stars_to_user(user_id: int, amount: int) -> bool:
     """Отправить Stars пользователю (заглушка - нужна реализация через Bot API)"""
@@ -314,12 +333,40 @@ def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'ok', 'timestamp': datetime.now().isoformat()})
 
+def is_admin_request() -> bool:
+    """Запрос с верным заголовком X-Admin-Token (без ADMIN_TOKEN — никто)"""
+    token = request.headers.get('X-Admin-Token', '').encode()
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN.encode())
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Метрики процесса: очереди, задержки, счетчики платежей (только для админа, X-Admin-Token)"""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify(metrics.snapshot())
+
+@app.route('/api/stats', methods=['GET'])
+def get_global_statistics():
+    """Глобальная статистика (только для админа, заголовок X-Admin-Token)"""
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    stats = get_global_stats(DB_PATH)
+    response = jsonify(stats.snapshot())
+    # Счетчики и так обновляются не чаще max_age: столько же их можно держать в кеше клиента
+    response.headers['Cache-Control'] = f'private, max-age={int(stats.max_age)}'
+    return response
+
 @app.route('/api/user/info', methods=['POST'])
 def get_user_info():
     """Получить информацию о пользователе"""
     try:
-        data = request.json
-        init_data = data.get('initData', '')
+        # Валидация входных данных
+        schema = UserInfoSchema()
+        try:
+            init_data = schema.load(request.json)['initData']
+        except ValidationError as err:
+            return jsonify({'error': err.messages}), 400
         
         # Валидация
         user_data = validate_telegram_init_data(init_data)
@@ -330,31 +377,96 @@ def get_user_info():
         user_id = get_or_create_user(user_data)
         
         # Получаем статистику пользователя
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        # Количество игр
-        c.execute('''SELECT COUNT(*) FROM room_participants WHERE user_id = ?''', (user_id,))
-        total_games = c.fetchone()[0]
-        
-        # Количество побед
-        c.execute('''SELECT COUNT(*) FROM rooms WHERE winner_user_id = ?''', (user_id,))
-        total_wins = c.fetchone()[0]
-        
-        conn.close()
+        stats = user_stats.get_user_stats(user_id, DB_PATH)
         
         return jsonify({
             'user_id': user_id,
             'username': user_data.get('username', ''),
             'first_name': user_data.get('first_name', ''),
-            'total_games': total_games,
-            'total_wins': total_wins
+            'total_games': stats['total_games'],
+            'total_wins': stats['total_wins']
         })
     
     except Exception as e:
         logger.error(f"Error in get_user_info: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/api/user/current-room', methods=['POST'])
+def get_current_room():
+    """Получить незавершенную комнату пользователя"""
+    try:
+        data = request.json
+        init_data = data.get('initData', '')
+        
+        user_data = validate_telegram_init_data(init_data)
+        if not user_data:
+            return jsonify({'error': 'Invalid init data'}), 401
+        
+        user_id = user_data.get('id')
+        
+        room_id = room_store.active_room_of(user_id)
+        status = room_store.read(room_id, lambda room: room.status) if room_id else None
+        
+        return jsonify({
+            'room_id': room_id if status else None,
+            'status': status
+        })
+    
+    except Exception as e:
+        logger.error(f"Error in get_current_room: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/api/user/history', methods=['POST'])
+def get_user_history():
+    """
+    История игр пользователя от новых к старым
+    format=json — страница из limit записей и next_cursor; format=ndjson —
+    потоковая выгрузка всей истории (начиная с cursor), запись на строку.
+    """
+    try:
+        try:
+            params = UserHistorySchema().load(request.json)
+        except ValidationError as err:
+            return jsonify({'error': err.messages}), 400
+        
+        user_data = validate_telegram_init_data(params['initData'])
+        if not user_data:
+            return jsonify({'error': 'Invalid init data'}), 401
+        
+        user_id = user_data.get('id')
+        before_id = None
+        if params['cursor']:
+            try:
+                before_id, = decode_cursor(params['cursor'], 1)
+                if not isinstance(before_id, int):
+                    raise ValueError('Invalid cursor')
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+        
+        if params['format'] == 'ndjson':
+            return Response(_export_history(user_id, before_id, DB_PATH), mimetype='application/x-ndjson')
+        
+        rows = lottery_engine.get_user_history(user_id, before_id, params['limit'] + 1, DB_PATH)
+        cursor = next_cursor(rows, params['limit'], key=lambda row: (row[0],))
+        return jsonify({
+            'games': [game for _, game in rows],
+            'next_cursor': cursor
+        })
+    
+    except Exception as e:
+        logger.error(f"Error in get_user_history: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+def _export_history(user_id: int, before_id: Optional[int], db_path: str):
+    """NDJSON-выгрузка истории: страницы по HISTORY_EXPORT_CHUNK, без долгой read-транзакции"""
+    while True:
+        rows = lottery_engine.get_user_history(user_id, before_id, HISTORY_EXPORT_CHUNK, db_path)
+        if rows:
+            yield ''.join(json.dumps(game, ensure_ascii=False) + '\n' for _, game in rows)
+        if len(rows) < HISTORY_EXPORT_CHUNK:
+            return
+        before_id = rows[-1][0]
+
 @app.route('/api/create-invoice', methods=['POST'])
 @limiter.limit("10 per minute")
 def create_invoice():
@@ -391,171 +503,190 @@ def create_invoice():
         }
         
         # Отправляем запрос к Bot API
-        response = requests.post(
-            f'https://api.telegram.org/bot{BOT_TOKEN}/createInvoiceLink',
-            json=invoice_data
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            if result.get('ok'):
-                invoice_link = result['result']
-                return jsonify({'invoice_link': invoice_link})
-        
-        logger.error(f"Failed to create invoice: {response.text}")
-        return jsonify({'error': 'Failed to create invoice'}), 500
+        try:
+            invoice_link = get_client().create_invoice_link(invoice_data)
+        except TelegramError as e:
+            logger.error(f"Failed to create invoice: {e}")
+            return jsonify({'error': 'Failed to create invoice'}), 500
+        
+        return jsonify({'invoice_link': invoice_link})
     
     except Exception as e:
         logger.error(f"Error in create_invoice: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+def room_state(room: Room) -> Tuple[int, bytes]:
+    """Версия и готовый публичный JSON комнаты"""
+    return room.version, room.public_json()
+
+def wait_room_change(room_id: str, since: int, timeout: float) -> Optional[Tuple[int, bytes]]:
+    """
+    Дождаться версии комнаты новее since, но не дольше timeout (long-poll)
+    Возвращает текущее состояние (версия, JSON): новое или, по тайм-ауту,
+    прежнее; None — комната не найдена. Изменения приходят через тот же
+    broadcaster, что и SSE, поэтому ожидание будят и изменения других
+    процессов (ROOM_STORE=sqlite).
+    """
+    # Очередь на одно сообщение: это только сигнал перечитать комнату.
+    # Подписка до чтения: у SQLite-хранилища публикация идет не под локом
+    # read, и изменение между чтением и подпиской иначе потерялось бы.
+    # Лишний сигнал (сохраненное состояние хаба) только перечитывает версию.
+    subscription = broadcaster.subscribe(room_id, subscription=Subscription(broadcaster, room_id, 1))
+    try:
+        state = room_store.read(room_id, room_state)
+        if state is None or state[0] > since:
+            return state
+
+        room_polls_parked.inc()
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or subscription.get(remaining) == '':
+                return state
+            state = room_store.read(room_id, room_state)
+            if state is None or state[0] > since:
+                return state
+    finally:
+        subscription.close()
+
 @app.route('/api/room/<room_id>', methods=['GET'])
 def get_room_info(room_id):
-    """Получить информацию о комнате"""
+    """
+    Получить публичное состояние комнаты
+    ETag — версия комнаты: запрос с If-None-Match той же версии получает 304
+    без тела. ?since=<version> — long-poll: ответ приходит, как только версия
+    станет больше since, или 304 через ROOM_POLL_TIMEOUT секунд без изменений.
+    """
     try:
-        with rooms_lock:
-            if room_id not in rooms:
-                return jsonify({'error': 'Room not found'}), 404
-            
-            room = rooms[room_id]
-            return jsonify({
-                'room_id': room['room_id'],
-                'entry_fee': room['entry_fee'],
-                'status': room['status'],
-                'participants': room['participants'],
-                'total_pool': room['total_pool'],
-                'winner': room.get('winner'),
-                'max_participants': MAX_ROOM_SIZE
-            })
+        since = request.args.get('since', type=int)
+        if since is None:
+            # Готовый публичный JSON комнаты: без копии и повторной сериализации
+            state = room_store.read(room_id, room_state)
+        else:
+            state = wait_room_change(room_id, since, ROOM_POLL_TIMEOUT)
+        if state is None:
+            return jsonify({'error': 'Room not found'}), 404
+        
+        version, body = state
+        if (since is not None and version <= since) or request.if_none_match.contains(str(version)):
+            room_not_modified.inc()
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype='application/json')
+        response.set_etag(str(version))
+        # Кешировать можно, но каждый раз сверяясь с версией
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     
     except Exception as e:
         logger.error(f"Error in get_room_info: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+def subscribe_room(room_id: str, subscription=None):
+    """
+    Подписаться на обновления комнаты (None — комната не найдена)
+    Используется и Flask-потоком, и асинхронным stream_server.
+    """
+    # Подписка внутри read: у memory-хранилища публикация идет под тем же
+    # локом комнаты, и ни одно изменение не потеряется. У SQLite-хранилища
+    # изменения других процессов публикует поток опроса не под этим локом:
+    # изменение между чтением и подпиской клиент увидит со следующей публикацией
+    return room_store.read(room_id, lambda room: broadcaster.subscribe(
+        room_id, current=room, final=room['status'] in FINISHED_STATUSES, subscription=subscription))
+
 @app.route('/api/room/<room_id>/stream', methods=['GET'])
 def stream_room_updates(room_id):
     """Server-Sent Events для real-time обновлений комнаты"""
-    def generate():
-        last_update = None
-        while True:
-            with rooms_lock:
-                if room_id not in rooms:
-                    yield f"data: {json.dumps({'error': 'Room not found'})}\n\n"
-                    break
-                
-                room = rooms[room_id]
-                current_update = json.dumps(room, default=str)
-                
-                if current_update != last_update:
-                    yield f"data: {current_update}\n\n"
-                    last_update = current_update
-                
-                # Если комната завершена, закрываем поток
-                if room['status'] == 'completed':
-                    break
-            
-            time.sleep(1)
+    subscription = subscribe_room(room_id)
+    if subscription is None:
+        return Response(RoomBroadcaster.format_message({'error': 'Room not found'}),
+                        mimetype='text/event-stream')
     
-    return Response(generate(), mimetype='text/event-stream')
+    # Поток завершается сам после публикации состояния 'completed' или 'expired'
+    return Response(broadcaster.stream(subscription), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
-@app.route('/webhook', methods=['POST'])
-def webhook():
-    """Webhook для обработки обновлений от Telegram Bot"""
-    try:
-        update = request.json
-        logger.info(f"Received update: {json.dumps(update)}")
-        
-        # Обработка pre_checkout_query
-        if 'pre_checkout_query' in update:
-            query = update['pre_checkout_query']
-            query_id = query['id']
-            payload = json.loads(query['invoice_payload'])
-            
-            user_id = payload['user_id']
-            entry_fee = payload['entry_fee']
-            
-            # Проверяем, что пользователь не в активной комнате
-            with rooms_lock:
-                user_in_active_room = False
-                for room in rooms.values():
-                    if room['status'] != 'completed':
-                        if any(p['user_id'] == user_id for p in room['participants']):
-                            user_in_active_room = True
-                            break
-            
+def process_update(update: Dict):
+    """Обработать обновление от Telegram (в потоке update_pipeline)"""
+    # Обработка pre_checkout_query
+    if 'pre_checkout_query' in update:
+        query = update['pre_checkout_query']
+        query_id = query['id']
+        payload = json.loads(query['invoice_payload'])
+        
+        user_id = payload['user_id']
+        entry_fee = payload['entry_fee']
+        
+        # Проверяем, что пользователь не в активной комнате
+        user_in_active_room = room_store.active_room_of(user_id) is not None
+        
+        try:
             if user_in_active_room:
                 # Отклоняем платеж
-                requests.post(
-                    f'https://api.telegram.org/bot{BOT_TOKEN}/answerPreCheckoutQuery',
-                    json={
-                        'pre_checkout_query_id': query_id,
-                        'ok': False,
-                        'error_message': 'You are already in an active room. Please wait for it to complete.'
-                    }
+                get_client().answer_pre_checkout_query(
+                    query_id, False,
+                    'You are already in an active room. Please wait for it to complete.'
                 )
             else:
                 # Подтверждаем платеж
-                requests.post(
-                    f'https://api.telegram.org/bot{BOT_TOKEN}/answerPreCheckoutQuery',
-                    json={'pre_checkout_query_id': query_id, 'ok': True}
-                )
+                get_client().answer_pre_checkout_query(query_id, True)
+        except TelegramError as e:
+            logger.error(f"Failed to answer pre-checkout query {query_id}: {e}")
+    
+    # Обработка successful_payment
+    elif 'message' in update and 'successful_payment' in update['message']:
+        message = update['message']
+        payment = message['successful_payment']
+        user = message['from']
+        
+        payload = json.loads(payment['invoice_payload'])
+        user_id = payload['user_id']
+        entry_fee = payload['entry_fee']
+        charge_id = payment['telegram_payment_charge_id']
+        
+        # Платеж, комната и участник — одна транзакция; ответ пользователю после фиксации
+        user_data = {
+            'id': user_id,
+            'username': user.get('username', ''),
+            'first_name': user.get('first_name', '')
+        }
+        room_id, payment_id = ingest_payment(user_data, entry_fee, charge_id)
+        logger.info(f"Payment {payment_id} of user {user_id} committed to room {room_id}")
         
-        # Обработка successful_payment
-        elif 'message' in update and 'successful_payment' in update['message']:
-            message = update['message']
-            payment = message['successful_payment']
-            user = message['from']
-            
-            payload = json.loads(payment['invoice_payload'])
-            user_id = payload['user_id']
-            entry_fee = payload['entry_fee']
-            charge_id = payment['telegram_payment_charge_id']
-            
-            # Сохраняем платеж в БД
-            conn = sqlite3.connect(DB_PATH)
-            c = conn.cursor()
-            c.execute('''INSERT INTO payments (user_id, amount, telegram_payment_charge_id, status)
-                         VALUES (?, ?, ?, ?)''',
-                      (user_id, entry_fee, charge_id, 'completed'))
-            payment_id = c.lastrowid
-            conn.commit()
-            conn.close()
-            
-            # Находим или создаем комнату
-            room_id = find_or_create_room(entry_fee)
-            
-            # Добавляем участника в комнату
-            user_data = {
-                'id': user_id,
-                'username': user.get('username', ''),
-                'first_name': user.get('first_name', '')
-            }
-            add_participant_to_room(room_id, user_id, payment_id, user_data)
-            
-            # Обновляем payment с room_id
-            conn = sqlite3.connect(DB_PATH)
-            c = conn.cursor()
-            c.execute('UPDATE payments SET room_id = ? WHERE id = ?', (room_id, payment_id))
-            conn.commit()
-            conn.close()
-            
-            # Отправляем сообщение пользователю
-            requests.post(
-                f'https://api.telegram.org/bot{BOT_TOKEN}/sendMessage',
-                json={
-                    'chat_id': user_id,
-                    'text': f'✅ Payment successful! You joined the lottery room.\n\n'
-                            f'Entry fee: {entry_fee} ⭐\n'
-                            f'Room: {room_id[:8]}...\n'
-                            f'Waiting for other participants...'
-                }
+        # Отправляем сообщение пользователю
+        try:
+            get_client().send_message(
+                user_id,
+                f'✅ Payment successful! You joined the lottery room.\n\n'
+                f'Entry fee: {entry_fee} ⭐\n'
+                f'Room: {room_id[:8]}...\n'
+                f'Waiting for other participants...',
+                parse_mode=None
             )
-        
+        except TelegramError as e:
+            logger.error(f"Failed to send payment confirmation to {user_id}: {e}")
+
+# Обработка обновлений вне запроса: вебхук только сохраняет update и сразу отвечает
+updates = UpdatePipeline(process_update, DB_PATH)
+
+@app.route('/webhook', methods=['POST'])
+@limiter.exempt
+def webhook():
+    """Webhook для обработки обновлений от Telegram Bot"""
+    update = request.get_json(silent=True)
+    if not isinstance(update, dict):
+        # Telegram повторяет доставку при любом ответе кроме 200
+        logger.warning("Received webhook request without JSON update")
         return jsonify({'ok': True})
     
+    try:
+        updates.submit(update)
     except Exception as e:
-        logger.error(f"Error in webhook: {e}")
-        return jsonify({'ok': False, 'error': str(e)}), 500
+        # Не удалось сохранить update — пусть Telegram доставит его повторно
+        logger.error(f"Error accepting update: {e}")
+        return jsonify({'ok': False, 'error': 'Update not accepted'}), 500
+    
+    return jsonify({'ok': True})
 
 @app.route('/api/referral/link', methods=['POST'])
 @limiter.limit("20 per minute")
@@ -576,18 +707,12 @@ def get_referral_link():
         referral_link = f"https://t.me/{bot_username}?start=ref_{user_id}"
         
         # Получаем статистику рефералов
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
         # Количество приглашенных
-        c.execute('SELECT COUNT(*) FROM referrals WHERE referrer_user_id = ?', (user_id,))
-        total_referrals = c.fetchone()[0]
+        total_referrals = user_stats.get_user_stats(user_id, DB_PATH)['total_referrals']
         
         # Общая сумма бонусов
-        c.execute('SELECT COALESCE(SUM(bonus_amount), 0) FROM referral_bonuses WHERE referrer_user_id = ?', (user_id,))
-        total_bonuses = c.fetchone()[0]
-        
-        conn.close()
+        total_bonuses = db.fetch_value('SELECT COALESCE(SUM(bonus_amount), 0) FROM referral_bonuses WHERE referrer_user_id = ?',
+                                       (user_id,), DB_PATH)
         
         return jsonify({
             'referral_link': referral_link,
@@ -617,27 +742,19 @@ def register_referral():
         if not referrer_id or user_id == referrer_id:
             return jsonify({'error': 'Invalid referrer'}), 400
         
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        # Проверяем, что пользователь еще не был приглашен
-        c.execute('SELECT id FROM referrals WHERE referred_user_id = ?', (user_id,))
-        if c.fetchone():
-            conn.close()
-            return jsonify({'error': 'User already referred'}), 400
-        
-        # Проверяем существование реферера
-        c.execute('SELECT user_id FROM users WHERE user_id = ?', (referrer_id,))
-        if not c.fetchone():
-            conn.close()
-            return jsonify({'error': 'Referrer not found'}), 404
-        
-        # Регистрируем реферала
-        c.execute('''INSERT INTO referrals (referrer_user_id, referred_user_id)
-                     VALUES (?, ?)''', (referrer_id, user_id))
-        
-        conn.commit()
-        conn.close()
+        with db.transaction(DB_PATH) as c:
+            # Проверяем, что пользователь еще не был приглашен
+            if c.execute('SELECT id FROM referrals WHERE referred_user_id = ?', (user_id,)).fetchone():
+                return jsonify({'error': 'User already referred'}), 400
+            
+            # Проверяем существование реферера
+            if not c.execute('SELECT user_id FROM users WHERE user_id = ?', (referrer_id,)).fetchone():
+                return jsonify({'error': 'Referrer not found'}), 404
+            
+            # Регистрируем реферала
+            c.execute('''INSERT INTO referrals (referrer_user_id, referred_user_id)
+                         VALUES (?, ?)''', (referrer_id, user_id))
+            user_stats.record_referral(c, referrer_id)
         
         logger.info(f"User {user_id} registered as referral of {referrer_id}")
         
@@ -653,69 +770,68 @@ def register_referral():
 @app.route('/api/referral/stats', methods=['POST'])
 @limiter.limit("30 per minute")
 def get_referral_stats():
-    """Получить детальную статистику по рефералам"""
+    """Получить детальную статистику по рефералам (страницами)"""
     try:
-        data = request.json
-        init_data = data.get('initData', '')
+        try:
+            params = ReferralStatsSchema().load(request.json)
+        except ValidationError as err:
+            return jsonify({'error': err.messages}), 400
         
-        user_data = validate_telegram_init_data(init_data)
+        user_data = validate_telegram_init_data(params['initData'])
         if not user_data:
             return jsonify({'error': 'Invalid init data'}), 401
         
         user_id = user_data.get('id')
         
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        # Список рефералов с их активностью
-        c.execute('''
-            SELECT 
-                u.user_id,
-                u.first_name,
-                u.username,
-                r.created_at,
-                COUNT(rp.id) as games_played,
-                COALESCE(SUM(CASE WHEN ro.winner_user_id = u.user_id THEN 1 ELSE 0 END), 0) as wins
+        # Страница рефералов: от новых к старым, следующая — по курсору (created_at, id)
+        page_filter, page_args = '', ()
+        if params['cursor']:
+            try:
+                page_args = tuple(decode_cursor(params['cursor'], 2))
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            page_filter = 'AND (r.created_at, r.id) < (?, ?)'
+        
+        # Активность (games_played, wins) хранится в строке реферала и обновляется при розыгрыше
+        rows = db.fetch_all(f'''
+            SELECT r.id, u.user_id, u.first_name, u.username, r.created_at, r.games_played, r.wins
             FROM referrals r
             JOIN users u ON r.referred_user_id = u.user_id
-            LEFT JOIN room_participants rp ON u.user_id = rp.user_id
-            LEFT JOIN rooms ro ON rp.room_id = ro.room_id
-            WHERE r.referrer_user_id = ?
-            GROUP BY u.user_id, u.first_name, u.username, r.created_at
-            ORDER BY r.created_at DESC
-            LIMIT 50
-        ''', (user_id,))
+            WHERE r.referrer_user_id = ? {page_filter}
+            ORDER BY r.created_at DESC, r.id DESC
+            LIMIT ?
+        ''', (user_id, *page_args, params['limit'] + 1), DB_PATH)
+        cursor = next_cursor(rows, params['limit'], key=lambda row: (row[4], row[0]))
         
         referrals = []
-        for row in c.fetchall():
+        for row in rows:
             referrals.append({
-                'user_id': row[0],
-                'first_name': row[1],
-                'username': row[2],
-                'joined_at': row[3],
-                'games_played': row[4],
-                'wins': row[5]
+                'user_id': row[1],
+                'first_name': row[2],
+                'username': row[3],
+                'joined_at': row[4],
+                'games_played': row[5],
+                'wins': row[6]
             })
         
         # Общая статистика бонусов
-        c.execute('''
+        rows = db.fetch_all('''
             SELECT bonus_type, SUM(bonus_amount), COUNT(*)
             FROM referral_bonuses
             WHERE referrer_user_id = ?
             GROUP BY bonus_type
-        ''', (user_id,))
+        ''', (user_id,), DB_PATH)
         
         bonuses_by_type = {}
-        for row in c.fetchall():
+        for row in rows:
             bonuses_by_type[row[0]] = {
                 'total_amount': row[1],
                 'count': row[2]
             }
         
-        conn.close()
-        
         return jsonify({
             'referrals': referrals,
+            'next_cursor': cursor,
             'bonuses_by_type': bonuses_by_type
         })
     
@@ -730,23 +846,52 @@ def setup_webhook():
         return
     
     webhook_url = f"{WEBHOOK_URL}/webhook"
-    response = requests.post(
-        f'https://api.telegram.org/bot{BOT_TOKEN}/setWebhook',
-        json={'url': webhook_url}
-    )
-    
-    if response.status_code == 200:
+    try:
+        get_client().set_webhook(webhook_url)
         logger.info(f"Webhook set successfully: {webhook_url}")
-    else:
-        logger.error(f"Failed to set webhook: {response.text}")
+    except TelegramError as e:
+        logger.error(f"Failed to set webhook: {e}")
+
+_worker_lock = Lock()
+_worker_started = False
+stream_server = None  # Асинхронный сервер SSE-потоков процесса (STREAM_PORT)
+
+def start_worker():
+    """
+    Фоновые потоки процесса; один раз на процесс — из __main__ или из
+    post_worker_init каждого воркера gunicorn (gunicorn.conf.py): потоки
+    не переживают fork.
+    """
+    global _worker_started, stream_server
+    with _worker_lock:
+        if _worker_started:
+            return
+        _worker_started = True
+        
+        # Комнаты до перезапуска (drawing разыграет первый проход планировщика),
+        # изменения комнат из других воркеров (ROOM_STORE=sqlite), планировщик розыгрышей
+        # и сроки комнат (возвраты, не отправленные до перезапуска, уходят сразу)
+        room_store.restore(find_payment)
+        room_store.start()
+        scheduler.start()
+        room_expiry.start()
+        
+        # Обработчики обновлений вебхука (дообрабатывают сохраненные до перезапуска);
+        # после restore: повтор платежа должен найти свое место свободным
+        updates.start()
+        
+        # Асинхронный сервер SSE-потоков: тысячи ожидающих игроков без потоков воркера.
+        # Воркеры gunicorn слушают один порт (SO_REUSEPORT), соединения распределяет ядро
+        stream_port = os.environ.get('STREAM_PORT')
+        if stream_port:
+            from stream_server import start_stream_server
+            stream_server = start_stream_server(broadcaster, subscribe_room, port=int(stream_port),
+                                                reuse_port=True)
 
 if __name__ == '__main__':
     init_db()
     setup_webhook()
-    
-    # Запускаем планировщик розыгрышей
-    from scheduler import start_scheduler
-    scheduler = start_scheduler(rooms, rooms_lock, DB_PATH)
+    start_worker()
     
     # Запускаем бота (если нужен polling mode)
     # from bot import start_bot_polling
@@ -0,0 +1,98 @@
+"""
+Микробенчмарк проверки initData (validate_telegram_init_data)
+
+    legacy — прежняя реализация: ключ WebAppData, разбор, сортировка и HMAC на каждый вызов
+    cold   — новая реализация без попаданий в кеш (каждый раз новая initData)
+    warm   — повторная initData той же сессии (попадание в кеш)
+
+Запуск:
+    python benchmarks/bench_auth.py --calls 50000
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import hashlib
+import logging
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app as app_module
+
+logging.disable(logging.CRITICAL)
+
+BOT_TOKEN = '123456:BENCH'
+
+
+def legacy_validate(init_data: str):
+    """Реализация до кеширования (для сравнения)"""
+    params = {}
+    for item in init_data.split('&'):
+        key, value = item.split('=', 1)
+        params[key] = value
+    received_hash = params.pop('hash', None)
+    if not received_hash:
+        return None
+    auth_date = int(params.get('auth_date', 0))
+    if time.time() - auth_date > 3600:
+        return None
+    data_check_string = '\n'.join(f"{k}={v}" for k, v in sorted(params.items()))
+    secret_key = hmac.new("WebAppData".encode(), BOT_TOKEN.encode(), hashlib.sha256).digest()
+    calculated_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    if calculated_hash != received_hash:
+        return None
+    return json.loads(params.get('user', '{}'))
+
+
+def make_init_data(user_id: int) -> str:
+    """Подписанная initData, похожая на настоящую (user, chat_instance, query_id...)"""
+    params = {
+        'auth_date': str(int(time.time())),
+        'chat_instance': '-4211953431837312345',
+        'chat_type': 'private',
+        'query_id': f'AAH{user_id:012d}Q',
+        'user': json.dumps({'id': user_id, 'first_name': 'Bench', 'last_name': 'User',
+                            'username': f'bench{user_id}', 'language_code': 'ru',
+                            'allows_write_to_pm': True}),
+    }
+    data_check_string = '\n'.join(f"{k}={v}" for k, v in sorted(params.items()))
+    secret_key = hmac.new(b'WebAppData', BOT_TOKEN.encode(), hashlib.sha256).digest()
+    params['hash'] = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return '&'.join(f"{k}={v}" for k, v in params.items())
+
+
+def measure(validate, samples) -> float:
+    """Среднее время вызова в микросекундах"""
+    started = time.perf_counter()
+    for init_data in samples:
+        assert validate(init_data) is not None
+    return (time.perf_counter() - started) / len(samples) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=20000)
+    args = parser.parse_args()
+
+    app_module.BOT_TOKEN = BOT_TOKEN
+    unique = [make_init_data(i) for i in range(args.calls)]
+    session = [unique[0]] * args.calls
+
+    app_module.verified_init_data.maxsize = args.calls
+    legacy_us = measure(legacy_validate, unique)
+    cold_us = measure(app_module.validate_telegram_init_data, unique)
+    app_module.verified_init_data.clear()
+    warm_us = measure(app_module.validate_telegram_init_data, session)
+
+    print(json.dumps({
+        'calls': args.calls,
+        'legacy_us': round(legacy_us, 2),
+        'cold_us': round(cold_us, 2),
+        'warm_us': round(warm_us, 2),
+    }))
+
+
+if __name__ == '__main__':
+    main()
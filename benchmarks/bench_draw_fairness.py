@@ -0,0 +1,78 @@
+"""
+Бенчмарк и проверка честности розыгрышей
+
+Проходы (draw_simulation.py):
+
+    draws         — --draws розыгрышей на каждую пару (ставка, размер комнаты)
+                    через lottery_engine.pick_winner: хи-квадрат по местам
+    engine        — --engine-rooms комнат на пару через conduct_lottery с записью
+                    в in-memory БД и сверкой строк ledger с точными долями пулов
+    pools         — split_pool для каждого пула от 1 до --pool-sweep: доли
+                    совпадают с точными floor(пул * 0.8) и ceil(пул * 0.2)
+    rng-baseline  — только генератор (numpy или random.Random), без движка:
+                    точка сравнения для скорости; на код выхода не влияет
+
+Печатает JSON по проходу (draws_per_sec, p-value по размерам) и завершается
+с кодом 1, если p-value движка ниже --alpha или выплаты не сошлись.
+
+Запуск:
+    python benchmarks/bench_draw_fairness.py --draws 1000000 --engine-rooms 2000
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import ENTRY_FEES, MAX_ROOM_SIZE
+from draw_simulation import reconcile_pools, rng_baseline, simulate_draws, simulate_engine
+
+logging.disable(logging.CRITICAL)
+
+
+def summary(name: str, report: dict) -> dict:
+    """Строка отчета: p-value вместо счетчиков мест"""
+    result = {'pass': name}
+    result.update({key: value for key, value in report.items() if key != 'seats'})
+    result['p_values'] = {size: round(seat['p_value'], 4) for size, seat in report['seats'].items()}
+    if 'mismatches' in report:
+        result['mismatches'] = len(report['mismatches'])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--draws', type=int, default=1000000, help='Розыгрышей на пару (ставка, размер)')
+    parser.add_argument('--engine-rooms', type=int, default=2000, help='Комнат conduct_lottery на пару')
+    parser.add_argument('--pool-sweep', type=int, default=1000000)
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(range(2, MAX_ROOM_SIZE + 1)))
+    parser.add_argument('--fees', type=int, nargs='+', default=ENTRY_FEES)
+    parser.add_argument('--alpha', type=float, default=1e-4)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    failed = False
+    random.seed(args.seed)
+    for name, report in (('draws', simulate_draws(args.draws, args.sizes, args.fees)),
+                         ('engine', simulate_engine(args.engine_rooms, args.sizes, args.fees))):
+        result = summary(name, report)
+        print(json.dumps(result), flush=True)
+        failed |= min(result['p_values'].values()) < args.alpha or bool(report['mismatches'])
+
+    started = time.perf_counter()
+    mismatches = reconcile_pools(range(1, args.pool_sweep + 1))
+    print(json.dumps({'pass': 'pools', 'pools': args.pool_sweep, 'mismatches': mismatches[:10],
+                      'seconds': round(time.perf_counter() - started, 3)}), flush=True)
+    failed |= bool(mismatches)
+
+    print(json.dumps(summary('rng-baseline', rng_baseline(args.draws * len(args.fees), args.sizes, args.seed))),
+          flush=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Бенчмарк записи платежей: транзакция на платеж против групповой фиксации
+
+Каждый платеж — та же единица работы, что и ingest_payment(): INSERT в
+payments, rooms (OR IGNORE), room_participants и UPDATE пула комнаты.
+Все режимы пишут с synchronous=FULL (платеж переживает отключение питания).
+
+    per_payment — каждый поток сам делает BEGIN IMMEDIATE ... COMMIT
+    window=X    — GroupCommitWriter с окном сбора пачки X секунд
+
+Запуск:
+    python benchmarks/bench_group_commit.py --payments 3000 --threads 32 --windows 0 0.001 0.002 0.005 0.01
+"""
+import os
+import sys
+import time
+import json
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+from itertools import count
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+import metrics
+from group_commit import GroupCommitWriter
+
+logging.disable(logging.CRITICAL)
+
+
+def _payment_job(n: int):
+    room_id = f'room_{n // 6}'
+
+    def write(conn):
+        cursor = conn.execute('''INSERT INTO payments (user_id, amount, telegram_payment_charge_id, status, room_id)
+                                 VALUES (?, ?, ?, ?, ?)''', (n, 100, f'charge_{n}', 'completed', room_id))
+        conn.execute('''INSERT OR IGNORE INTO rooms (room_id, entry_fee, status, total_pool)
+                        VALUES (?, ?, ?, 0)''', (room_id, 100, 'waiting'))
+        conn.execute('INSERT INTO room_participants (room_id, user_id, payment_id) VALUES (?, ?, ?)',
+                     (room_id, n, cursor.lastrowid))
+        conn.execute('UPDATE rooms SET total_pool = total_pool + ? WHERE room_id = ?', (100, room_id))
+        return cursor.lastrowid
+
+    return write
+
+
+def run(mode: str, window: float, payments: int, threads: int, workdir: str) -> dict:
+    db_path = os.path.join(workdir, f'{mode}_{window}.db')
+    db.configure(synchronous='FULL')
+    db.migrate(db_path)
+    writer = GroupCommitWriter(db_path, batch_window=window).start() if mode == 'group' else None
+
+    def commit_directly(job):
+        with db.transaction(db_path) as conn:
+            return job(conn)
+
+    ids = count(1)
+    ids_lock = threading.Lock()
+    latency = metrics.LatencyStats(window=payments)
+
+    def worker():
+        while True:
+            with ids_lock:
+                n = next(ids)
+            if n > payments:
+                return
+            with latency.time():
+                if writer is not None:
+                    writer.submit(_payment_job(n)).result()
+                else:
+                    commit_directly(_payment_job(n))
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+    if writer is not None:
+        writer.stop()
+    db.close_all()
+
+    stats = latency.snapshot()
+    return {
+        'mode': 'per_payment' if writer is None else f'window={window}',
+        'payments': payments,
+        'threads': threads,
+        'payments_per_sec': round(payments / elapsed, 1),
+        'p50_ms': round(stats['p50'] * 1000, 2),
+        'p99_ms': round(stats['p99'] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--payments', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--windows', type=float, nargs='+', default=[0, 0.001, 0.002, 0.005, 0.01])
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_group_commit_')
+    settings = db.get_settings()
+    try:
+        print(json.dumps(run('per_payment', 0, args.payments, args.threads, workdir)))
+        for window in args.windows:
+            print(json.dumps(run('group', window, args.payments, args.threads, workdir)))
+    finally:
+        db.configure(synchronous=settings['synchronous'])
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
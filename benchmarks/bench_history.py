@@ -0,0 +1,78 @@
+"""
+Бенчмарк страницы истории игр (lottery_engine.get_user_history)
+
+Для пользователей с разной длиной истории измеряется время первой
+страницы и страницы из середины истории (по курсору). Keyset-пагинация
+должна давать одинаковое время независимо от числа игр.
+
+Запуск:
+    python benchmarks/bench_history.py --games 10 1000 100000 --page 50
+"""
+import os
+import sys
+import json
+import shutil
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+import metrics
+from lottery_engine import get_user_history
+
+logging.disable(logging.CRITICAL)
+
+
+def populate(db_path: str, user_id: int, games: int) -> None:
+    """Пользователь user_id сыграл games комнат, выиграл каждую третью"""
+    with db.transaction(db_path) as conn:
+        conn.executemany("INSERT INTO rooms (room_id, entry_fee, status, total_pool, winner_user_id) "
+                         "VALUES (?, 100, 'completed', 600, ?)",
+                         [(f'{user_id}_{n}', user_id if n % 3 == 0 else None) for n in range(games)])
+        conn.executemany('INSERT INTO room_participants (room_id, user_id) VALUES (?, ?)',
+                         [(f'{user_id}_{n}', user_id) for n in range(games)])
+        conn.executemany("INSERT INTO transactions (room_id, to_user_id, amount, transaction_type) "
+                         "VALUES (?, ?, 480, 'winner_payout')",
+                         [(f'{user_id}_{n}', user_id) for n in range(0, games, 3)])
+
+
+def measure(db_path: str, user_id: int, before_id, page: int, repeats: int) -> float:
+    """Медиана времени страницы в миллисекундах"""
+    latency = metrics.LatencyStats(window=repeats)
+    for _ in range(repeats):
+        with latency.time():
+            get_user_history(user_id, before_id, page, db_path)
+    return latency.snapshot()['p50'] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--games', type=int, nargs='+', default=[10, 1000, 100000])
+    parser.add_argument('--page', type=int, default=50)
+    parser.add_argument('--repeats', type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_history_')
+    db_path = os.path.join(workdir, 'history.db')
+    try:
+        db.migrate(db_path)
+        for user_id, games in enumerate(args.games, start=1):
+            populate(db_path, user_id, games)
+        db.execute('ANALYZE', db_path=db_path)
+
+        for user_id, games in enumerate(args.games, start=1):
+            middle = get_user_history(user_id, None, games // 2 + 1, db_path)[-1][0]
+            print(json.dumps({
+                'games': games,
+                'first_page_ms': round(measure(db_path, user_id, None, args.page, args.repeats), 3),
+                'middle_page_ms': round(measure(db_path, user_id, middle, args.page, args.repeats), 3),
+            }))
+    finally:
+        db.close_all()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Бенчмарк подбора комнаты (find_or_create_room) при большой истории комнат
+
+Заполняет память завершенными комнатами и сравнивает прежний линейный
+проход по словарю rooms с поиском через RoomIndex.
+
+Запуск:
+    python benchmarks/bench_matchmaking.py --history 0 1000 100000
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app as app_module
+import db
+from room_model import Participant, Room
+
+logging.disable(logging.CRITICAL)
+
+
+def legacy_find(entry_fee: int):
+    """Прежняя реализация: линейный проход по всем комнатам под локом"""
+    store = app_module.room_store
+    with store.registry_lock:
+        for room_id, room in store.rooms.items():
+            if (room['entry_fee'] == entry_fee and
+                    room['status'] == 'waiting' and
+                    len(room['participants']) < app_module.MAX_ROOM_SIZE):
+                return room_id
+    return None
+
+
+def populate(history: int) -> None:
+    """Завершенные комнаты в памяти плюс по одной открытой на каждую ставку"""
+    store = app_module.room_store
+    store.rooms.clear()
+    for i in range(history):
+        room_id = f'done_{i}'
+        store.rooms[room_id] = Room(room_id, app_module.ENTRY_FEES[i % len(app_module.ENTRY_FEES)],
+                                    app_module.MAX_ROOM_SIZE, 'completed',
+                                    [Participant(i * 6 + k) for k in range(app_module.MAX_ROOM_SIZE)])
+    store.index.rebuild(store.rooms.values())
+    for fee in app_module.ENTRY_FEES:
+        app_module.find_or_create_room(fee)
+
+
+def measure(find, calls: int) -> float:
+    """Среднее время вызова в микросекундах"""
+    fees = app_module.ENTRY_FEES
+    started = time.perf_counter()
+    for i in range(calls):
+        assert find(fees[i % len(fees)]) is not None
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--history', type=int, nargs='+', default=[0, 1000, 100000])
+    parser.add_argument('--calls', type=int, default=2000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_matchmaking_')
+    app_module.DB_PATH = os.path.join(workdir, 'lottery.db')
+    try:
+        for history in args.history:
+            populate(history)
+            # Открытые комнаты добавлены последними — худший случай для линейного прохода
+            print(json.dumps({
+                'history_rooms': history,
+                'legacy_scan_us': round(measure(legacy_find, args.calls), 2),
+                'indexed_us': round(measure(app_module.find_or_create_room, args.calls), 2),
+            }))
+    finally:
+        db.close_all()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
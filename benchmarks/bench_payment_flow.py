@@ -0,0 +1,159 @@
+"""
+Офлайн-бенчмарк полного цикла оплаты и уведомлений
+
+Все вызовы Bot API уходят в локальную заглушку FakeBotApi с заданной
+задержкой ответа: pre_checkout_query -> successful_payment -> заполнение
+комнаты -> розыгрыш -> уведомления участникам через NotificationDispatcher.
+
+Режимы клиента:
+    keepalive — общий пул соединений TelegramClient
+    close     — новое соединение на каждый вызов (как было с requests.post)
+
+Запуск:
+    python benchmarks/bench_payment_flow.py --payments 600 --threads 8 --latency 0.02
+"""
+import os
+import sys
+import time
+import json
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+from itertools import count
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app as app_module
+import bot
+import db
+import metrics
+import notifier
+import telegram_client
+from fake_bot_api import FakeBotApi
+from room_store import MemoryRoomStore
+from scheduler import LotteryScheduler
+from update_pipeline import UpdatePipeline
+
+logging.disable(logging.CRITICAL)
+
+
+def _pre_checkout_update(update_id: int, user_id: int, entry_fee: int) -> dict:
+    return {
+        'update_id': update_id,
+        'pre_checkout_query': {
+            'id': f'query_{update_id}',
+            'from': {'id': user_id, 'first_name': f'User{user_id}'},
+            'invoice_payload': json.dumps({'user_id': user_id, 'entry_fee': entry_fee}),
+        },
+    }
+
+
+def _payment_update(update_id: int, user_id: int, entry_fee: int) -> dict:
+    return {
+        'update_id': update_id,
+        'message': {
+            'from': {'id': user_id, 'first_name': f'User{user_id}'},
+            'successful_payment': {
+                'invoice_payload': json.dumps({'user_id': user_id, 'entry_fee': entry_fee}),
+                'telegram_payment_charge_id': f'charge_{update_id}',
+            },
+        },
+    }
+
+
+def run(mode: str, payments: int, threads: int, latency: float, workdir: str) -> dict:
+    """Провести payments оплат через webhook и дождаться всех уведомлений"""
+    api = FakeBotApi(latency=latency).start()
+    client = telegram_client.TelegramClient('BENCH', api.url)
+    if mode == 'close':
+        client.session.headers['Connection'] = 'close'
+    telegram_client.set_client(client)
+
+    # Без лимитов Telegram: меряем собственные накладные расходы
+    dispatcher = notifier.NotificationDispatcher(lambda payload: client.call('sendMessage', payload),
+                                                 global_rate=100000, per_chat_interval=0)
+    bot._dispatcher = dispatcher.start()
+
+    app_module.DB_PATH = os.path.join(workdir, f'{mode}.db')
+    app_module.init_db()
+    app_module.room_store = MemoryRoomStore(app_module.MAX_ROOM_SIZE, on_change=app_module.room_changed)
+    scheduler = LotteryScheduler(app_module.room_store, app_module.DB_PATH, safety_scan_interval=60)
+    scheduler.start()
+    app_module.scheduler = scheduler
+    app_module.updates = UpdatePipeline(app_module.process_update, app_module.DB_PATH).start()
+
+    web = app_module.app.test_client()
+    ids = count(1)
+    ids_lock = threading.Lock()
+    webhook_latency = metrics.LatencyStats(window=payments * 2)
+    delivered_before = notifier.delivery_latency.count
+
+    def worker():
+        while True:
+            with ids_lock:
+                n = next(ids)
+            if n > payments:
+                return
+            fee = app_module.ENTRY_FEES[0]
+            for update in (_pre_checkout_update(n * 2, n, fee), _payment_update(n * 2 + 1, n, fee)):
+                with webhook_latency.time():
+                    web.post('/webhook', json=update)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    app_module.updates.join()
+    webhook_seconds = time.perf_counter() - started
+
+    # Каждый участник заполненной комнаты получает одно уведомление
+    expected = payments - payments % app_module.MAX_ROOM_SIZE
+    deadline = time.monotonic() + 60
+    while notifier.delivery_latency.count - delivered_before < expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    total_seconds = time.perf_counter() - started
+
+    app_module.updates.stop()
+    scheduler.stop()
+    dispatcher.stop()
+    api.stop()
+    client.close()
+    db.close_all()
+
+    return {
+        'mode': mode,
+        'payments': payments,
+        'threads': threads,
+        'api_latency': latency,
+        'payments_per_sec': round(payments / webhook_seconds, 1),
+        'webhook_ack_p50_ms': round(webhook_latency.percentile(0.5) * 1000, 2),
+        'webhook_ack_p99_ms': round(webhook_latency.percentile(0.99) * 1000, 2),
+        'notifications': notifier.delivery_latency.count - delivered_before,
+        'all_notified_seconds': round(total_seconds, 3),
+        'api_calls': len(api.calls),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--payments', type=int, default=600)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.02, help='Задержка ответа заглушки Bot API, секунд')
+    parser.add_argument('--modes', nargs='+', default=['close', 'keepalive'], choices=['close', 'keepalive'])
+    args = parser.parse_args()
+
+    app_module.limiter.enabled = False
+    workdir = tempfile.mkdtemp(prefix='bench_payment_flow_')
+    try:
+        for mode in args.modes:
+            print(json.dumps(run(mode, args.payments, args.threads, args.latency, workdir)))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Бенчмарк восстановления комнат после перезапуска (MemoryRoomStore.restore)
+
+В базе лежит history завершенных комнат, в памяти — active незавершенных:
+часть попала в снимок, остальные только в журнал. Измеряется время
+restore() нового хранилища и, для сравнения, время сборки тех же комнат
+из таблиц (rooms + room_participants + users). Восстановление из снимка
+и журнала не должно зависеть от размера истории.
+
+Запуск:
+    python benchmarks/bench_restart.py --history 1000 1000000 --active 2000
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+from room_journal import RoomJournal
+from room_model import Participant
+from room_store import MemoryRoomStore
+
+logging.disable(logging.CRITICAL)
+
+FEES = (50, 100, 250, 500)
+
+
+def populate_history(db_path: str, rooms: int) -> None:
+    """Завершенные комнаты по одному участнику"""
+    batch = 100000
+    for start in range(0, rooms, batch):
+        ids = range(start, min(start + batch, rooms))
+        with db.transaction(db_path) as conn:
+            conn.executemany("INSERT INTO rooms (room_id, entry_fee, status, total_pool) VALUES (?, 50, 'completed', 300)",
+                             [(f'old_{n}',) for n in ids])
+            conn.executemany('INSERT INTO room_participants (room_id, user_id, payment_id) VALUES (?, ?, ?)',
+                             [(f'old_{n}', n, n) for n in ids])
+
+
+def populate_active(db_path: str, journal_path: str, players: int) -> None:
+    """players мест в открытых комнатах: половина до снимка, половина только в журнале"""
+    store = MemoryRoomStore(journal=RoomJournal(journal_path))
+    store.restore(lambda room_id, user_id: None)
+    with db.transaction(db_path) as conn:
+        for n in range(players):
+            user_id = 10_000_000 + n
+            room, _ = store.join(FEES[n % len(FEES)], Participant(user_id, '', 'Bench'))
+            conn.execute("INSERT OR IGNORE INTO rooms (room_id, entry_fee, status, total_pool) VALUES (?, ?, 'waiting', 0)",
+                         (room['room_id'], room['entry_fee']))
+            payment_id = conn.execute('INSERT INTO room_participants (room_id, user_id, payment_id) VALUES (?, ?, ?)',
+                                      (room['room_id'], user_id, n)).lastrowid
+            # Каждый десятый платеж «не успел» попасть в журнал — restore сверит его с базой
+            if n % 10:
+                store.mark_paid(room['room_id'], user_id, payment_id)
+            if n == players // 2:
+                store.checkpoint()
+    store.journal.close()
+
+
+def rebuild_from_tables(db_path: str) -> int:
+    """Для сравнения: собрать незавершенные комнаты из таблиц"""
+    rows = db.fetch_all('''SELECT r.room_id, r.entry_fee, r.status, rp.user_id, u.first_name, rp.payment_id
+                           FROM rooms r
+                           JOIN room_participants rp ON rp.room_id = r.room_id
+                           LEFT JOIN users u ON u.user_id = rp.user_id
+                           WHERE r.status != 'completed' ''', db_path=db_path)
+    return len({row[0] for row in rows})
+
+
+def find_payment(db_path: str):
+    def find(room_id: str, user_id: int):
+        return db.fetch_value('SELECT payment_id FROM room_participants WHERE user_id = ? AND room_id = ?',
+                              (user_id, room_id), db_path)
+    return find
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--history', type=int, nargs='+', default=[1000, 1000000])
+    parser.add_argument('--active', type=int, default=2000, help='Занятых мест в незавершенных комнатах')
+    args = parser.parse_args()
+
+    for history in args.history:
+        workdir = tempfile.mkdtemp(prefix='bench_restart_')
+        db_path = os.path.join(workdir, 'lottery.db')
+        journal_path = os.path.join(workdir, 'rooms')
+        try:
+            db.migrate(db_path)
+            populate_history(db_path, history)
+            populate_active(db_path, journal_path, args.active)
+            db.execute('ANALYZE', db_path=db_path)
+            journal_bytes = sum(os.path.getsize(os.path.join(workdir, name))
+                                for name in os.listdir(workdir) if name.startswith('rooms.'))
+
+            started = time.perf_counter()
+            restored = MemoryRoomStore(journal=RoomJournal(journal_path)).restore(find_payment(db_path))
+            restore_ms = (time.perf_counter() - started) * 1000
+
+            started = time.perf_counter()
+            rebuilt = rebuild_from_tables(db_path)
+            tables_ms = (time.perf_counter() - started) * 1000
+
+            print(json.dumps({
+                'history_rooms': history,
+                'active_rooms': restored,
+                'snapshot_and_journal_kb': round(journal_bytes / 1024),
+                'restore_ms': round(restore_ms, 1),
+                'rebuild_from_tables_ms': round(tables_ms, 1),
+                'rebuilt_rooms': rebuilt,
+            }))
+        finally:
+            db.close_all()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
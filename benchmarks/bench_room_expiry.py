@@ -0,0 +1,106 @@
+"""
+Бенчмарк истечения комнат: куча сроков против прохода по всем комнатам
+
+В хранилище --rooms комнат, из них у --due срок уже наступил (завершенные
+комнаты после grace). Сравниваются:
+
+    scan  — прежний cleanup_old_rooms: чтение каждой комнаты и проверка возраста
+    heap  — RoomExpiry.run_due: извлечение из кучи только наступивших сроков
+
+Для heap отдельно показана постановка сроков всех комнат при старте
+(track_all, один раз после restore) и track() на изменение комнаты.
+
+Запуск:
+    python benchmarks/bench_room_expiry.py --rooms 10000 100000 1000000 --due 100
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+from room_expiry import RoomExpiry
+from room_model import FINISHED_STATUSES, Room
+from room_store import MAX_ROOM_SIZE, MemoryRoomStore
+
+logging.disable(logging.CRITICAL)
+
+GRACE = 300
+MAX_AGE = 3600
+
+
+def build_store(rooms: int, due: int, now: float) -> MemoryRoomStore:
+    """Ждущие комнаты со свежим created_at и due завершенных, чей grace истек"""
+    data = {}
+    for n in range(rooms):
+        room = Room(f'{n:022d}', 100, MAX_ROOM_SIZE, created_at=now)
+        if n < due:
+            room.status, room.completed_at = 'completed', now - GRACE - 1
+        data[room.room_id] = room
+    return MemoryRoomStore(rooms=data)
+
+
+def scan(store: MemoryRoomStore, now: float) -> int:
+    """Прежний путь: прочитать каждую комнату"""
+    expired = 0
+    for room_id in store.room_ids():
+        finished_at = store.read(room_id, lambda room: room.completed_at if room.status in FINISHED_STATUSES
+                                 else room.created_at + MAX_AGE - GRACE)
+        if finished_at + GRACE <= now:
+            store.remove(room_id)
+            expired += 1
+    return expired
+
+
+def run(rooms: int, due: int, db_path: str) -> dict:
+    now = time.time()
+    result = {'rooms': rooms, 'due': due}
+
+    store = build_store(rooms, due, now)
+    started = time.perf_counter()
+    assert scan(store, now) == due
+    result['scan_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    store = build_store(rooms, due, now)
+    expiry = RoomExpiry(store, db_path, completed_grace=GRACE, waiting_max_age=MAX_AGE)
+    started = time.perf_counter()
+    expiry.track_all()
+    result['track_all_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    started = time.perf_counter()
+    assert expiry.run_due(now) == due
+    result['heap_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+    sample = [store.rooms[room_id] for room_id in list(store.rooms)[:10000]]
+    started = time.perf_counter()
+    for room in sample:
+        expiry.track(room)
+    result['track_us'] = round((time.perf_counter() - started) / len(sample) * 1e6, 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rooms', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--due', type=int, default=100)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_room_expiry_')
+    db_path = os.path.join(workdir, 'lottery.db')
+    db.migrate(db_path)
+    try:
+        for rooms in args.rooms:
+            print(json.dumps(run(rooms, min(args.due, rooms), db_path)), flush=True)
+    finally:
+        db.close_all()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Бенчмарк конкуренции за локи комнат (MemoryRoomStore)
+
+Потоки параллельно заполняют много комнат полным циклом: занять место,
+отметить платеж, разыграть заполненную комнату; между операциями —
+чтение состояния комнаты, как при подписке SSE. Изменения пишутся в
+журнал, а on_change строит публичный JSON, как RoomBroadcaster, и, если
+задано --blocking-us, еще ждет столько микросекунд с отпущенным GIL
+(медленный диск журнала, запись в сокет подписчика).
+Сравниваются одна полоса (все комнаты под одним локом, как прежний
+rooms_lock) и striping по room_id. Без блокирующей работы под локом
+выигрыша нет — все упирается в GIL; striping окупается, когда
+критическая секция ждет ввода-вывода.
+
+Запуск:
+    python benchmarks/bench_room_locks.py --threads 16 --players 20000 --stripes 1 64 --blocking-us 0 200
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+from itertools import count
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from locks import summarize
+from lottery_engine import draw_winner
+from room_journal import RoomJournal
+from room_model import Participant
+from room_store import MemoryRoomStore
+
+logging.disable(logging.CRITICAL)
+
+FEES = (50, 100, 250, 500)
+
+
+def draw(room):
+    if room['status'] != 'drawing':
+        return None
+    return draw_winner(room['room_id'], {room['room_id']: room})
+
+
+def run(stripes: int, threads: int, players: int, blocking_us: int, workdir: str) -> dict:
+    def on_change(room):
+        room.public_json()
+        if blocking_us:
+            time.sleep(blocking_us / 1e6)
+
+    journal = RoomJournal(os.path.join(workdir, f'rooms_{stripes}_{blocking_us}'))
+    store = MemoryRoomStore(on_change=on_change, journal=journal, stripes=stripes)
+    store.restore(lambda room_id, user_id: None)  # открыть журнал
+    ids = count(1)
+    ids_lock = threading.Lock()
+    draws = []
+
+    def worker():
+        while True:
+            with ids_lock:
+                user_id = next(ids)
+            if user_id > players:
+                return
+            room, _ = store.join(FEES[user_id % len(FEES)], Participant(user_id, '', 'Bench'))
+            store.get(room['room_id'])
+            if store.mark_paid(room['room_id'], user_id, user_id):
+                if store.transition(room['room_id'], draw) is not None:
+                    draws.append(room['room_id'])
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    journal.close()
+
+    room_locks = summarize(store.room_locks.stripes)
+    registry = summarize([store.registry_lock])
+    return {
+        'stripes': stripes,
+        'blocking_us': blocking_us,
+        'threads': threads,
+        'players': players,
+        'draws': len(draws),
+        'seconds': round(elapsed, 2),
+        'players_per_sec': round(players / elapsed),
+        'room_lock_contended_pct': round(100 * room_locks['contended'] / room_locks['acquisitions'], 1),
+        'room_lock_wait_total_s': room_locks['wait_total'],
+        'room_lock_hold_avg_us': round(room_locks['hold_avg'] * 1e6, 1),
+        'registry_contended_pct': round(100 * registry['contended'] / registry['acquisitions'], 1),
+        'registry_hold_avg_us': round(registry['hold_avg'] * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--players', type=int, default=20000)
+    parser.add_argument('--stripes', type=int, nargs='+', default=[1, 64])
+    parser.add_argument('--blocking-us', type=int, nargs='+', default=[0, 200])
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_room_locks_')
+    try:
+        for blocking_us in args.blocking_us:
+            for stripes in args.stripes:
+                print(json.dumps(run(stripes, args.threads, args.players, blocking_us, workdir)), flush=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
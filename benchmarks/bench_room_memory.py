@@ -0,0 +1,138 @@
+"""
+Бенчмарк памяти на комнату: словари с ISO-временем против Room/Participant
+
+Каждый вариант запускается в отдельном процессе: держит --rooms полных
+комнат (по 6 участников) и сообщает прирост RSS на комнату. Варианты:
+
+    dict        — прежний формат: словарь комнаты, словари участников,
+                  created_at / joined_at ISO-строками
+    room        — Room и Participant со __slots__, время float
+    room+json   — то же, у каждой комнаты построен кэш публичного JSON
+
+Там же замеряется чтение состояния комнаты, как в get_room_info: прежний
+путь (копия комнаты + json.dumps) против Room.public_json() — первого
+построения, готовых байтов и перестройки после изменения комнаты.
+
+Запуск:
+    python benchmarks/bench_room_memory.py --rooms 1000000
+"""
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import subprocess
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from room_model import Participant, Room
+from room_store import MAX_ROOM_SIZE
+
+VARIANTS = ('dict', 'room', 'room+json')
+
+
+def rss_bytes() -> int:
+    """Текущий RSS процесса"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def dict_room(n: int) -> dict:
+    now = datetime.now().isoformat()
+    return {
+        'room_id': f'{n:022d}',
+        'entry_fee': 100,
+        'status': 'drawing',
+        'participants': [{'user_id': n * 6 + k, 'username': f'user{n * 6 + k}', 'first_name': f'User {k}',
+                          'payment_id': n * 6 + k, 'joined_at': datetime.now().isoformat()}
+                         for k in range(MAX_ROOM_SIZE)],
+        'total_pool': 600,
+        'winner': None,
+        'created_at': now,
+    }
+
+
+def slotted_room(n: int) -> Room:
+    return Room(f'{n:022d}', 100, MAX_ROOM_SIZE, 'drawing',
+                [Participant(n * 6 + k, f'user{n * 6 + k}', f'User {k}', n * 6 + k)
+                 for k in range(MAX_ROOM_SIZE)], 600)
+
+
+def legacy_read(room: dict) -> bytes:
+    """Прежний get_room_info: снимок комнаты и сериализация на каждый запрос"""
+    copy = dict(room)
+    copy['participants'] = [dict(p) for p in room['participants']]
+    return json.dumps({'room_id': copy['room_id'], 'entry_fee': copy['entry_fee'], 'status': copy['status'],
+                       'participants': copy['participants'], 'total_pool': copy['total_pool'],
+                       'winner': copy.get('winner'), 'max_participants': MAX_ROOM_SIZE}).encode()
+
+
+def measure(variant: str, rooms: int, reads: int) -> dict:
+    gc.collect()
+    baseline = rss_bytes()
+    if variant == 'dict':
+        held = [dict_room(n) for n in range(rooms)]
+    else:
+        held = [slotted_room(n) for n in range(rooms)]
+        if variant == 'room+json':
+            for room in held:
+                room.public_json()
+    gc.collect()
+    used = rss_bytes() - baseline
+
+    sample = held[:reads]
+    result = {
+        'variant': variant,
+        'rooms': rooms,
+        'rss_mb': round(used / 2 ** 20, 1),
+        'bytes_per_room': round(used / rooms),
+    }
+    if variant == 'dict':
+        result['read_us'] = per_call(legacy_read, sample)
+    elif variant == 'room':
+        result['first_read_us'] = per_call(Room.public_json, sample)
+    else:
+        result['read_us'] = per_call(Room.public_json, sample)
+
+        def changed(room):
+            # Изменение комнаты: JSON участников уже готов, строится только «шапка»
+            room.touch()
+            return room.public_json()
+
+        result['read_after_change_us'] = per_call(changed, sample)
+    return result
+
+
+def per_call(func, rooms) -> float:
+    """Среднее время вызова в микросекундах"""
+    started = time.perf_counter()
+    for room in rooms:
+        func(room)
+    return round((time.perf_counter() - started) / len(rooms) * 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rooms', type=int, default=1000000)
+    parser.add_argument('--reads', type=int, default=100000, help='Чтений состояния для замера read_us')
+    parser.add_argument('--variant', choices=VARIANTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    reads = min(args.reads, args.rooms)
+
+    if args.variant:
+        print(json.dumps(measure(args.variant, args.rooms, reads)), flush=True)
+        return
+
+    # Свой процесс на вариант: освобожденная память не всегда возвращается ОС
+    for variant in VARIANTS:
+        subprocess.run([sys.executable, __file__, '--variant', variant,
+                        '--rooms', str(args.rooms), '--reads', str(reads)], check=True)
+
+
+if __name__ == '__main__':
+    main()
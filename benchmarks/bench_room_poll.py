@@ -0,0 +1,131 @@
+"""
+Бенчмарк опроса /api/room/<room_id> клиентами без EventSource
+
+--clients клиентов следят за одной комнатой, которая меняется раз в
+--change-interval секунд (занимается или освобождается место). Сравниваются режимы:
+
+    poll       — GET раз в --poll-interval секунд, каждый раз полное тело
+    etag       — то же с If-None-Match: без изменений ответ 304 без тела
+    long-poll  — GET ?since=<version>: ответ приходит только после изменения
+
+Считаются запросы, байты тел ответов и задержка, с которой клиент видит
+новую версию.
+
+Запуск:
+    python benchmarks/bench_room_poll.py --clients 50 --duration 10
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+from itertools import count
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app as app_module
+import db
+
+logging.disable(logging.CRITICAL)
+
+MODES = ('poll', 'etag', 'long-poll')
+
+
+def run(mode: str, clients: int, duration: float, poll_interval: float, change_interval: float) -> dict:
+    room, _ = app_module.reserve_seat(500, {'id': 1, 'first_name': 'Bench'})
+    room_id = room['room_id']
+    changed_at = {room['version']: time.monotonic()}
+    stopped = threading.Event()
+    lock = threading.Lock()
+    totals = {'requests': 0, 'not_modified': 0, 'body_bytes': 0, 'lag': []}
+
+    def client():
+        http = app_module.app.test_client()
+        version, etag = 0, None
+        stopped.wait(random.uniform(0, poll_interval))  # Клиенты опрашивают вразнобой
+        while not stopped.is_set():
+            if mode == 'long-poll':
+                response = http.get(f'/api/room/{room_id}?since={version}')
+            else:
+                headers = {'If-None-Match': etag} if mode == 'etag' and etag else {}
+                response = http.get(f'/api/room/{room_id}', headers=headers)
+            seen = time.monotonic()
+            with lock:
+                totals['requests'] += 1
+                totals['body_bytes'] += len(response.data)
+                totals['not_modified'] += response.status_code == 304
+            if response.status_code == 200:
+                etag = response.headers['ETag']
+                new_version = response.json['version']
+                if new_version > version and version:
+                    with lock:
+                        totals['lag'].append(seen - changed_at[new_version])
+                version = new_version
+            if mode != 'long-poll':
+                stopped.wait(poll_interval)
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+
+    deadline = time.monotonic() + duration
+    for change in count():
+        time.sleep(change_interval)
+        if time.monotonic() >= deadline:
+            break
+        # Второй игрок по очереди занимает и освобождает место: комната не заполняется
+        changed_at[app_module.room_store.get(room_id)['version'] + 1] = time.monotonic()
+        if change % 2 == 0:
+            app_module.reserve_seat(500, {'id': 2, 'first_name': 'Bench'})
+        else:
+            app_module.release_seat(room_id, 2)
+
+    stopped.set()
+    app_module.room_store.remove(room_id)
+    app_module.broadcaster.forget(room_id)  # Будит ждущие long-poll: комнаты больше нет
+    for thread in threads:
+        thread.join(timeout=app_module.ROOM_POLL_TIMEOUT + 5)
+
+    lag = sorted(totals['lag'])
+    return {
+        'mode': mode,
+        'clients': clients,
+        'seconds': duration,
+        'room_versions': len(changed_at),
+        'requests_per_sec': round(totals['requests'] / duration, 1),
+        'not_modified': totals['not_modified'],
+        'body_kb': round(totals['body_bytes'] / 1024, 1),
+        'lag_avg_ms': round(sum(lag) / len(lag) * 1000, 1) if lag else None,
+        'lag_max_ms': round(lag[-1] * 1000, 1) if lag else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--change-interval', type=float, default=2.0)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_room_poll_')
+    app_module.DB_PATH = os.path.join(workdir, 'lottery.db')
+    app_module.limiter.enabled = False
+    db.migrate(app_module.DB_PATH)
+    try:
+        for mode in args.modes:
+            print(json.dumps(run(mode, args.clients, args.duration, args.poll_interval,
+                                 args.change_interval)), flush=True)
+    finally:
+        db.close_all()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
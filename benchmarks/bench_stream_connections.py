@@ -0,0 +1,132 @@
+"""
+Нагрузочный тест асинхронного сервера потоков (stream_server)
+
+Поднимает StreamServer поверх app.broadcaster/app.subscribe_room, открывает
+из отдельного процесса N простаивающих SSE-соединений, измеряет прирост
+RSS сервера на одно соединение, затем публикует обновление во все комнаты
+и проверяет, что оно дошло до каждого клиента.
+
+Запуск:
+    python benchmarks/bench_stream_connections.py --connections 10000 --rooms 2000
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+logging.disable(logging.CRITICAL)
+
+
+def rss_bytes() -> int:
+    """Текущий RSS процесса"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+async def client(port: int, connections: int, rooms: int, concurrency: int) -> None:
+    """Открыть connections потоков, сообщить READY и дождаться одного обновления на каждом"""
+    semaphore = asyncio.Semaphore(concurrency)
+    streams = []
+
+    async def connect(i: int):
+        async with semaphore:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f'GET /api/room/bench_{i % rooms}/stream HTTP/1.1\r\nHost: bench\r\n\r\n'.encode())
+            await reader.readuntil(b'\r\n\r\n')  # заголовки
+            await reader.readuntil(b'\n\n')      # текущее состояние
+            streams.append((reader, writer))
+
+    await asyncio.gather(*(connect(i) for i in range(connections)))
+    print('READY', flush=True)
+
+    async def wait_update(reader):
+        while True:
+            message = await reader.readuntil(b'\n\n')
+            if message.startswith(b'data:'):
+                return time.perf_counter()
+
+    started = time.perf_counter()
+    finished = await asyncio.gather(*(wait_update(r) for r, _ in streams))
+    print(json.dumps({
+        'received': len(finished),
+        'fanout_ms': round((max(finished) - started) * 1000, 1),
+    }), flush=True)
+    for _, writer in streams:
+        writer.close()
+
+
+def server(connections: int, rooms: int, concurrency: int) -> None:
+    import app as app_module
+    from room_model import Participant, Room
+    from stream_server import StreamServer
+
+    for i in range(rooms):
+        room_id = f'bench_{i}'
+        app_module.room_store.rooms[room_id] = Room(room_id, 100, app_module.MAX_ROOM_SIZE)
+
+    stream_server = StreamServer(app_module.broadcaster, app_module.subscribe_room,
+                                 host='127.0.0.1', heartbeat_interval=30).start()
+    baseline = rss_bytes()
+
+    proc = subprocess.Popen(
+        [sys.executable, __file__, '--client', '--port', str(stream_server.port),
+         '--connections', str(connections), '--rooms', str(rooms), '--concurrency', str(concurrency)],
+        stdout=subprocess.PIPE, text=True)
+    assert proc.stdout.readline().strip() == 'READY'
+
+    # Даем event loop обработать последние подключения
+    deadline = time.time() + 30
+    while stream_server.active_streams < connections and time.time() < deadline:
+        time.sleep(0.1)
+    time.sleep(1)
+    connected = rss_bytes()
+    active = stream_server.active_streams
+
+    def add_player(room):
+        room['participants'].append(Participant(1, 'bench', 'Bench'))
+        return room
+
+    for room_id in app_module.room_store.room_ids():
+        app_module.room_store.transition(room_id, add_player)
+
+    delivery = json.loads(proc.stdout.readline())
+    proc.wait()
+    stream_server.stop()
+
+    print(json.dumps({
+        'connections': connections,
+        'active_streams': active,
+        'rooms': rooms,
+        'rss_baseline_mb': round(baseline / 2 ** 20, 1),
+        'rss_connected_mb': round(connected / 2 ** 20, 1),
+        'bytes_per_connection': (connected - baseline) // max(active, 1),
+        **delivery,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, default=10000)
+    parser.add_argument('--rooms', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument('--client', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.client:
+        asyncio.run(client(args.port, args.connections, args.rooms, args.concurrency))
+    else:
+        server(args.connections, args.rooms, args.concurrency)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Бенчмарк пропускной способности /webhook (successful_payment)
+
+Сравнивает режим "до" (новое соединение на каждый запрос, rollback journal,
+synchronous=FULL — поведение sqlite3.connect() по умолчанию) и режим "после"
+(пул соединений per-thread, WAL, synchronous=NORMAL).
+
+Запуск:
+    python benchmarks/bench_webhook.py --payments 3000 --threads 8
+"""
+import os
+import sys
+import time
+import json
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+from itertools import count
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app as app_module
+import db
+import telegram_client
+from fake_bot_api import FakeBotApi
+from room_store import MemoryRoomStore
+from update_pipeline import UpdatePipeline
+
+logging.disable(logging.CRITICAL)
+
+MODES = {
+    'legacy': {'pooled': False, 'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    'pooled': {'pooled': True, 'journal_mode': 'WAL', 'synchronous': 'NORMAL'},
+}
+
+
+def _payment_update(update_id: int, user_id: int, entry_fee: int) -> dict:
+    return {
+        'update_id': update_id,
+        'message': {
+            'from': {'id': user_id, 'first_name': f'User{user_id}'},
+            'successful_payment': {
+                'invoice_payload': json.dumps({'user_id': user_id, 'entry_fee': entry_fee}),
+                'telegram_payment_charge_id': f'charge_{update_id}',
+            },
+        },
+    }
+
+
+def run(mode: str, payments: int, threads: int, workdir: str) -> dict:
+    """Прогнать payments платежей через webhook в threads потоках"""
+    db_path = os.path.join(workdir, f'{mode}.db')
+    db.configure(**MODES[mode])
+    app_module.DB_PATH = db_path
+    app_module.room_store = MemoryRoomStore(app_module.MAX_ROOM_SIZE, on_change=app_module.room_changed)
+    app_module.init_db()
+    app_module.updates = UpdatePipeline(app_module.process_update, db_path).start()
+
+    client = app_module.app.test_client()
+    ids = count(1)
+    ids_lock = threading.Lock()
+    errors = []
+
+    def worker():
+        while True:
+            with ids_lock:
+                update_id = next(ids)
+            if update_id > payments:
+                return
+            fee = app_module.ENTRY_FEES[update_id % len(app_module.ENTRY_FEES)]
+            response = client.post('/webhook', json=_payment_update(update_id, update_id, fee))
+            if response.status_code != 200:
+                errors.append(response.get_json())
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    acked = time.perf_counter() - started
+    # Вебхук отвечает до обработки: считаем до конца обработки всех платежей
+    app_module.updates.join()
+    elapsed = time.perf_counter() - started
+    app_module.updates.stop()
+    db.close_all()
+
+    return {
+        'mode': mode,
+        'payments': payments,
+        'threads': threads,
+        'ack_seconds': round(acked, 3),
+        'seconds': round(elapsed, 3),
+        'payments_per_sec': round(payments / elapsed, 1),
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--payments', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+
+    # Исходящие вызовы Bot API идут в локальную заглушку
+    api = FakeBotApi().start()
+    telegram_client.set_client(telegram_client.TelegramClient('BENCH', api.url))
+    app_module.limiter.enabled = False
+
+    workdir = tempfile.mkdtemp(prefix='bench_webhook_')
+    try:
+        for mode in args.modes:
+            print(json.dumps(run(mode, args.payments, args.threads, workdir)))
+    finally:
+        db.configure(**MODES['pooled'])
+        api.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
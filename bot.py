@@ -1,8 +1,12 @@
 import os
 import logging
-import requests
-from threading import Thread
+from functools import partial
+from threading import Thread, Lock
 import time
+from notifier import NotificationDispatcher
+from telegram_client import TelegramError, get_client
+import user_stats
+from db import DB_PATH
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -10,25 +14,22 @@ logger = logging.getLogger(__name__)
 BOT_TOKEN = os.environ.get('BOT_TOKEN', '')
 WEBAPP_URL = os.environ.get('WEBAPP_URL', '')
 
+_dispatcher = None
+_dispatcher_lock = Lock()
+
+def get_dispatcher():
+    """Общий диспетчер уведомлений (запускается при первом обращении)"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = NotificationDispatcher(partial(get_client().call, 'sendMessage')).start()
+        return _dispatcher
+
 def send_message(chat_id, text, reply_markup=None):
     """Отправить сообщение пользователю"""
     try:
-        data = {
-            'chat_id': chat_id,
-            'text': text,
-            'parse_mode': 'HTML'
-        }
-        
-        if reply_markup:
-            data['reply_markup'] = reply_markup
-        
-        response = requests.post(
-            f'https://api.telegram.org/bot{BOT_TOKEN}/sendMessage',
-            json=data
-        )
-        
-        return response.json()
-    except Exception as e:
+        return get_client().send_message(chat_id, text, reply_markup)
+    except TelegramError as e:
         logger.error(f"Error sending message: {e}")
         return None
 
@@ -51,7 +52,7 @@ def send_winner_notification(user_id, amount, room_id):
         ]]
     }
     
-    send_message(user_id, text, keyboard)
+    get_dispatcher().submit(user_id, text, keyboard)
 
 def send_loser_notification(user_id, winner_name, amount, room_id):
     """Отправить уведомление проигравшему"""
@@ -71,7 +72,7 @@ def send_loser_notification(user_id, winner_name, amount, room_id):
         ]]
     }
     
-    send_message(user_id, text, keyboard)
+    get_dispatcher().submit(user_id, text, keyboard)
 
 def notify_room_participants(room_data):
     """Уведомить всех участников комнаты о результатах"""
@@ -92,7 +93,7 @@ def notify_room_participants(room_data):
                 # Отправляем уведомление проигравшим
                 send_loser_notification(user_id, winner_name, winner_amount, room_id)
         
-        logger.info(f"Notifications sent for room {room_id}")
+        logger.info(f"Notifications queued for room {room_id}")
     
     except Exception as e:
         logger.error(f"Error notifying participants: {e}")
@@ -106,17 +107,10 @@ def set_bot_commands():
             {'command': 'stats', 'description': 'Моя статистика'}
         ]
         
-        response = requests.post(
-            f'https://api.telegram.org/bot{BOT_TOKEN}/setMyCommands',
-            json={'commands': commands}
-        )
-        
-        if response.json().get('ok'):
-            logger.info("Bot commands set successfully")
-        else:
-            logger.error(f"Failed to set bot commands: {response.text}")
+        get_client().set_my_commands(commands)
+        logger.info("Bot commands set successfully")
     
-    except Exception as e:
+    except TelegramError as e:
         logger.error(f"Error setting bot commands: {e}")
 
 def handle_start_command(chat_id):
@@ -175,17 +169,17 @@ def handle_help_command(chat_id):
     
     send_message(chat_id, text)
 
-def handle_stats_command(chat_id):
-    """Обработать команду /stats"""
-    # TODO: Получить статистику из БД
-    text = """
+def handle_stats_command(chat_id, user_id=None):
+    """Обработать команду /stats (в личном чате chat_id совпадает с user_id)"""
+    stats = user_stats.get_user_stats(user_id or chat_id, DB_PATH)
+    text = f"""
 📊 <b>Ваша статистика</b>
 
-🎮 Игр сыграно: 0
-🏆 Побед: 0
-📈 Процент побед: 0%
-💰 Всего выиграно: 0 ⭐
-💸 Всего потрачено: 0 ⭐
+🎮 Игр сыграно: {stats['total_games']}
+🏆 Побед: {stats['total_wins']}
+📈 Процент побед: {stats['win_rate']}%
+💰 Всего выиграно: {stats['total_winnings']} ⭐
+💸 Всего потрачено: {stats['total_spent']} ⭐
 
 Откройте приложение для подробной статистики!
 """
@@ -204,24 +198,7 @@ def process_updates():
     
     while True:
         try:
-            response = requests.get(
-                f'https://api.telegram.org/bot{BOT_TOKEN}/getUpdates',
-                params={'offset': offset, 'timeout': 30}
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"Failed to get updates: {response.text}")
-                time.sleep(5)
-                continue
-            
-            data = response.json()
-            
-            if not data.get('ok'):
-                logger.error(f"API error: {data}")
-                time.sleep(5)
-                continue
-            
-            updates = data.get('result', [])
+            updates = get_client().get_updates(offset, timeout=30)
             
             for update in updates:
                 offset = update['update_id'] + 1
@@ -236,8 +213,11 @@ def process_updates():
                     elif text.startswith('/help'):
                         handle_help_command(chat_id)
                     elif text.startswith('/stats'):
-                        handle_stats_command(chat_id)
+                        handle_stats_command(chat_id, message.get('from', {}).get('id'))
         
+        except TelegramError as e:
+            logger.error(f"Failed to get updates: {e}")
+            time.sleep(5)
         except Exception as e:
             logger.error(f"Error processing updates: {e}")
             time.sleep(5)
@@ -0,0 +1,157 @@
+import json
+import queue
+import logging
+from threading import Lock
+from typing import Dict, Iterator, Optional, Set, Tuple, Union
+from room_model import Room
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 15  # Секунд между комментариями-пингами для прокси
+SUBSCRIBER_QUEUE_SIZE = 16
+
+# Маркер конца потока (комната завершена или удалена)
+_CLOSE = None
+
+
+class Subscription:
+    """
+    Подписка одного SSE-клиента на комнату
+    Сообщения уже сериализованы издателем; очередь ограничена, при
+    переполнении выбрасывается самое старое состояние — клиенту важно
+    только последнее.
+    """
+
+    def __init__(self, hub: 'RoomBroadcaster', room_id: str, maxsize: int):
+        self.hub = hub
+        self.room_id = room_id
+        self.queue: queue.Queue = queue.Queue(maxsize)
+
+    def deliver(self, message: Optional[str]) -> None:
+        """Положить сообщение в очередь подписчика (не блокирует издателя)"""
+        while True:
+            try:
+                self.queue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float) -> Optional[str]:
+        """Следующее сообщение; '' если за timeout ничего не пришло"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return ''
+
+    def close(self) -> None:
+        self.hub.unsubscribe(self)
+
+
+class RoomBroadcaster:
+    """
+    Publish/subscribe для обновлений комнат
+
+    Изменение комнаты публикуется один раз: payload сериализуется в готовое
+    SSE-сообщение и раскладывается по очередям всех подписчиков комнаты.
+    Последнее сообщение комнаты хранится, чтобы новый подписчик сразу
+    получил текущее состояние без повторной сериализации. Пока у комнаты
+    нет подписчиков, публикация ничего не сериализует.
+    """
+
+    def __init__(self, heartbeat_interval: float = HEARTBEAT_INTERVAL,
+                 queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.heartbeat_interval = heartbeat_interval
+        self.queue_size = queue_size
+        self._lock = Lock()
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._last: Dict[str, Tuple[str, bool]] = {}
+
+    @staticmethod
+    def format_message(payload: Union[Room, Dict]) -> str:
+        """Сериализовать payload в SSE-сообщение (у Room — готовый публичный JSON)"""
+        if isinstance(payload, Room):
+            return f"data: {payload.public_json().decode()}\n\n"
+        return f"data: {json.dumps(payload, default=str)}\n\n"
+
+    def publish(self, room_id: str, payload: Union[Room, Dict], final: bool = False) -> int:
+        """
+        Разослать новое состояние комнаты
+        final=True закрывает потоки подписчиков после доставки.
+        Возвращает количество подписчиков.
+        """
+        # Доставка под локом хаба сохраняет порядок сообщений относительно
+        # subscribe(); deliver() не блокируется, поэтому лок держится недолго
+        with self._lock:
+            subscribers = self._subscribers.get(room_id)
+            if not subscribers:
+                # Никто не слушает: сериализуем лениво при первой подписке
+                self._last.pop(room_id, None)
+                return 0
+            message = self.format_message(payload)
+            self._last[room_id] = (message, final)
+            for subscription in subscribers:
+                subscription.deliver(message)
+                if final:
+                    subscription.deliver(_CLOSE)
+            return len(subscribers)
+
+    def subscribe(self, room_id: str, current: Union[Room, Dict, None] = None, final: bool = False,
+                  subscription: Optional[Subscription] = None) -> Subscription:
+        """
+        Подписаться на комнату; текущее состояние приходит первым
+        current — состояние комнаты на момент подписки, сериализуется только
+        если последнее опубликованное сообщение не сохранено.
+        """
+        if subscription is None:
+            subscription = Subscription(self, room_id, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(room_id, set()).add(subscription)
+            last = self._last.get(room_id)
+            if last is None and current is not None:
+                last = self._last[room_id] = (self.format_message(current), final)
+            if last is not None:
+                message, final = last
+                subscription.deliver(message)
+                if final:
+                    subscription.deliver(_CLOSE)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.room_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.room_id]
+
+    def forget(self, room_id: str) -> None:
+        """Комната удалена: закрыть потоки и забыть последнее состояние"""
+        with self._lock:
+            self._last.pop(room_id, None)
+            for subscription in self._subscribers.pop(room_id, ()):
+                subscription.deliver(_CLOSE)
+
+    def subscriber_count(self, room_id: Optional[str] = None) -> int:
+        with self._lock:
+            if room_id is not None:
+                return len(self._subscribers.get(room_id, ()))
+            return sum(len(s) for s in self._subscribers.values())
+
+    def stream(self, subscription: Subscription) -> Iterator[str]:
+        """
+        Генератор SSE-ответа
+        Поток спит в ожидании очереди; при простое отдает комментарий-пинг,
+        чтобы прокси не закрыли соединение.
+        """
+        try:
+            while True:
+                message = subscription.get(self.heartbeat_interval)
+                if message is _CLOSE:
+                    break
+                yield message or ': ping\n\n'
+        finally:
+            subscription.close()
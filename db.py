@@ -0,0 +1,203 @@
+import os
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+import migrations
+
+logger = logging.getLogger(__name__)
+
+# Конфигурация (можно переопределить переменными окружения или через configure())
+DB_PATH = os.environ.get('DB_PATH', 'lottery.db')
+
+_settings = {
+    'journal_mode': os.environ.get('DB_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('DB_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout_ms': int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000)),
+    'cached_statements': int(os.environ.get('DB_CACHED_STATEMENTS', 256)),
+    'pooled': os.environ.get('DB_POOLED', '1') != '0',
+    'auto_migrate': os.environ.get('DB_AUTO_MIGRATE', '1') != '0',
+}
+
+_SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+# Соединения хранятся per-thread: sqlite3.Connection нельзя безопасно
+# разделять между потоками, а повторное использование соединения сохраняет
+# кеш подготовленных выражений и не требует заново выставлять PRAGMA.
+_local = threading.local()
+_registry: List[sqlite3.Connection] = []
+_registry_lock = threading.Lock()
+_generation = 0
+_migrated_paths = set()
+
+
+def configure(**settings) -> None:
+    """
+    Изменить настройки пула соединений
+    Уже открытые соединения закрываются, чтобы новые настройки применились
+    """
+    for key, value in settings.items():
+        if key not in _settings:
+            raise ValueError(f"Unknown database setting: {key}")
+        if key == 'synchronous' and str(value).upper() not in _SYNCHRONOUS_MODES:
+            raise ValueError(f"Invalid synchronous mode: {value}")
+        _settings[key] = value
+    close_all()
+
+
+def get_settings() -> Dict[str, Any]:
+    """Текущие настройки пула соединений"""
+    return dict(_settings)
+
+
+def _open(db_path: str) -> sqlite3.Connection:
+    """Открыть и настроить новое соединение"""
+    conn = sqlite3.connect(
+        db_path,
+        timeout=_settings['busy_timeout_ms'] / 1000,
+        isolation_level=None,  # транзакциями управляем явно через transaction()
+        check_same_thread=False,  # нужно только для close_all() из другого потока
+        cached_statements=_settings['cached_statements'],
+    )
+    conn.execute(f"PRAGMA journal_mode = {_settings['journal_mode']}")
+    conn.execute(f"PRAGMA synchronous = {str(_settings['synchronous']).upper()}")
+    conn.execute(f"PRAGMA busy_timeout = {int(_settings['busy_timeout_ms'])}")
+    if _settings['auto_migrate']:
+        _ensure_schema(conn, db_path)
+    return conn
+
+
+def _ensure_schema(conn: sqlite3.Connection, db_path: str) -> None:
+    """Применить миграции при первом открытии базы в процессе"""
+    # In-memory база у каждого соединения своя, поэтому мигрируем каждое
+    if db_path != ':memory:' and db_path in _migrated_paths:
+        return
+    migrations.migrate(conn)
+    if db_path != ':memory:':
+        _migrated_paths.add(db_path)
+
+
+def migrate(db_path: Optional[str] = None) -> int:
+    """Применить недостающие миграции, вернуть версию схемы"""
+    with connection(db_path) as conn:
+        version = migrations.migrate(conn)
+    _migrated_paths.add(db_path or DB_PATH)
+    return version
+
+
+def _thread_pool() -> Dict[str, sqlite3.Connection]:
+    """Соединения текущего потока (сбрасываются после fork и close_all())"""
+    key = (os.getpid(), _generation)
+    if getattr(_local, 'key', None) != key:
+        _local.key = key
+        _local.connections = {}
+    return _local.connections
+
+
+def get_connection(db_path: Optional[str] = None) -> sqlite3.Connection:
+    """Получить соединение текущего потока для db_path (создается при первом обращении)"""
+    db_path = db_path or DB_PATH
+    pool = _thread_pool()
+    conn = pool.get(db_path)
+    if conn is None:
+        conn = _open(db_path)
+        pool[db_path] = conn
+        with _registry_lock:
+            _registry.append(conn)
+    return conn
+
+
+@contextmanager
+def connection(db_path: Optional[str] = None) -> Iterator[sqlite3.Connection]:
+    """Соединение для чтения/одиночных запросов (autocommit)"""
+    if _settings['pooled']:
+        yield get_connection(db_path)
+        return
+
+    conn = _open(db_path or DB_PATH)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def transaction(db_path: Optional[str] = None, immediate: bool = True) -> Iterator[sqlite3.Connection]:
+    """
+    Единица работы: все запросы внутри блока фиксируются одним COMMIT
+    BEGIN IMMEDIATE сразу берет блокировку на запись, поэтому писатели ждут
+    busy_timeout, а не получают "database is locked" при апгрейде блокировки.
+    Вложенные вызовы превращаются в SAVEPOINT.
+    """
+    with connection(db_path) as conn:
+        if conn.in_transaction:
+            savepoint = f"sp_{threading.get_ident()}_{id(conn)}"
+            conn.execute(f"SAVEPOINT {savepoint}")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute(f"ROLLBACK TO {savepoint}")
+                conn.execute(f"RELEASE {savepoint}")
+                raise
+            conn.execute(f"RELEASE {savepoint}")
+            return
+
+        conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+def execute(sql: str, params: Sequence = (), db_path: Optional[str] = None) -> sqlite3.Cursor:
+    """Выполнить одиночный запрос на запись (autocommit)"""
+    with connection(db_path) as conn:
+        return conn.execute(sql, params)
+
+
+def fetch_one(sql: str, params: Sequence = (), db_path: Optional[str] = None) -> Optional[tuple]:
+    """Выполнить запрос и вернуть первую строку"""
+    with connection(db_path) as conn:
+        return conn.execute(sql, params).fetchone()
+
+
+def fetch_all(sql: str, params: Sequence = (), db_path: Optional[str] = None) -> List[tuple]:
+    """Выполнить запрос и вернуть все строки"""
+    with connection(db_path) as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def fetch_value(sql: str, params: Sequence = (), db_path: Optional[str] = None, default: Any = None) -> Any:
+    """Выполнить запрос и вернуть первое значение первой строки"""
+    row = fetch_one(sql, params, db_path)
+    if row is None or row[0] is None:
+        return default
+    return row[0]
+
+
+def close_connection(db_path: Optional[str] = None) -> None:
+    """Закрыть соединение текущего потока"""
+    conn = _thread_pool().pop(db_path or DB_PATH, None)
+    if conn is None:
+        return
+    with _registry_lock:
+        if conn in _registry:
+            _registry.remove(conn)
+    conn.close()
+
+
+def close_all() -> None:
+    """Закрыть все соединения пула (во всех потоках)"""
+    global _generation
+    with _registry_lock:
+        _generation += 1
+        connections = list(_registry)
+        _registry.clear()
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Error closing connection: {e}")
@@ -0,0 +1,205 @@
+"""
+Симуляция розыгрышей: равномерность выбора победителя и сверка выплат
+
+    simulate_draws   — миллионы розыгрышей через lottery_engine.pick_winner
+                       (выбор победителя в draw_winner) над участниками комнат
+    simulate_engine  — настоящий conduct_lottery с записью в БД (по умолчанию
+                       ':memory:'), затем сверка ledger с пулами комнат
+    rng_baseline     — только генератор: векторная выборка мест (numpy, если
+                       установлен; иначе random.Random.randrange). Движок не
+                       проверяет — точка сравнения для скорости и критерия
+
+simulate_draws и simulate_engine идут через код движка по одному
+розыгрышу в цикле Python; векторная только rng_baseline.
+
+Для каждого размера комнаты места сравниваются критерием хи-квадрат
+(p-value по приближению Уилсона — Хилферти, без scipy). Доли выплат
+сверяются точно в рациональных числах: победителю floor(пул * 4/5),
+админу ceil(пул * 1/5) (reconcile_pools), а у simulate_engine — строки
+ledger, записанные в БД.
+
+Используется тестами (tests/test_draw_simulation.py) и бенчмарком
+benchmarks/bench_draw_fairness.py.
+"""
+import math
+import time
+import random
+from fractions import Fraction
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy не в requirements: выборка на чистом Python медленнее
+    np = None
+
+import db
+from lottery_engine import ADMIN_PERCENTAGE, WINNER_PERCENTAGE, conduct_lottery, pick_winner, split_pool
+from room_model import Participant, Room
+
+CHUNK = 1000000  # Розыгрышей в одной векторной выборке rng_baseline (память numpy)
+
+# Доли точными дробями: 0.80 -> 4/5, 0.20 -> 1/5
+WINNER_SHARE = Fraction(WINNER_PERCENTAGE).limit_denominator(1000)
+ADMIN_SHARE = Fraction(ADMIN_PERCENTAGE).limit_denominator(1000)
+
+
+def chi_square(counts: Sequence[int]) -> Tuple[float, float]:
+    """Хи-квадрат против равномерного распределения по местам: (статистика, p-value)"""
+    total = sum(counts)
+    df = len(counts) - 1
+    expected = total / len(counts)
+    statistic = sum((count - expected) ** 2 for count in counts) / expected
+    # Уилсон — Хилферти: (X²/df)^(1/3) примерно нормально распределена
+    z = ((statistic / df) ** (1 / 3) - (1 - 2 / (9 * df))) / math.sqrt(2 / (9 * df))
+    return statistic, 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def make_rng(seed: Optional[int] = None):
+    """Генератор для rng_baseline: numpy.random.Generator или random.Random"""
+    return np.random.default_rng(seed) if np is not None else random.Random(seed)
+
+
+def sample_seats(seats: int, draws: int, rng) -> List[int]:
+    """Сколько раз каждое место выпало генератору rng за draws выборок (без движка)"""
+    if np is not None:
+        counts = np.zeros(seats, dtype=np.int64)
+        for start in range(0, draws, CHUNK):
+            counts += np.bincount(rng.integers(0, seats, min(CHUNK, draws - start)), minlength=seats)
+        return counts.tolist()
+
+    randrange = rng.randrange
+    counts = Counter()
+    for start in range(0, draws, CHUNK):
+        counts.update(randrange(seats) for _ in range(min(CHUNK, draws - start)))
+    return [counts[seat] for seat in range(seats)]
+
+
+def expected_split(pool: int) -> Tuple[int, int]:
+    """Точные доли: победителю 80% с округлением вниз, админу 20% с округлением вверх"""
+    return math.floor(pool * WINNER_SHARE), math.ceil(pool * ADMIN_SHARE)
+
+
+def reconcile_pools(pools: Iterable[int]) -> List[Dict]:
+    """Пулы, для которых split_pool расходится с точными долями"""
+    mismatches = []
+    for pool in pools:
+        split, expected = split_pool(pool), expected_split(pool)
+        if split != expected:
+            mismatches.append({'pool': pool, 'split': split, 'expected': expected})
+    return mismatches
+
+
+def _seat_report(counts: List[int]) -> Dict:
+    statistic, p_value = chi_square(counts)
+    return {'counts': counts, 'chi2': round(statistic, 3), 'p_value': p_value}
+
+
+def _participants(size: int) -> List[Participant]:
+    return [Participant(seat + 1, '', f'Seat {seat + 1}', seat + 1) for seat in range(size)]
+
+
+def simulate_draws(draws: int, sizes: Iterable[int], fees: Iterable[int]) -> Dict:
+    """
+    draws розыгрышей на каждую пару (ставка, размер комнаты) через pick_winner
+    Места сравниваются по каждому размеру (по всем ставкам вместе), доли
+    выплат всех пулов сверяются с точным расчетом. Случайность — глобальный
+    random, как у draw_winner: для повторяемости вызывающий делает random.seed().
+    """
+    sizes, fees = list(sizes), list(fees)
+    seats = {size: [0] * size for size in sizes}
+
+    started = time.perf_counter()
+    for size in sizes:
+        participants = _participants(size)
+        for fee in fees:
+            # Место = порядок входа: user_id участника на единицу больше индекса
+            counts = Counter(pick_winner(participants).user_id for _ in range(draws))
+            seats[size] = [total + counts[seat + 1] for seat, total in enumerate(seats[size])]
+    seconds = time.perf_counter() - started
+
+    total = draws * len(sizes) * len(fees)
+    return {'draws': total, 'seconds': round(seconds, 3),
+            'draws_per_sec': round(total / seconds) if seconds else None,
+            'seats': {size: _seat_report(counts) for size, counts in seats.items()},
+            'mismatches': reconcile_pools(fee * size for fee in fees for size in sizes)}
+
+
+def rng_baseline(draws: int, sizes: Iterable[int], seed: Optional[int] = None) -> Dict:
+    """
+    Точка сравнения: draws векторных выборок мест на каждый размер комнаты
+    Проверяет только генератор (numpy или random.Random), не lottery_engine.
+    """
+    sizes = list(sizes)
+    rng = make_rng(seed)
+    started = time.perf_counter()
+    seats = {size: sample_seats(size, draws, rng) for size in sizes}
+    seconds = time.perf_counter() - started
+
+    total = draws * len(sizes)
+    return {'sampler': 'numpy' if np is not None else 'python', 'draws': total, 'seconds': round(seconds, 3),
+            'draws_per_sec': round(total / seconds) if seconds else None,
+            'seats': {size: _seat_report(counts) for size, counts in seats.items()}}
+
+
+def reconcile_ledger(db_path: str = ':memory:') -> Tuple[int, List[Dict]]:
+    """
+    Сверка ledger комнат sim-*: у каждой ровно одна выплата победителю
+    комнаты и один сбор, суммы — точные доли ее пула.
+    Возвращает число комнат и расхождения.
+    """
+    ledger = db.fetch_all('''
+        SELECT r.room_id, r.total_pool, r.status,
+               (SELECT COUNT(*) FROM transactions t
+                WHERE t.room_id = r.room_id AND t.transaction_type = 'winner_payout'
+                  AND t.to_user_id = r.winner_user_id),
+               (SELECT SUM(t.amount) FROM transactions t
+                WHERE t.room_id = r.room_id AND t.transaction_type = 'winner_payout'),
+               (SELECT COUNT(*) FROM transactions t
+                WHERE t.room_id = r.room_id AND t.transaction_type = 'admin_fee'),
+               (SELECT SUM(t.amount) FROM transactions t
+                WHERE t.room_id = r.room_id AND t.transaction_type = 'admin_fee')
+        FROM rooms r WHERE r.room_id LIKE 'sim-%'
+    ''', db_path=db_path)
+    mismatches = []
+    for room_id, pool, status, payouts, winner_amount, fees, admin_amount in ledger:
+        if (status, payouts, fees, (winner_amount, admin_amount)) != ('completed', 1, 1, expected_split(pool)):
+            mismatches.append({'room_id': room_id, 'status': status, 'winner_payouts': payouts, 'admin_fees': fees,
+                               'winner_amount': winner_amount, 'admin_amount': admin_amount})
+    return len(ledger), mismatches
+
+
+def simulate_engine(rooms: int, sizes: Iterable[int], fees: Iterable[int], db_path: str = ':memory:') -> Dict:
+    """
+    rooms комнат на каждую пару (ставка, размер) через conduct_lottery;
+    каждая комната записывается в rooms, результат — в transactions.
+    Цикл по комнатам намеренный: проверяется сам движок и его записи в БД.
+    После прогона ledger сверяется через reconcile_ledger.
+    """
+    sizes, fees = list(sizes), list(fees)
+    counts = {size: [0] * size for size in sizes}
+    mismatches, failed, draws = [], 0, 0
+
+    started = time.perf_counter()
+    for size in sizes:
+        for fee in fees:
+            for n in range(rooms):
+                room_id = f'sim-{fee}-{size}-{n}'
+                room = Room(room_id, fee, size, 'drawing', _participants(size), fee * size)
+                db.execute("INSERT INTO rooms (room_id, entry_fee, status, total_pool) VALUES (?, ?, 'drawing', ?)",
+                           (room_id, fee, fee * size), db_path)
+                result = conduct_lottery(room_id, {room_id: room}, db_path)
+                draws += 1
+                if result is None:
+                    failed += 1
+                    continue
+                counts[size][result['winner']['user_id'] - 1] += 1
+    seconds = time.perf_counter() - started
+
+    ledger_rooms, ledger_mismatches = reconcile_ledger(db_path)
+    mismatches.extend(ledger_mismatches)
+
+    return {'draws': draws, 'failed': failed, 'seconds': round(seconds, 3),
+            'draws_per_sec': round(draws / seconds) if seconds else None,
+            'seats': {size: _seat_report(seat_counts) for size, seat_counts in counts.items()},
+            'ledger_rooms': ledger_rooms, 'mismatches': mismatches}
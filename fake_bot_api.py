@@ -0,0 +1,112 @@
+import json
+import time
+import logging
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # Бенчмарки открывают много соединений сразу
+
+
+class FakeBotApi:
+    """
+    Локальная заглушка Telegram Bot API для тестов и бенчмарков
+
+    Принимает POST /bot<token>/<method> с JSON-телом, записывает вызовы и
+    отвечает {'ok': true, ...}. Через fail_next() можно запрограммировать
+    ошибки (429 с retry_after, 5xx), через latency — задержку ответа.
+
+        api = FakeBotApi().start()
+        os.environ['TELEGRAM_API_URL'] = api.url
+        ...
+        api.stop()
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.calls: List[Dict] = []
+        self.handlers: Dict[str, Callable[[Dict], object]] = {}
+        self._failures = deque()
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    def start(self) -> 'FakeBotApi':
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True  # Заголовки и тело уходят отдельными write
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                status, response = api._dispatch(self.path, body)
+                payload = json.dumps(response).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = _Server((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def fail_next(self, count: int = 1, status: int = 429, retry_after: Optional[int] = None,
+                  description: str = 'Too Many Requests') -> None:
+        """Следующие count вызовов завершатся ошибкой"""
+        response = {'ok': False, 'error_code': status, 'description': description}
+        if retry_after is not None:
+            response['parameters'] = {'retry_after': retry_after}
+        with self._lock:
+            self._failures.extend([(status, response)] * count)
+
+    def calls_to(self, method: str) -> List[Dict]:
+        """Успешные вызовы метода"""
+        with self._lock:
+            return [c for c in self.calls if c['method'] == method and c['ok']]
+
+    def _dispatch(self, path: str, body: bytes):
+        method = path.rsplit('/', 1)[-1].split('?', 1)[0]
+        try:
+            params = json.loads(body) if body else {}
+        except ValueError:
+            params = {}
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            failure = self._failures.popleft() if self._failures else None
+            self.calls.append({'method': method, 'params': params, 'ok': failure is None,
+                               'time': time.monotonic()})
+        if failure is not None:
+            return failure
+
+        handler = self.handlers.get(method)
+        result = handler(params) if handler is not None else True
+        return 200, {'ok': True, 'result': result}
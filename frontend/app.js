@@ -7,6 +7,9 @@ const API_BASE_URL = window.location.hostname === 'localhost'
     ? 'http://localhost:5000' 
     : 'https://telegram-stars-lottery.onrender.com/'; // Replace with actual backend URL
 
+// SSE-потоки комнат (если backend запущен со STREAM_PORT — адрес асинхронного stream-сервера)
+const STREAM_BASE_URL = API_BASE_URL;
+
 // Apply Telegram theme
 const theme = tg.colorScheme || 'dark';
 document.body.classList.add(`theme-${theme}`);
@@ -179,13 +182,22 @@ function joinRoom(roomId) {
     listenToRoomUpdates(roomId);
 }
 
-// Listen to room updates via Server-Sent Events
+// Room currently followed by long-poll (null stops the loop)
+let pollingRoomId = null;
+
+// Listen to room updates via Server-Sent Events (long-poll if EventSource is unavailable)
 function listenToRoomUpdates(roomId) {
     if (eventSource) {
         eventSource.close();
     }
+    pollingRoomId = null;
     
-    eventSource = new EventSource(`${API_BASE_URL}/api/room/${roomId}/stream`);
+    if (!window.EventSource) {
+        pollRoomUpdates(roomId, 0);
+        return;
+    }
+    
+    eventSource = new EventSource(`${STREAM_BASE_URL}/api/room/${roomId}/stream`);
     
     eventSource.onmessage = (event) => {
         const room = JSON.parse(event.data);
@@ -197,17 +209,7 @@ function listenToRoomUpdates(roomId) {
             return;
         }
         
-        currentRoom = room;
-        updateRoomUI(room);
-        
-        // Check if room is drawing
-        if (room.status === 'drawing') {
-            showDrawingScreen(room);
-        }
-        
-        // Check if room is completed
-        if (room.status === 'completed') {
-            showWinnerScreen(room);
+        if (handleRoomUpdate(room)) {
             eventSource.close();
         }
     };
@@ -215,9 +217,66 @@ function listenToRoomUpdates(roomId) {
     eventSource.onerror = (error) => {
         console.error('EventSource error:', error);
         eventSource.close();
+        // Stream blocked (proxy, old WebView): fall back to long-poll from the last seen version
+        pollRoomUpdates(roomId, currentRoom && currentRoom.version || 0);
     };
 }
 
+// Apply a room state; returns true once the room is completed or expired
+function handleRoomUpdate(room) {
+    currentRoom = room;
+    updateRoomUI(room);
+    
+    // Check if room is drawing
+    if (room.status === 'drawing') {
+        showDrawingScreen(room);
+    }
+    
+    // Check if room is completed
+    if (room.status === 'completed') {
+        showWinnerScreen(room);
+        return true;
+    }
+
+    // Waited too long for players: the backend closed the room and refunds the entry fee
+    if (room.status === 'expired') {
+        showScreen('menu-screen');
+        showError('Not enough players joined in time. Your Stars will be refunded.');
+        return true;
+    }
+    return false;
+}
+
+// Long-poll: the backend answers as soon as the room version is newer than `since`, or 304 on timeout
+async function pollRoomUpdates(roomId, since) {
+    pollingRoomId = roomId;
+    
+    while (pollingRoomId === roomId) {
+        try {
+            const response = await fetch(`${API_BASE_URL}/api/room/${roomId}?since=${since}`);
+            if (pollingRoomId !== roomId) {
+                return;
+            }
+            if (response.status === 304) {
+                continue;
+            }
+            if (!response.ok) {
+                showError('Room not found');
+                return;
+            }
+            
+            const room = await response.json();
+            since = room.version;
+            if (handleRoomUpdate(room)) {
+                return;
+            }
+        } catch (error) {
+            console.error('Room polling error:', error);
+            await new Promise(resolve => setTimeout(resolve, 3000));
+        }
+    }
+}
+
 // Update room UI
 function updateRoomUI(room) {
     // Update participants count
@@ -398,6 +457,7 @@ document.getElementById('back-to-menu').addEventListener('click', () => {
     if (eventSource) {
         eventSource.close();
     }
+    pollingRoomId = null;
     showScreen('menu-screen');
 });
 
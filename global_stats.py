@@ -0,0 +1,142 @@
+"""
+Глобальная статистика: комнаты, пул, участники, сборы админа
+
+Счетчики хранятся в памяти и продвигаются по хвосту ledger. Таблицы rooms,
+room_participants и transactions только дописываются, а писатель в SQLite
+один, поэтому rowid растут в порядке фиксации: строки с rowid больше
+последнего учтенного — ровно то, что еще не посчитано. Раз в
+CHECKPOINT_INTERVAL счетчики вместе с этими rowid сохраняются в
+stats_checkpoint; после перезапуска достаточно прочитать снимок и дочитать
+хвост, а не пересчитывать всю историю.
+"""
+import os
+import time
+import logging
+from threading import Lock
+from typing import Dict, Optional
+import db
+import metrics
+from db import DB_PATH
+
+logger = logging.getLogger(__name__)
+
+STATS_MAX_AGE = float(os.environ.get('STATS_MAX_AGE', 5))  # сек, как долго отдавать счетчики без дочитывания
+CHECKPOINT_INTERVAL = float(os.environ.get('STATS_CHECKPOINT_INTERVAL', 60))  # сек
+
+COUNTERS = ('total_rooms', 'completed_rooms', 'total_pool', 'total_participants', 'total_admin_fees')
+WATERMARKS = ('rooms_rowid', 'participants_rowid', 'transactions_rowid')
+
+refresh_latency = metrics.latency('stats.refresh_seconds')
+checkpoints_total = metrics.counter('stats.checkpoints_total')
+
+
+class GlobalStats:
+    """
+    Счетчики глобальной статистики одной базы
+
+    snapshot() отдает значения из памяти; хвост ledger дочитывается, если
+    счетчики старше max_age или этот процесс только что писал в ledger
+    (mark_stale). Дочитывание — поиск по диапазону rowid, без полного прохода.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_age: float = STATS_MAX_AGE,
+                 checkpoint_interval: float = CHECKPOINT_INTERVAL):
+        self.db_path = db_path or DB_PATH
+        self.max_age = max_age
+        self.checkpoint_interval = checkpoint_interval
+        self._lock = Lock()
+        self._state: Optional[Dict[str, int]] = None
+        self._stale = True
+        self._refreshed_at = 0.0
+        self._checkpointed_at = 0.0
+
+    def mark_stale(self) -> None:
+        """В ledger записаны новые строки: следующее чтение дочитает хвост"""
+        self._stale = True
+
+    def snapshot(self) -> Dict:
+        """Текущие счетчики и время, на которое они посчитаны (as_of)"""
+        with self._lock:
+            if self._state is None or self._stale or time.time() - self._refreshed_at >= self.max_age:
+                self._refresh()
+            stats = {name: self._state[name] for name in COUNTERS}
+            stats['as_of'] = self._refreshed_at
+            return stats
+
+    def checkpoint(self) -> None:
+        """Сохранить счетчики сейчас (завершение процесса, тесты)"""
+        with self._lock:
+            if self._state is None:
+                self._refresh()
+            self._save_checkpoint()
+
+    def reset(self) -> None:
+        """Забыть счетчики: следующее чтение начнет с сохраненного снимка"""
+        with self._lock:
+            self._state = None
+
+    def _load_checkpoint(self, conn) -> Dict[str, int]:
+        row = conn.execute(f'''SELECT {', '.join(COUNTERS + WATERMARKS)}
+                               FROM stats_checkpoint WHERE id = 1''').fetchone()
+        return dict(zip(COUNTERS + WATERMARKS, row or (0,) * len(COUNTERS + WATERMARKS)))
+
+    def _refresh(self) -> None:
+        # Сбрасываем до чтения: запись, зафиксированная во время чтения, снова пометит счетчики
+        self._stale = False
+        with refresh_latency.time():
+            # Одна read-транзакция: все три хвоста из одного снимка базы
+            with db.transaction(self.db_path, immediate=False) as conn:
+                state = dict(self._state) if self._state is not None else self._load_checkpoint(conn)
+
+                rooms, last_room = conn.execute('SELECT COUNT(*), MAX(rowid) FROM rooms WHERE rowid > ?',
+                                                (state['rooms_rowid'],)).fetchone()
+                joins, last_join = conn.execute('''SELECT COUNT(*), MAX(rowid) FROM room_participants
+                                                   WHERE rowid > ?''', (state['participants_rowid'],)).fetchone()
+                # Каждый розыгрыш пишет ровно один admin_fee; выплата + сбор = пул комнаты
+                draws, fees, pool, last_tx = conn.execute('''
+                    SELECT COALESCE(SUM(transaction_type = 'admin_fee'), 0),
+                           COALESCE(SUM(CASE WHEN transaction_type = 'admin_fee' THEN amount END), 0),
+                           COALESCE(SUM(CASE WHEN transaction_type IN ('winner_payout', 'admin_fee')
+                                             THEN amount END), 0),
+                           MAX(rowid)
+                    FROM transactions WHERE rowid > ?''', (state['transactions_rowid'],)).fetchone()
+
+        state['total_rooms'] += rooms
+        state['total_participants'] += joins
+        state['completed_rooms'] += draws
+        state['total_pool'] += pool
+        state['total_admin_fees'] += fees
+        state['rooms_rowid'] = last_room or state['rooms_rowid']
+        state['participants_rowid'] = last_join or state['participants_rowid']
+        state['transactions_rowid'] = last_tx or state['transactions_rowid']
+
+        self._state = state
+        self._refreshed_at = time.time()
+        if self._refreshed_at - self._checkpointed_at >= self.checkpoint_interval:
+            self._save_checkpoint()
+
+    def _save_checkpoint(self) -> None:
+        try:
+            db.execute(f'''INSERT OR REPLACE INTO stats_checkpoint (id, {', '.join(COUNTERS + WATERMARKS)}, saved_at)
+                           VALUES (1, {', '.join('?' * len(COUNTERS + WATERMARKS))}, ?)''',
+                       [self._state[name] for name in COUNTERS + WATERMARKS] + [time.time()], self.db_path)
+        except Exception as e:
+            # Снимок — только ускорение перезапуска, чтение статистики от него не зависит
+            logger.error(f"Failed to save stats checkpoint: {e}")
+            return
+        self._checkpointed_at = time.time()
+        checkpoints_total.inc()
+
+
+_services: Dict[str, GlobalStats] = {}
+_services_lock = Lock()
+
+
+def get_global_stats(db_path: Optional[str] = None) -> GlobalStats:
+    """Общие счетчики для базы db_path"""
+    db_path = db_path or DB_PATH
+    with _services_lock:
+        service = _services.get(db_path)
+        if service is None:
+            service = _services[db_path] = GlobalStats(db_path)
+        return service
@@ -0,0 +1,161 @@
+import time
+import sqlite3
+import logging
+from concurrent.futures import Future
+from threading import Condition, Lock, Thread
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import db
+import metrics
+from db import DB_PATH
+
+logger = logging.getLogger(__name__)
+
+# Пачка набирается сама, пока идет предыдущий COMMIT; окно — дополнительное
+# ожидание попутчиков после первой задачи (см. benchmarks/bench_group_commit.py)
+BATCH_WINDOW = 0.0
+MAX_BATCH = 256
+COMMIT_SYNCHRONOUS = 'FULL'  # Фиксация пачки должна переживать отключение питания
+
+commit_latency = metrics.latency('db.group_commit_seconds')
+batch_sizes = metrics.latency('db.group_commit_batch_size')
+failed_jobs = metrics.counter('db.group_commit_failed_jobs_total')
+
+Job = Callable[[sqlite3.Connection], Any]
+
+
+class GroupCommitWriter:
+    """
+    Поток записи с групповой фиксацией
+
+    submit(fn) ставит единицу работы в очередь и возвращает Future. Поток
+    записи собирает задачи, пришедшие в течение batch_window, и выполняет их
+    в одной транзакции — один COMMIT (один fsync) на всю пачку. Каждая задача
+    идет в своем SAVEPOINT: ошибка откатывает только ее. Future завершается
+    после COMMIT, то есть когда запись уже надежно на диске.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, batch_window: float = BATCH_WINDOW,
+                 max_batch: int = MAX_BATCH, synchronous: str = COMMIT_SYNCHRONOUS):
+        self.db_path = db_path
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.synchronous = synchronous
+        self.running = False
+        self._cond = Condition()
+        self._jobs: List[Tuple[Future, Job]] = []
+        self._thread: Optional[Thread] = None
+
+    def start(self) -> 'GroupCommitWriter':
+        with self._cond:
+            if self.running:
+                return self
+            self.running = True
+        self._thread = Thread(target=self._run, name='group-commit', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Остановить поток (задачи в очереди дописываются)"""
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def submit(self, fn: Job) -> Future:
+        """Выполнить fn(conn) в ближайшей пачке; результат — после COMMIT"""
+        if not self.running:
+            self.start()
+        future = Future()
+        with self._cond:
+            self._jobs.append((future, fn))
+            self._cond.notify()
+        return future
+
+    def _next_batch(self) -> List[Tuple[Future, Job]]:
+        with self._cond:
+            while not self._jobs:
+                if not self.running:
+                    return []
+                self._cond.wait()
+
+            # Ждем попутчиков, пока не истечет окно или не наберется полная пачка
+            deadline = time.monotonic() + self.batch_window
+            while self.running and len(self._jobs) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch, self._jobs = self._jobs[:self.max_batch], self._jobs[self.max_batch:]
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            try:
+                self._commit(batch)
+            except Exception as e:
+                logger.error(f"Group commit of {len(batch)} jobs failed: {e}")
+                for future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _commit(self, batch: List[Tuple[Future, Job]]) -> None:
+        outcomes: Dict[int, Tuple[bool, Any]] = {}
+        with commit_latency.time(), db.connection(self.db_path) as conn:
+            conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for index, (future, fn) in enumerate(batch):
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    conn.execute('SAVEPOINT job')
+                    try:
+                        outcomes[index] = (True, fn(conn))
+                        conn.execute('RELEASE job')
+                    except Exception as e:
+                        conn.execute('ROLLBACK TO job')
+                        conn.execute('RELEASE job')
+                        failed_jobs.inc()
+                        outcomes[index] = (False, e)
+                conn.commit()
+            except BaseException:
+                # В том числе неудачный COMMIT: без отката соединение осталось бы в транзакции,
+                # и BEGIN каждой следующей пачки падал бы. Futures пачки получат ошибку в _run
+                conn.rollback()
+                raise
+        batch_sizes.observe(len(batch))
+
+        for index, (ok, value) in outcomes.items():
+            future = batch[index][0]
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+_writers: Dict[str, GroupCommitWriter] = {}
+_writers_lock = Lock()
+
+
+def get_writer(db_path: Optional[str] = None) -> GroupCommitWriter:
+    """Общий поток записи для базы db_path (запускается при первой задаче)"""
+    db_path = db_path or DB_PATH
+    with _writers_lock:
+        writer = _writers.get(db_path)
+        if writer is None:
+            writer = _writers[db_path] = GroupCommitWriter(db_path)
+        return writer
+
+
+def stop_all() -> None:
+    """Остановить все потоки записи (тесты, завершение процесса)"""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.stop()
@@ -0,0 +1,24 @@
+"""
+Настройки gunicorn
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Несколько воркеров — только с ROOM_STORE=sqlite: комнаты в памяти у
+каждого процесса свои. Потоки приложения (планировщик, сроки комнат,
+обработчики обновлений, сервер потоков на STREAM_PORT) не переживают
+fork, поэтому каждый воркер запускает их сам после загрузки приложения.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 4 if os.environ.get('ROOM_STORE') == 'sqlite' else 1))
+
+
+def post_worker_init(worker):
+    import app
+
+    # Миграции защищены BEGIN IMMEDIATE: воркеры могут применять их одновременно
+    app.init_db()
+    if worker.age == 1:
+        app.setup_webhook()  # Один раз на запуск, а не в каждом воркере
+    app.start_worker()
@@ -0,0 +1,112 @@
+import time
+import zlib
+import weakref
+from threading import Lock
+from typing import Dict, Iterable
+import metrics
+
+# Локи с замерами ожидания и удержания. Итоги (число захватов, сколько из них
+# ждали, суммарное и максимальное время) копятся в самом локе, пока он
+# захвачен, и дополнительной синхронизации не требуют; распределения
+# locks.<name>.wait_seconds / hold_seconds пишутся по каждому SAMPLE_EVERY-му
+# захвату, чтобы общий LatencyStats не стал новой точкой конкуренции.
+
+SAMPLE_EVERY = 16
+
+_now = time.perf_counter
+
+_groups: Dict[str, 'weakref.WeakSet[InstrumentedLock]'] = {}  # живые локи по имени
+_groups_lock = Lock()
+
+
+class InstrumentedLock:
+    """threading.Lock с учетом времени ожидания и удержания"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = Lock()
+        self._wait = metrics.latency(f'locks.{name}.wait_seconds')
+        self._hold = metrics.latency(f'locks.{name}.hold_seconds')
+        self._acquired_at = 0.0
+        self._waited = 0.0
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.hold_total = 0.0
+        self.hold_max = 0.0
+
+        with _groups_lock:
+            group = _groups.get(name)
+            if group is None:
+                group = _groups[name] = weakref.WeakSet()
+                metrics.gauge(f'locks.{name}', lambda: group_stats(name))
+            group.add(self)
+
+    def acquire(self) -> bool:
+        lock = self._lock
+        if lock.acquire(False):
+            self._waited = 0.0
+        else:
+            started = _now()
+            lock.acquire()
+            # Дальше — под собственным локом
+            waited = self._waited = _now() - started
+            self.contended += 1
+            self.wait_total += waited
+            if waited > self.wait_max:
+                self.wait_max = waited
+        self.acquisitions += 1
+        self._acquired_at = _now()
+        return True
+
+    def release(self, *exc) -> None:
+        held = _now() - self._acquired_at
+        self.hold_total += held
+        if held > self.hold_max:
+            self.hold_max = held
+        if self.acquisitions % SAMPLE_EVERY:
+            self._lock.release()
+            return
+
+        waited = self._waited
+        self._lock.release()
+        self._wait.observe(waited)
+        self._hold.observe(held)
+
+    # Без лишнего вызова: lock захватывается на каждое обращение к комнате
+    __enter__ = acquire
+    __exit__ = release
+
+
+class StripedLock:
+    """Фиксированный набор InstrumentedLock; ключ всегда попадает в один и тот же"""
+
+    def __init__(self, name: str, stripes: int):
+        self.stripes = [InstrumentedLock(name) for _ in range(stripes)]
+
+    def for_key(self, key: str) -> InstrumentedLock:
+        # crc32, а не hash(): номер полосы одинаков во всех процессах и запусках
+        return self.stripes[zlib.crc32(key.encode()) % len(self.stripes)]
+
+
+def group_stats(name: str) -> Dict[str, float]:
+    """Сумма по всем живым локам с таким именем (для /api/metrics)"""
+    with _groups_lock:
+        group = list(_groups.get(name, ()))
+    return summarize(group)
+
+
+def summarize(locks: Iterable[InstrumentedLock]) -> Dict[str, float]:
+    """Итоги ожидания и удержания по набору локов"""
+    locks = list(locks)
+    acquisitions = sum(lock.acquisitions for lock in locks)
+    return {
+        'locks': len(locks),
+        'acquisitions': acquisitions,
+        'contended': sum(lock.contended for lock in locks),
+        'wait_total': round(sum(lock.wait_total for lock in locks), 6),
+        'wait_max': round(max((lock.wait_max for lock in locks), default=0.0), 6),
+        'hold_avg': round(sum(lock.hold_total for lock in locks) / acquisitions, 9) if acquisitions else 0.0,
+        'hold_max': round(max((lock.hold_max for lock in locks), default=0.0), 6),
+    }
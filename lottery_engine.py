@@ -1,8 +1,13 @@
 import random
-import sqlite3
 import logging
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple, Union
+import db
+import user_stats
+from global_stats import COUNTERS, get_global_stats
+from room_model import FINISHED_STATUSES
+from room_store import RoomStore
+from db import DB_PATH
 
 logger = logging.getLogger(__name__)
 
@@ -10,194 +15,180 @@ WINNER_PERCENTAGE = 0.80
 ADMIN_PERCENTAGE = 0.20
 ADMIN_USERNAME = 'klimaz'
 
-def conduct_lottery(room_id: str, rooms: Dict, db_path: str = 'lottery.db') -> Optional[Dict]:
+def split_pool(total_pool: int) -> Tuple[int, int]:
+    """Доли пула (победителю, админу): доля победителя округляется вниз, остаток — админу"""
+    winner_amount = int(total_pool * WINNER_PERCENTAGE)
+    return winner_amount, total_pool - winner_amount
+
+def pick_winner(participants: List[Dict]) -> Dict:
+    """Случайный участник; каждое место с равной вероятностью"""
+    return random.choice(participants)
+
+def draw_winner(room_id: str, rooms: Dict) -> Optional[Dict]:
     """
-    Провести розыгрыш в комнате
-    Возвращает информацию о победителе
+    Выбрать победителя и перевести комнату в статус completed (только память)
+    Быстрая часть розыгрыша — выполняется под локом комнат.
+    Возвращает результат для record_lottery_result() и уведомлений.
     """
-    try:
-        if room_id not in rooms:
-            logger.error(f"Room {room_id} not found")
-            return None
-        
-        room = rooms[room_id]
-        
-        if room['status'] != 'drawing':
-            logger.warning(f"Room {room_id} is not in drawing status")
-            return None
-        
-        if len(room['participants']) == 0:
-            logger.error(f"Room {room_id} has no participants")
-            return None
-        
-        # Выбираем случайного победителя
-        winner = random.choice(room['participants'])
-        winner_user_id = winner['user_id']
-        
-        # Рассчитываем суммы
-        total_pool = room['total_pool']
-        winner_amount = int(total_pool * WINNER_PERCENTAGE)
-        admin_amount = total_pool - winner_amount
-        
-        logger.info(f"Lottery result for room {room_id}:")
-        logger.info(f"  Winner: {winner_user_id} ({winner.get('first_name', 'Unknown')})")
-        logger.info(f"  Total pool: {total_pool} Stars")
-        logger.info(f"  Winner gets: {winner_amount} Stars")
-        logger.info(f"  Admin gets: {admin_amount} Stars")
-        
-        # Обновляем комнату
-        room['status'] = 'completed'
-        room['winner'] = {
-            'user_id': winner_user_id,
-            'username': winner.get('username', ''),
-            'first_name': winner.get('first_name', ''),
-            'amount': winner_amount
-        }
-        room['completed_at'] = datetime.now().isoformat()
-        
-        # Сохраняем результат в БД
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
+    if room_id not in rooms:
+        logger.error(f"Room {room_id} not found")
+        return None
+    
+    room = rooms[room_id]
+    
+    if room['status'] != 'drawing':
+        logger.warning(f"Room {room_id} is not in drawing status")
+        return None
+    
+    if len(room['participants']) == 0:
+        logger.error(f"Room {room_id} has no participants")
+        return None
+    
+    # Выбираем случайного победителя
+    winner = pick_winner(room['participants'])
+    winner_user_id = winner['user_id']
+    
+    # Рассчитываем суммы
+    total_pool = room['total_pool']
+    winner_amount, admin_amount = split_pool(total_pool)
+    
+    logger.info(f"Lottery result for room {room_id}:")
+    logger.info(f"  Winner: {winner_user_id} ({winner.get('first_name', 'Unknown')})")
+    logger.info(f"  Total pool: {total_pool} Stars")
+    logger.info(f"  Winner gets: {winner_amount} Stars")
+    logger.info(f"  Admin gets: {admin_amount} Stars")
+    
+    # Обновляем комнату
+    room['status'] = 'completed'
+    room['winner'] = {
+        'user_id': winner_user_id,
+        'username': winner.get('username', ''),
+        'first_name': winner.get('first_name', ''),
+        'amount': winner_amount
+    }
+    room['completed_at'] = datetime.now().timestamp()
+    
+    return completed_result(room)
+
+def completed_result(room: Dict) -> Dict:
+    """Результат разыгранной комнаты для record_lottery_result() и уведомлений"""
+    winner_amount = room['winner']['amount']
+    return {
+        'room_id': room['room_id'],
+        'winner': room['winner'],
+        'total_pool': room['total_pool'],
+        'winner_amount': winner_amount,
+        'admin_amount': room['total_pool'] - winner_amount,
+        'participants': list(room['participants']),
+        'completed_at': datetime.fromtimestamp(room['completed_at']).isoformat(' ')
+    }
+
+def record_lottery_result(result: Dict, db_path: str = DB_PATH) -> bool:
+    """
+    Записать результат розыгрыша в БД одной транзакцией
+    Повторная запись (после потерянного ответа или другим процессом) ничего
+    не меняет и возвращает False.
+    """
+    room_id = result['room_id']
+    winner_user_id = result['winner']['user_id']
+    
+    with db.transaction(db_path) as c:
+        status = c.execute('SELECT status FROM rooms WHERE room_id = ?', (room_id,)).fetchone()
+        if status is not None and status[0] in FINISHED_STATUSES:
+            return False
         
         # Обновляем комнату
         c.execute('''UPDATE rooms 
                      SET status = ?, winner_user_id = ?, completed_at = ?
                      WHERE room_id = ?''',
-                  ('completed', winner_user_id, datetime.now(), room_id))
+                  ('completed', winner_user_id, result['completed_at'], room_id))
         
         # Записываем транзакции
         # Транзакция выигрыша
         c.execute('''INSERT INTO transactions 
                      (room_id, from_user_id, to_user_id, amount, transaction_type)
                      VALUES (?, ?, ?, ?, ?)''',
-                  (room_id, None, winner_user_id, winner_amount, 'winner_payout'))
+                  (room_id, None, winner_user_id, result['winner_amount'], 'winner_payout'))
         
         # Транзакция админу (записываем для аудита, реальная выплата отдельно)
         c.execute('''INSERT INTO transactions 
                      (room_id, from_user_id, to_user_id, amount, transaction_type)
                      VALUES (?, ?, ?, ?, ?)''',
-                  (room_id, None, None, admin_amount, 'admin_fee'))
-        
-        conn.commit()
-        conn.close()
+                  (room_id, None, None, result['admin_amount'], 'admin_fee'))
+
+        user_stats.record_win(c, winner_user_id, result['winner_amount'])
+        user_stats.record_completed_game(c, [p['user_id'] for p in result['participants']], winner_user_id)
+    
+    get_global_stats(db_path).mark_stale()
+    return True
+
+def conduct_lottery(room_id: str, rooms: Union[Dict, RoomStore], db_path: str = DB_PATH) -> Optional[Dict]:
+    """
+    Провести розыгрыш в комнате (rooms — словарь комнат или RoomStore)
+    Возвращает информацию о победителе
+    """
+    try:
+        if isinstance(rooms, RoomStore):
+            result = rooms.transition(room_id, lambda room: draw_winner(room_id, {room_id: room}))
+        else:
+            result = draw_winner(room_id, rooms)
+        if result is None:
+            return None
         
-        return {
-            'room_id': room_id,
-            'winner': room['winner'],
-            'total_pool': total_pool,
-            'winner_amount': winner_amount,
-            'admin_amount': admin_amount,
-            'participants': room['participants']
-        }
+        # Сохраняем результат в БД
+        record_lottery_result(result, db_path)
+        return result
     
     except Exception as e:
         logger.error(f"Error conducting lottery for room {room_id}: {e}")
         return None
 
-def get_room_statistics(db_path: str = 'lottery.db') -> Dict:
-    """Получить общую статистику по всем комнатам"""
+def get_room_statistics(db_path: str = DB_PATH) -> Dict:
+    """Получить общую статистику по всем комнатам (счетчики global_stats)"""
     try:
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
-        
-        # Общее количество комнат
-        c.execute('SELECT COUNT(*) FROM rooms')
-        total_rooms = c.fetchone()[0]
-        
-        # Завершенные комнаты
-        c.execute("SELECT COUNT(*) FROM rooms WHERE status = 'completed'")
-        completed_rooms = c.fetchone()[0]
-        
-        # Общий пул
-        c.execute('SELECT SUM(total_pool) FROM rooms WHERE status = "completed"')
-        total_pool = c.fetchone()[0] or 0
-        
-        # Общее количество участников
-        c.execute('SELECT COUNT(*) FROM room_participants')
-        total_participants = c.fetchone()[0]
-        
-        # Общая сумма админских сборов
-        c.execute('''SELECT SUM(amount) FROM transactions 
-                     WHERE transaction_type = "admin_fee"''')
-        total_admin_fees = c.fetchone()[0] or 0
-        
-        conn.close()
-        
-        return {
-            'total_rooms': total_rooms,
-            'completed_rooms': completed_rooms,
-            'total_pool': total_pool,
-            'total_participants': total_participants,
-            'total_admin_fees': total_admin_fees
-        }
+        stats = get_global_stats(db_path).snapshot()
+        return {name: stats[name] for name in COUNTERS}
     
     except Exception as e:
         logger.error(f"Error getting room statistics: {e}")
         return {}
 
-def get_user_statistics(user_id: int, db_path: str = 'lottery.db') -> Dict:
-    """Получить статистику пользователя"""
+def get_user_statistics(user_id: int, db_path: str = DB_PATH) -> Dict:
+    """Получить статистику пользователя (из user_stats)"""
     try:
-        conn = sqlite3.connect(db_path)
-        c = conn.cursor()
-        
-        # Количество игр
-        c.execute('SELECT COUNT(*) FROM room_participants WHERE user_id = ?', (user_id,))
-        total_games = c.fetchone()[0]
-        
-        # Количество побед
-        c.execute('SELECT COUNT(*) FROM rooms WHERE winner_user_id = ?', (user_id,))
-        total_wins = c.fetchone()[0]
-        
-        # Общая сумма выигрышей
-        c.execute('''SELECT SUM(amount) FROM transactions 
-                     WHERE to_user_id = ? AND transaction_type = "winner_payout"''',
-                  (user_id,))
-        total_winnings = c.fetchone()[0] or 0
-        
-        # Общая сумма потраченных Stars
-        c.execute('''SELECT SUM(amount) FROM payments 
-                     WHERE user_id = ? AND status = "completed"''',
-                  (user_id,))
-        total_spent = c.fetchone()[0] or 0
-        
-        conn.close()
-        
-        win_rate = (total_wins / total_games * 100) if total_games > 0 else 0
-        
-        return {
-            'total_games': total_games,
-            'total_wins': total_wins,
-            'win_rate': round(win_rate, 2),
-            'total_winnings': total_winnings,
-            'total_spent': total_spent,
-            'net_profit': total_winnings - total_spent
-        }
+        return user_stats.get_user_stats(user_id, db_path)
     
     except Exception as e:
         logger.error(f"Error getting user statistics for {user_id}: {e}")
         return {}
 
-def cleanup_old_rooms(rooms: Dict, max_age_hours: int = 24):
-    """Очистить старые незавершенные комнаты"""
-    try:
-        from datetime import datetime, timedelta
-        
-        cutoff_time = datetime.now() - timedelta(hours=max_age_hours)
-        rooms_to_remove = []
-        
-        for room_id, room in rooms.items():
-            if room['status'] != 'completed':
-                created_at = datetime.fromisoformat(room['created_at'])
-                if created_at < cutoff_time:
-                    rooms_to_remove.append(room_id)
-        
-        for room_id in rooms_to_remove:
-            logger.info(f"Removing old room: {room_id}")
-            del rooms[room_id]
-        
-        return len(rooms_to_remove)
+def get_user_history(user_id: int, before_id: Optional[int] = None, limit: int = 50,
+                     db_path: str = DB_PATH) -> List[Tuple[int, Dict]]:
+    """
+    Участия пользователя от новых к старым: [(id участия, запись)]
+    Keyset по room_participants.id: страница — диапазон покрывающего индекса
+    (user_id, id), комната — по первичному ключу, выплата — по покрывающему
+    индексу, поэтому стоимость страницы не зависит от длины истории.
+    """
+    rows = db.fetch_all(f'''
+        SELECT rp.id, rp.room_id, rp.joined_at, ro.entry_fee, ro.status, ro.total_pool,
+               ro.winner_user_id, ro.completed_at, t.amount
+        FROM room_participants rp
+        JOIN rooms ro ON ro.room_id = rp.room_id
+        LEFT JOIN transactions t ON t.room_id = rp.room_id AND t.transaction_type = 'winner_payout'
+                                AND t.to_user_id = rp.user_id
+        WHERE rp.user_id = ? {'AND rp.id < ?' if before_id is not None else ''}
+        ORDER BY rp.id DESC
+        LIMIT ?
+    ''', (user_id, *([before_id] if before_id is not None else []), limit), db_path)
     
-    except Exception as e:
-        logger.error(f"Error cleaning up old rooms: {e}")
-        return 0
+    return [(row[0], {
+        'room_id': row[1],
+        'joined_at': row[2],
+        'entry_fee': row[3],
+        'status': row[4],
+        'total_pool': row[5],
+        'won': row[6] == user_id,
+        'payout': row[8] or 0,
+        'completed_at': row[7]
+    }) for row in rows]
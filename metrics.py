@@ -0,0 +1,126 @@
+import time
+import math
+from collections import deque
+from threading import Lock
+from typing import Callable, Dict, Optional
+
+# Простые потокобезопасные метрики процесса. Снимок отдается через /api/metrics;
+# при переходе на Prometheus достаточно заменить реализацию этого модуля.
+
+
+class Counter:
+    """Монотонный счетчик"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    """Текущее значение (задается явно или вычисляется функцией)"""
+
+    def __init__(self, func: Optional[Callable[[], float]] = None):
+        self.func = func
+        self.value = 0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def snapshot(self):
+        return self.func() if self.func is not None else self.value
+
+
+class LatencyStats:
+    """
+    Распределение длительностей в секундах
+    count/sum/max считаются за все время, перцентили — по последним window замерам.
+    """
+
+    def __init__(self, window: int = 1024):
+        self._lock = Lock()
+        self._recent = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._recent.append(seconds)
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def time(self) -> '_Timer':
+        """Контекстный менеджер: замерить длительность блока"""
+        return _Timer(self)
+
+    def percentile(self, q: float) -> float:
+        with self._lock:
+            values = sorted(self._recent)
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))]
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'avg': round(self.total / self.count, 6) if self.count else 0.0,
+            'p50': round(self.percentile(0.50), 6),
+            'p95': round(self.percentile(0.95), 6),
+            'p99': round(self.percentile(0.99), 6),
+            'max': round(self.max, 6),
+        }
+
+
+class _Timer:
+    def __init__(self, stats: LatencyStats):
+        self.stats = stats
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.observe(time.perf_counter() - self.started)
+
+
+_registry: Dict[str, object] = {}
+_registry_lock = Lock()
+
+
+def _get_or_create(name: str, factory):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = factory()
+        return metric
+
+
+def counter(name: str) -> Counter:
+    return _get_or_create(name, Counter)
+
+
+def gauge(name: str, func: Optional[Callable[[], float]] = None) -> Gauge:
+    metric = _get_or_create(name, Gauge)
+    if func is not None:
+        metric.func = func
+    return metric
+
+
+def latency(name: str) -> LatencyStats:
+    return _get_or_create(name, LatencyStats)
+
+
+def snapshot() -> Dict[str, object]:
+    """Значения всех метрик"""
+    with _registry_lock:
+        items = sorted(_registry.items())
+    return {name: metric.snapshot() for name, metric in items}
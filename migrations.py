@@ -0,0 +1,265 @@
+import logging
+import sqlite3
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Нумерованные миграции схемы: (версия, описание, список SQL-выражений)
+# Применяются по порядку, номер примененной версии хранится в schema_version.
+# Уже выпущенные миграции не редактируются — изменения схемы только новыми номерами.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = []
+
+
+def migration(version: int, description: str, statements: List[str]) -> None:
+    """Зарегистрировать миграцию"""
+    if MIGRATIONS and version != MIGRATIONS[-1][0] + 1:
+        raise ValueError(f"Migration {version} is out of order")
+    MIGRATIONS.append((version, description, statements))
+
+
+migration(1, 'initial schema', [
+    # Таблица пользователей
+    '''CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''',
+    # Таблица платежей
+    '''CREATE TABLE IF NOT EXISTS payments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        amount INTEGER,
+        telegram_payment_charge_id TEXT UNIQUE,
+        status TEXT,
+        room_id TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    )''',
+    # Таблица комнат
+    '''CREATE TABLE IF NOT EXISTS rooms (
+        room_id TEXT PRIMARY KEY,
+        entry_fee INTEGER,
+        status TEXT,
+        winner_user_id INTEGER,
+        total_pool INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        completed_at TIMESTAMP,
+        FOREIGN KEY (winner_user_id) REFERENCES users(user_id)
+    )''',
+    # Таблица участников комнат
+    '''CREATE TABLE IF NOT EXISTS room_participants (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        room_id TEXT,
+        user_id INTEGER,
+        payment_id INTEGER,
+        joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (room_id) REFERENCES rooms(room_id),
+        FOREIGN KEY (user_id) REFERENCES users(user_id),
+        FOREIGN KEY (payment_id) REFERENCES payments(id)
+    )''',
+    # Таблица транзакций (для аудита)
+    '''CREATE TABLE IF NOT EXISTS transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        room_id TEXT,
+        from_user_id INTEGER,
+        to_user_id INTEGER,
+        amount INTEGER,
+        transaction_type TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (room_id) REFERENCES rooms(room_id)
+    )''',
+    # Таблица рефералов
+    '''CREATE TABLE IF NOT EXISTS referrals (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        referrer_user_id INTEGER,
+        referred_user_id INTEGER UNIQUE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (referrer_user_id) REFERENCES users(user_id),
+        FOREIGN KEY (referred_user_id) REFERENCES users(user_id)
+    )''',
+    # Таблица реферальных бонусов
+    '''CREATE TABLE IF NOT EXISTS referral_bonuses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        referrer_user_id INTEGER,
+        referred_user_id INTEGER,
+        bonus_amount INTEGER,
+        bonus_type TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (referrer_user_id) REFERENCES users(user_id),
+        FOREIGN KEY (referred_user_id) REFERENCES users(user_id)
+    )''',
+])
+
+migration(2, 'hot path indexes', [
+    # Статистика пользователя: COUNT по играм, победам, выигрышам и тратам
+    'CREATE INDEX IF NOT EXISTS idx_room_participants_user ON room_participants(user_id, room_id)',
+    'CREATE INDEX IF NOT EXISTS idx_room_participants_room ON room_participants(room_id)',
+    'CREATE INDEX IF NOT EXISTS idx_rooms_winner ON rooms(winner_user_id)',
+    'CREATE INDEX IF NOT EXISTS idx_rooms_status_pool ON rooms(status, total_pool)',
+    'CREATE INDEX IF NOT EXISTS idx_transactions_to_user_type ON transactions(to_user_id, transaction_type, amount)',
+    'CREATE INDEX IF NOT EXISTS idx_transactions_type_amount ON transactions(transaction_type, amount)',
+    'CREATE INDEX IF NOT EXISTS idx_payments_user_status ON payments(user_id, status, amount)',
+    # Рефералы: выборка по рефереру в порядке created_at и суммы бонусов
+    'CREATE INDEX IF NOT EXISTS idx_referrals_referrer_created ON referrals(referrer_user_id, created_at)',
+    'CREATE INDEX IF NOT EXISTS idx_referral_bonuses_referrer_type '
+    'ON referral_bonuses(referrer_user_id, bonus_type, bonus_amount)',
+])
+
+migration(3, 'webhook update log', [
+    # Принятые обновления вебхука: дедупликация по update_id и восстановление после падения
+    '''CREATE TABLE IF NOT EXISTS webhook_updates (
+        update_id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        error TEXT,
+        received_at REAL NOT NULL,
+        processed_at REAL
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_webhook_updates_status_received ON webhook_updates(status, received_at)',
+])
+
+migration(4, 'per-user statistics', [
+    # Счетчики пользователя, обновляются вместе с payments/room_participants/rooms/transactions.
+    # Данные до этой миграции переносятся командой `python user_stats.py backfill`
+    '''CREATE TABLE IF NOT EXISTS user_stats (
+        user_id INTEGER PRIMARY KEY,
+        total_games INTEGER NOT NULL DEFAULT 0,
+        total_wins INTEGER NOT NULL DEFAULT 0,
+        total_winnings INTEGER NOT NULL DEFAULT 0,
+        total_spent INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''',
+])
+
+migration(5, 'global statistics checkpoint', [
+    # Снимок глобальных счетчиков и rowid последних учтенных строк ledger (одна строка)
+    '''CREATE TABLE IF NOT EXISTS stats_checkpoint (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        total_rooms INTEGER NOT NULL,
+        completed_rooms INTEGER NOT NULL,
+        total_pool INTEGER NOT NULL,
+        total_participants INTEGER NOT NULL,
+        total_admin_fees INTEGER NOT NULL,
+        rooms_rowid INTEGER NOT NULL,
+        participants_rowid INTEGER NOT NULL,
+        transactions_rowid INTEGER NOT NULL,
+        saved_at REAL NOT NULL
+    )''',
+])
+
+migration(6, 'referral activity rollup', [
+    # Активность приглашенного (завершенные игры и победы) прямо в строке реферала
+    'ALTER TABLE referrals ADD COLUMN games_played INTEGER NOT NULL DEFAULT 0',
+    'ALTER TABLE referrals ADD COLUMN wins INTEGER NOT NULL DEFAULT 0',
+    '''UPDATE referrals SET
+        games_played = (SELECT COUNT(*) FROM room_participants rp JOIN rooms ro ON ro.room_id = rp.room_id
+                        WHERE rp.user_id = referrals.referred_user_id AND ro.status = 'completed'),
+        wins = (SELECT COUNT(*) FROM rooms WHERE winner_user_id = referrals.referred_user_id)''',
+    # Число приглашенных у реферера
+    'ALTER TABLE user_stats ADD COLUMN total_referrals INTEGER NOT NULL DEFAULT 0',
+    '''INSERT INTO user_stats (user_id, total_referrals)
+        SELECT referrer_user_id, COUNT(*) FROM referrals
+        WHERE referrer_user_id IS NOT NULL GROUP BY referrer_user_id
+        ON CONFLICT(user_id) DO UPDATE SET total_referrals = excluded.total_referrals''',
+])
+
+migration(7, 'game history indexes', [
+    # История игр: участия пользователя по убыванию id и выплата комнаты без обращения к таблицам
+    # (комната ищется по первичному ключу)
+    'CREATE INDEX IF NOT EXISTS idx_room_participants_user_history ON room_participants(user_id, id, room_id, joined_at)',
+    'CREATE INDEX IF NOT EXISTS idx_transactions_room_type ON transactions(room_id, transaction_type, to_user_id, amount)',
+])
+
+migration(8, 'shared room state', [
+    # Состояние комнат для SQLiteRoomStore (общие комнаты для нескольких воркеров)
+    '''CREATE TABLE IF NOT EXISTS room_state (
+        room_id TEXT PRIMARY KEY,
+        entry_fee INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        seats INTEGER NOT NULL DEFAULT 0,
+        data TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        seq INTEGER NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_room_state_open ON room_state(status, entry_fee, created_at)',
+    'CREATE INDEX IF NOT EXISTS idx_room_state_seq ON room_state(seq)',
+    # Незавершенная комната пользователя
+    '''CREATE TABLE IF NOT EXISTS room_members (
+        user_id INTEGER PRIMARY KEY,
+        room_id TEXT NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_room_members_room ON room_members(room_id)',
+    # Номер последнего изменения комнат: по нему воркеры находят чужие изменения
+    '''CREATE TABLE IF NOT EXISTS room_state_seq (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        value INTEGER NOT NULL
+    )''',
+    'INSERT OR IGNORE INTO room_state_seq (id, value) VALUES (1, 0)',
+])
+
+migration(9, 'pending refunds', [
+    # Платежи закрытых по возрасту комнат, которые еще не вернули (см. refunds.py)
+    "CREATE INDEX IF NOT EXISTS idx_payments_refund_pending ON payments(id) WHERE status = 'refund_pending'",
+])
+
+migration(10, 'webhook update leases', [
+    # Обновление в обработке принадлежит одному процессу до lease_until (см. update_pipeline.py)
+    'ALTER TABLE webhook_updates ADD COLUMN owner TEXT',
+    'ALTER TABLE webhook_updates ADD COLUMN lease_until REAL',
+])
+
+migration(11, 'webhook update retries', [
+    # Неудачная обработка повторяется не раньше retry_at, после UPDATE_ATTEMPTS попыток — failed
+    'ALTER TABLE webhook_updates ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0',
+    'ALTER TABLE webhook_updates ADD COLUMN retry_at REAL',
+])
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    """Версия схемы базы данных (0 — миграции не применялись)"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Применить все недостающие миграции
+    Каждая миграция выполняется в своей транзакции; BEGIN IMMEDIATE
+    не дает двум процессам применить одну и ту же миграцию одновременно.
+    Возвращает итоговую версию схемы.
+    """
+    version = current_version(conn)
+    if version >= MIGRATIONS[-1][0]:
+        return version
+
+    for number, description, statements in MIGRATIONS:
+        if number <= version:
+            continue
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Другой процесс мог успеть применить миграцию, пока мы ждали блокировку
+            if current_version(conn) >= number:
+                conn.rollback()
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                         (number, description))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        logger.info(f"Applied migration {number}: {description}")
+        version = number
+
+    return version
@@ -0,0 +1,237 @@
+import time
+import heapq
+import random
+import logging
+import itertools
+from threading import Condition, Lock, Thread
+from typing import Callable, Dict, List, Optional, Tuple
+
+import metrics
+from telegram_client import TelegramError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Bot API: ~30 сообщений в секунду на бота, ~1 сообщение в секунду в один чат
+GLOBAL_RATE = 30
+PER_CHAT_INTERVAL = 1.0
+QUEUE_SIZE = 10000
+SENDER_THREADS = 4
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 0.5   # Секунд, удваивается с каждой попыткой
+
+send_latency = metrics.latency('notifications.send_latency_seconds')
+delivery_latency = metrics.latency('notifications.delivery_latency_seconds')
+sent_total = metrics.counter('notifications.sent_total')
+failed_total = metrics.counter('notifications.failed_total')
+dropped_total = metrics.counter('notifications.dropped_total')
+retried_total = metrics.counter('notifications.retried_total')
+rate_limited_total = metrics.counter('notifications.rate_limited_total')
+
+
+class _Job:
+    __slots__ = ('chat_id', 'payload', 'created', 'attempts')
+
+    def __init__(self, chat_id, payload: Dict):
+        self.chat_id = chat_id
+        self.payload = payload
+        self.created = time.monotonic()
+        self.attempts = 0
+
+
+class TokenBucket:
+    """Глобальный лимит отправки: rate токенов в секунду, запас до burst"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = Lock()
+
+    def reserve(self) -> float:
+        """Занять токен; вернуть, сколько секунд нужно подождать до отправки"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            return max(wait, self.paused_until - now)
+
+    def pause(self, seconds: float) -> None:
+        """Приостановить отправку (Telegram вернул 429 retry_after)"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class NotificationDispatcher:
+    """
+    Асинхронная отправка уведомлений с учетом лимитов Telegram
+
+    Сообщения кладутся в ограниченную очередь (submit не блокирует) и
+    отправляются пулом потоков. Очередь — куча по времени готовности, поэтому
+    в ней же ждут сообщения, отложенные из-за лимита на чат, retry_after или
+    backoff после временной ошибки.
+
+    send(payload) выполняет sendMessage и поднимает исключения telegram_client.
+    """
+
+    def __init__(self, send: Callable[[Dict], object], workers: int = SENDER_THREADS,
+                 queue_size: int = QUEUE_SIZE, global_rate: float = GLOBAL_RATE,
+                 per_chat_interval: float = PER_CHAT_INTERVAL, max_attempts: int = MAX_ATTEMPTS,
+                 backoff_base: float = BACKOFF_BASE):
+        self.send = send
+        self.workers = workers
+        self.queue_size = queue_size
+        self.per_chat_interval = per_chat_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.bucket = TokenBucket(global_rate)
+        self.running = False
+
+        self._cond = Condition()
+        self._heap: List[Tuple[float, int, _Job]] = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._next_chat_slot: Dict[object, float] = {}
+        self._threads: List[Thread] = []
+        metrics.gauge('notifications.queue_depth', self.depth)
+
+    def start(self) -> 'NotificationDispatcher':
+        with self._cond:
+            if self.running:
+                return self
+            self.running = True
+        self._threads = [Thread(target=self._worker, name=f'notifier-{i}', daemon=True)
+                         for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Notification dispatcher started with {self.workers} senders")
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Остановить отправителей (неотправленные сообщения остаются в очереди)"""
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def depth(self) -> int:
+        """Сообщений в очереди (включая отложенные)"""
+        return len(self._heap)
+
+    def submit(self, chat_id, text: str, reply_markup: Optional[Dict] = None,
+               parse_mode: Optional[str] = 'HTML') -> bool:
+        """Поставить сообщение в очередь; False — очередь переполнена"""
+        payload = {'chat_id': chat_id, 'text': text}
+        if parse_mode:
+            payload['parse_mode'] = parse_mode
+        if reply_markup:
+            payload['reply_markup'] = reply_markup
+
+        with self._cond:
+            if len(self._heap) >= self.queue_size:
+                dropped_total.inc()
+                logger.error(f"Notification queue full, dropping message to {chat_id}")
+                return False
+            self._push(time.monotonic(), _Job(chat_id, payload))
+        return True
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Дождаться, пока очередь опустеет (для тестов и остановки)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._heap or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining if remaining is not None else 0.1)
+            return True
+
+    def _push(self, ready_at: float, job: _Job) -> None:
+        heapq.heappush(self._heap, (ready_at, next(self._seq), job))
+        self._cond.notify()
+
+    def _take(self) -> Optional[_Job]:
+        """Взять готовое к отправке сообщение, учитывая лимит на чат"""
+        with self._cond:
+            while self.running:
+                now = time.monotonic()
+                if self._heap and self._heap[0][0] <= now:
+                    _, _, job = heapq.heappop(self._heap)
+                    slot = self._next_chat_slot.get(job.chat_id, 0.0)
+                    if slot > now:
+                        # В этот чат недавно писали — откладываем до освобождения слота
+                        heapq.heappush(self._heap, (slot, next(self._seq), job))
+                        continue
+                    self._next_chat_slot[job.chat_id] = now + self.per_chat_interval
+                    self._in_flight += 1
+                    return job
+                timeout = self._heap[0][0] - now if self._heap else None
+                self._cond.wait(timeout)
+            return None
+
+    def _done(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            # Слоты давно отправленных чатов больше не нужны
+            if len(self._next_chat_slot) > self.queue_size:
+                now = time.monotonic()
+                self._next_chat_slot = {k: v for k, v in self._next_chat_slot.items() if v > now}
+            self._cond.notify_all()
+
+    def _retry(self, job: _Job, delay: float) -> None:
+        with self._cond:
+            self._push(time.monotonic() + delay, job)
+
+    def _worker(self) -> None:
+        while True:
+            job = self._take()
+            if job is None:
+                return
+            try:
+                self._deliver(job)
+            except Exception as e:
+                failed_total.inc()
+                logger.error(f"Error sending notification to {job.chat_id}: {e}")
+            finally:
+                self._done()
+
+    def _deliver(self, job: _Job) -> None:
+        wait = self.bucket.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+        job.attempts += 1
+        try:
+            with send_latency.time():
+                self.send(job.payload)
+        except TelegramRetryAfter as e:
+            rate_limited_total.inc()
+            logger.warning(f"Rate limited by Telegram, retry after {e.retry_after}s")
+            self.bucket.pause(e.retry_after)
+            job.attempts -= 1  # 429 не считается неудачной попыткой
+            self._retry(job, e.retry_after)
+            return
+        except (TelegramServerError, TelegramNetworkError) as e:
+            self._retry_or_fail(job, str(e))
+            return
+        except TelegramError as e:
+            # 400/403 (чат не найден, бот заблокирован) — повторять бессмысленно
+            failed_total.inc()
+            logger.warning(f"Notification to {job.chat_id} rejected: {e.description}")
+            return
+
+        sent_total.inc()
+        delivery_latency.observe(time.monotonic() - job.created)
+
+    def _retry_or_fail(self, job: _Job, reason: str) -> None:
+        if job.attempts >= self.max_attempts:
+            failed_total.inc()
+            logger.error(f"Giving up on notification to {job.chat_id} after {job.attempts} attempts: {reason}")
+            return
+        retried_total.inc()
+        delay = self.backoff_base * 2 ** (job.attempts - 1)
+        self._retry(job, delay * random.uniform(0.8, 1.2))
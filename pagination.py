@@ -0,0 +1,41 @@
+"""
+Курсоры keyset-пагинации
+
+Курсор — ключ сортировки последней отданной строки (например, created_at
+и id), упакованный в непрозрачную строку. Следующая страница выбирается
+условием "ключ меньше курсора" по индексу, без OFFSET, поэтому ее
+стоимость не растет с номером страницы.
+"""
+import json
+import base64
+from typing import Any, List, Optional
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(*values: Any) -> str:
+    """Упаковать ключ сортировки в курсор"""
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Распаковать курсор из size значений (ValueError, если курсор испорчен)"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def next_cursor(rows: List, limit: int, key) -> Optional[str]:
+    """
+    Курсор следующей страницы (rows выбраны с LIMIT limit + 1)
+    Лишняя строка только сообщает, что страница не последняя, и отбрасывается.
+    """
+    if len(rows) <= limit:
+        return None
+    del rows[limit:]
+    return encode_cursor(*key(rows[-1]))
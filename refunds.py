@@ -0,0 +1,91 @@
+"""
+Возврат Stars за комнаты, закрытые по возрасту
+
+Возврат в два шага. record_refunds() в одной транзакции закрывает комнату в
+rooms (status = 'expired'), переводит платежи участников в refund_pending,
+пишет транзакции refund и уменьшает total_spent в user_stats. После этого
+send_pending_refunds() вызывает refundStarPayment для каждого ожидающего
+платежа: успешные становятся refunded, отклоненные Telegram — refund_failed
+(разбираются вручную), а после сетевых ошибок и 5xx платеж остается в
+очереди до следующего прохода. Повторный вызов для уже возвращенного
+платежа Telegram отклоняет с CHARGE_ALREADY_REFUNDED — такой платеж
+считается возвращенным, поэтому проходы нескольких воркеров безопасны.
+"""
+import logging
+from datetime import datetime
+from typing import Iterable, Optional
+import db
+import user_stats
+import metrics
+from db import DB_PATH
+from room_model import Participant
+from telegram_client import (TelegramClient, TelegramError, TelegramNetworkError, TelegramRetryAfter,
+                             TelegramServerError, get_client)
+
+logger = logging.getLogger(__name__)
+
+SEND_BATCH = 100  # Платежей за один проход send_pending_refunds
+
+refunds_sent = metrics.counter('refunds.sent_total')
+refunds_failed = metrics.counter('refunds.failed_total')
+refund_retries = metrics.counter('refunds.retries_total')
+
+
+def record_refunds(room_id: str, participants: Iterable[Participant], closed_at: float,
+                   db_path: str = DB_PATH) -> int:
+    """
+    Закрыть комнату в БД и поставить оплаченные места в очередь возврата
+    Платежи ищутся по первичному ключу (payment_id участников), поэтому
+    стоимость зависит от размера комнаты, а не от истории. Возвращает
+    число платежей, поставленных на возврат.
+    """
+    queued = 0
+    with db.transaction(db_path) as conn:
+        conn.execute("UPDATE rooms SET status = 'expired', completed_at = ? WHERE room_id = ?",
+                     (datetime.fromtimestamp(closed_at).isoformat(' '), room_id))
+        for participant in participants:
+            row = conn.execute("SELECT user_id, amount FROM payments WHERE id = ? AND status = 'completed'",
+                               (participant['payment_id'],)).fetchone()
+            if row is None:
+                continue
+            user_id, amount = row
+            conn.execute("UPDATE payments SET status = 'refund_pending' WHERE id = ?", (participant['payment_id'],))
+            conn.execute('''INSERT INTO transactions (room_id, from_user_id, to_user_id, amount, transaction_type)
+                            VALUES (?, ?, ?, ?, ?)''', (room_id, None, user_id, amount, 'refund'))
+            user_stats.record_refund(conn, user_id, amount)
+            queued += 1
+    return queued
+
+
+def send_pending_refunds(db_path: str = DB_PATH, client: Optional[TelegramClient] = None,
+                         limit: int = SEND_BATCH) -> int:
+    """Вернуть Stars по ожидающим платежам (не больше limit); вернуть число возвращенных"""
+    client = client or get_client()
+    rows = db.fetch_all('''SELECT id, user_id, telegram_payment_charge_id FROM payments
+                           WHERE status = 'refund_pending' ORDER BY id LIMIT ?''', (limit,), db_path)
+    sent = 0
+    for payment_id, user_id, charge_id in rows:
+        try:
+            client.refund_star_payment(user_id, charge_id)
+        except TelegramRetryAfter as e:
+            refund_retries.inc()
+            logger.warning(f"Refund of payment {payment_id} throttled, retry after {e.retry_after}s")
+            break
+        except (TelegramNetworkError, TelegramServerError) as e:
+            refund_retries.inc()
+            logger.warning(f"Refund of payment {payment_id} will be retried: {e}")
+            continue
+        except TelegramError as e:
+            if 'CHARGE_ALREADY_REFUNDED' not in e.description:
+                refunds_failed.inc()
+                logger.error(f"Refund of payment {payment_id} rejected: {e}")
+                db.execute("UPDATE payments SET status = 'refund_failed' WHERE id = ? AND status = 'refund_pending'",
+                           (payment_id,), db_path)
+                continue
+
+        db.execute("UPDATE payments SET status = 'refunded' WHERE id = ? AND status = 'refund_pending'",
+                   (payment_id,), db_path)
+        refunds_sent.inc()
+        sent += 1
+        logger.info(f"Refunded payment {payment_id} to user {user_id}")
+    return sent
@@ -0,0 +1,263 @@
+"""
+Истечение комнат: вытеснение завершенных и закрытие зависших
+
+Завершенная комната (completed, expired) остается в хранилище еще
+COMPLETED_ROOM_GRACE секунд — клиенты успевают прочитать результат, — а
+затем удаляется. Комната, которая ждет игроков дольше WAITING_ROOM_MAX_AGE
+секунд, закрывается (status = 'expired'), а оплаченные места уходят на
+возврат (refunds.py).
+
+Сроки лежат в куче (время, room_id): хранилище сообщает о каждом изменении
+комнаты через track(), поток разбирает только наступившие сроки. Стоимость
+прохода зависит от числа истекающих комнат, а не от числа всех комнат.
+Устаревшие записи кучи не удаляются, а пропускаются при извлечении;
+состояние комнаты перепроверяется в момент срабатывания.
+"""
+import os
+import time
+import heapq
+import logging
+from threading import Thread, Condition, Event
+from typing import Callable, Dict, List, Optional, Tuple
+import db
+import metrics
+import refunds
+from db import DB_PATH
+from room_model import FINISHED_STATUSES, Room
+from room_store import RoomStore
+
+logger = logging.getLogger(__name__)
+
+COMPLETED_ROOM_GRACE = float(os.environ.get('COMPLETED_ROOM_GRACE', 300))   # Секунд до удаления завершенной
+WAITING_ROOM_MAX_AGE = float(os.environ.get('WAITING_ROOM_MAX_AGE', 3600))  # Секунд ожидания игроков
+REFUND_RETRY_INTERVAL = float(os.environ.get('REFUND_RETRY_INTERVAL', 60))  # Секунд между проходами возвратов
+BUSY_RETRY_DELAY = 5  # Секунд до повторной попытки закрыть комнату с незаписанным платежом
+
+rooms_expired = metrics.counter('room_expiry.expired_total')
+rooms_evicted = metrics.counter('room_expiry.evicted_total')
+
+
+class RoomExpiry:
+    """
+    Таймеры комнат на куче
+
+    track(room) вызывается из on_change хранилища (под локом комнаты),
+    поэтому только кладет срок в кучу под собственным Condition. Каждая
+    комната имеет не больше одного действующего срока (_deadlines): ждущая —
+    created_at + waiting_max_age, завершенная — completed_at + completed_grace.
+
+    Закрытие ждущей комнаты — RoomStore.transition: если в комнате есть
+    место с незаписанным платежом, закрытие откладывается на
+    BUSY_RETRY_DELAY секунд. Под локом комнаты меняется только статус и
+    снимается копия участников; возвраты пишутся в БД уже после transition.
+    record_refunds идемпотентна (берет только платежи completed), поэтому
+    при ошибке запись повторяется перед вытеснением expired-комнаты, а
+    после перезапуска start() находит в rooms ждущие комнаты, пропавшие из
+    хранилища (reconcile_refunds). on_removed(room_id) вызывается после
+    удаления комнаты (app передает broadcaster.forget).
+    """
+
+    def __init__(self, store: RoomStore, db_path=DB_PATH, on_removed: Optional[Callable[[str], None]] = None,
+                 completed_grace: float = COMPLETED_ROOM_GRACE, waiting_max_age: float = WAITING_ROOM_MAX_AGE,
+                 refund_retry_interval: float = REFUND_RETRY_INTERVAL):
+        self.store = store
+        self.db_path = db_path
+        self.on_removed = on_removed
+        self.completed_grace = completed_grace
+        self.waiting_max_age = waiting_max_age
+        self.refund_retry_interval = refund_retry_interval
+        self.running = False
+        self._thread: Optional[Thread] = None
+        self._refunds_due = Event()
+
+        # Куча (срок, room_id) и действующий срок каждой комнаты
+        self._cond = Condition()
+        self._heap: List[Tuple[float, str]] = []
+        self._deadlines: Dict[str, float] = {}
+        metrics.gauge('room_expiry.pending', lambda: len(self._deadlines))
+
+    def start(self):
+        """Поставить сроки уже существующих комнат и запустить поток"""
+        if self.running:
+            logger.warning("Room expiry already running")
+            return
+        self.track_all()
+        self.reconcile_refunds()
+        self.running = True
+        self._refunds_due.set()  # Возвраты, не отправленные до перезапуска
+        self._thread = Thread(target=self._run, daemon=True, name='room-expiry')
+        self._thread.start()
+        logger.info("Room expiry started")
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        logger.info("Room expiry stopped")
+
+    # Сроки
+
+    def deadline_of(self, room: Room) -> Optional[float]:
+        """Когда комната истекает (None — у комнаты в розыгрыше срока нет)"""
+        if room['status'] in FINISHED_STATUSES:
+            return (room['completed_at'] or time.time()) + self.completed_grace
+        if room['status'] == 'waiting':
+            return room['created_at'] + self.waiting_max_age
+        return None
+
+    def track(self, room: Room) -> None:
+        """Комната создана или изменилась: поставить или передвинуть ее срок"""
+        deadline = self.deadline_of(room)
+        if deadline is not None:
+            self._schedule(room['room_id'], deadline)
+
+    def track_all(self) -> int:
+        """Поставить сроки всех комнат хранилища (при запуске, после restore)"""
+        tracked = 0
+        for room_id in self.store.room_ids():
+            deadline = self.store.read(room_id, self.deadline_of)
+            if deadline is not None:
+                self._schedule(room_id, deadline)
+                tracked += 1
+        return tracked
+
+    def _schedule(self, room_id: str, deadline: float) -> None:
+        with self._cond:
+            if self._deadlines.get(room_id) == deadline:
+                return
+            # Прежний срок остается в куче и будет пропущен при извлечении
+            self._deadlines[room_id] = deadline
+            heapq.heappush(self._heap, (deadline, room_id))
+            if self._heap[0][1] == room_id:
+                self._cond.notify()
+
+    def _pop_due(self, now: float) -> List[str]:
+        with self._cond:
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                deadline, room_id = heapq.heappop(self._heap)
+                if self._deadlines.get(room_id) == deadline:
+                    del self._deadlines[room_id]
+                    due.append(room_id)
+            return due
+
+    def run_due(self, now: Optional[float] = None) -> int:
+        """Обработать комнаты, срок которых наступил; вернуть их число"""
+        now = time.time() if now is None else now
+        due = self._pop_due(now)
+        for room_id in due:
+            try:
+                self._fire(room_id, now)
+            except Exception as e:
+                logger.error(f"Room expiry error for {room_id}: {e}")
+                self._schedule(room_id, now + BUSY_RETRY_DELAY)
+        return len(due)
+
+    def _fire(self, room_id: str, now: float) -> None:
+        state = self.store.read(room_id, lambda room: (room['status'], self.deadline_of(room)))
+        if state is None:
+            self._removed(room_id)  # Удалена другим процессом
+            return
+        status, deadline = state
+        if deadline is None:
+            return  # В розыгрыше: срок поставит следующее изменение комнаты
+        if deadline > now:
+            self._schedule(room_id, deadline)
+        elif status == 'waiting':
+            self._expire(room_id, now)
+        else:
+            # Завершенная комната больше не меняется: удаляем без transition
+            if status == 'expired':
+                self._record_refunds(self.store.read(room_id, lambda room: room.copy()))
+            self.store.remove(room_id)
+            rooms_evicted.inc()
+            self._removed(room_id)
+
+    def _removed(self, room_id: str) -> None:
+        if self.on_removed is not None:
+            self.on_removed(room_id)
+
+    def _expire(self, room_id: str, now: float) -> None:
+        busy = []
+
+        def expire(room: Room):
+            if room['status'] != 'waiting' or room['created_at'] + self.waiting_max_age > now:
+                return None
+            if any(p['payment_id'] is None for p in room['participants']):
+                busy.append(room_id)  # Платеж сейчас записывается
+                return None
+            room['status'] = 'expired'
+            room['completed_at'] = now
+            return room.copy()
+
+        expired = self.store.transition(room_id, expire)
+        if busy:
+            self._schedule(room_id, now + BUSY_RETRY_DELAY)
+            return
+        if expired is None:
+            return
+        rooms_expired.inc()
+        self._schedule(room_id, now + self.completed_grace)
+        # Ошибка записи всплывет в run_due; вытеснение повторит запись
+        queued = self._record_refunds(expired)
+        logger.info(f"Room {room_id} expired, {queued} payment(s) queued for refund")
+
+    def _record_refunds(self, room: Optional[Room]) -> int:
+        """Записать возвраты закрытой комнаты (вне лока комнаты); повтор безопасен"""
+        if room is None:
+            return 0
+        queued = refunds.record_refunds(room['room_id'], room['participants'], room['completed_at'], self.db_path)
+        if queued:
+            self._refunds_due.set()
+        return queued
+
+    def reconcile_refunds(self) -> int:
+        """
+        Ждущие комнаты в rooms старше waiting_max_age, которых нет в
+        хранилище (процесс упал до записи возврата или комнаты не
+        восстановлены): оплаченные места ставятся на возврат. Заполненные
+        комнаты разыгрывает заново планировщик (_reconcile_draws).
+        """
+        rows = db.fetch_all('''
+            SELECT room_id FROM rooms WHERE status = 'waiting' AND created_at <= datetime('now', ?)
+        ''', (f'-{int(self.waiting_max_age)} seconds',), self.db_path)
+        now, queued = time.time(), 0
+        for room_id, in rows:
+            if self.store.read(room_id, lambda room: room['status']) is not None:
+                continue  # Срок комнаты поставлен track_all
+            seats = db.fetch_all('SELECT payment_id FROM room_participants WHERE room_id = ?',
+                                 (room_id,), self.db_path)
+            if len(seats) >= self.store.max_room_size:
+                continue
+            queued += self._record_refunds({'room_id': room_id, 'completed_at': now,
+                                            'participants': [{'payment_id': payment_id} for payment_id, in seats]})
+        if queued:
+            logger.warning(f"Queued {queued} refund(s) for lost waiting rooms")
+        return queued
+
+    # Поток
+
+    def _wait(self, until: float) -> None:
+        with self._cond:
+            if not self.running:
+                return
+            next_at = min(until, self._heap[0][0]) if self._heap else until
+            timeout = next_at - time.time()
+            if timeout > 0:
+                self._cond.wait(timeout)
+
+    def _run(self) -> None:
+        next_refunds = time.time()
+        while self.running:
+            self.run_due()
+            if self._refunds_due.is_set() or time.time() >= next_refunds:
+                self._refunds_due.clear()
+                try:
+                    refunds.send_pending_refunds(self.db_path)
+                except Exception as e:
+                    logger.error(f"Refund error: {e}")
+                next_refunds = time.time() + self.refund_retry_interval
+            self._wait(next_refunds)
@@ -0,0 +1,100 @@
+import logging
+from typing import Dict, Iterable, Optional, Set
+from room_model import FINISHED_STATUSES
+
+logger = logging.getLogger(__name__)
+
+
+class RoomIndex:
+    """
+    Индексы над словарем комнат для поиска за O(1)
+
+    open_by_fee: entry_fee -> упорядоченное множество открытых комнат
+    (status == 'waiting' и есть свободные места). Порядок вставки сохраняется,
+    поэтому игроки попадают в самую старую из открытых комнат.
+
+    active_by_user: user_id -> room_id незавершенной комнаты пользователя
+    (waiting или drawing).
+
+    Индекс не синхронизирован сам по себе: все вызовы выполняются под тем же
+    локом, что и изменения словаря комнат.
+    """
+
+    def __init__(self, max_room_size: int):
+        self.max_room_size = max_room_size
+        self._open_by_fee: Dict[int, Dict[str, None]] = {}
+        self._fee_of: Dict[str, int] = {}
+        self._active_by_user: Dict[int, str] = {}
+        self._users_in: Dict[str, Set[int]] = {}
+
+    def _is_open(self, room: Dict) -> bool:
+        return room['status'] == 'waiting' and len(room['participants']) < self.max_room_size
+
+    def update(self, room: Dict) -> None:
+        """Пересчитать положение комнаты в индексе после создания или изменения"""
+        room_id = room['room_id']
+        if self._is_open(room):
+            if room_id not in self._fee_of:
+                self._open_by_fee.setdefault(room['entry_fee'], {})[room_id] = None
+                self._fee_of[room_id] = room['entry_fee']
+        else:
+            self._remove_open(room_id)
+
+        if room['status'] in FINISHED_STATUSES:
+            self._release_users(room_id)
+        else:
+            users = self._users_in.setdefault(room_id, set())
+            current = {participant['user_id'] for participant in room['participants']}
+            # Освободившие место (платеж не записан) больше не в комнате
+            for user_id in users - current:
+                users.discard(user_id)
+                if self._active_by_user.get(user_id) == room_id:
+                    del self._active_by_user[user_id]
+            for user_id in current - users:
+                users.add(user_id)
+                self._active_by_user[user_id] = room_id
+
+    def remove(self, room_id: str) -> None:
+        """Убрать комнату из всех индексов (комната удалена)"""
+        self._remove_open(room_id)
+        self._release_users(room_id)
+
+    def _release_users(self, room_id: str) -> None:
+        for user_id in self._users_in.pop(room_id, ()):
+            if self._active_by_user.get(user_id) == room_id:
+                del self._active_by_user[user_id]
+
+    def _remove_open(self, room_id: str) -> None:
+        entry_fee = self._fee_of.pop(room_id, None)
+        if entry_fee is None:
+            return
+        bucket = self._open_by_fee[entry_fee]
+        del bucket[room_id]
+        if not bucket:
+            del self._open_by_fee[entry_fee]
+
+    def find_open(self, entry_fee: int) -> Optional[str]:
+        """Самая старая открытая комната с таким entry_fee"""
+        bucket = self._open_by_fee.get(entry_fee)
+        if not bucket:
+            return None
+        return next(iter(bucket))
+
+    def active_room_of(self, user_id: int) -> Optional[str]:
+        """Незавершенная комната, в которой участвует пользователь"""
+        return self._active_by_user.get(user_id)
+
+    def open_count(self, entry_fee: Optional[int] = None) -> int:
+        """Количество открытых комнат (всего или для entry_fee)"""
+        if entry_fee is None:
+            return len(self._fee_of)
+        return len(self._open_by_fee.get(entry_fee, ()))
+
+    def rebuild(self, rooms: Iterable[Dict]) -> None:
+        """Построить индекс заново по всем комнатам"""
+        self._open_by_fee.clear()
+        self._fee_of.clear()
+        self._active_by_user.clear()
+        self._users_in.clear()
+        for room in rooms:
+            self.update(room)
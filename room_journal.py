@@ -0,0 +1,164 @@
+"""
+Снимок и журнал комнат для быстрого перезапуска (MemoryRoomStore)
+
+Незавершенные комнаты периодически сохраняются снимком (<path>.snapshot),
+а каждое изменение комнаты между снимками дописывается строкой JSON в
+журнал текущего поколения (<path>.journal.<N>). При старте читается снимок
+и проигрываются журналы после него: время восстановления зависит от числа
+активных комнат и изменений за интервал снимка, но не от истории в базе.
+
+Запись в журнал — write + flush без fsync: она переживает падение
+процесса, но не отключение питания.
+"""
+import os
+import glob
+import json
+import logging
+from collections import deque
+from threading import Lock
+from typing import Deque, Dict, List
+import metrics
+from room_model import FINISHED_STATUSES, Room
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_INTERVAL = float(os.environ.get('ROOM_SNAPSHOT_INTERVAL', 30))  # Секунд между снимками
+
+journal_entries = metrics.counter('room_journal.entries')
+restore_latency = metrics.latency('room_journal.restore_seconds')
+
+
+class RoomJournal:
+    """
+    Снимок + журнал изменений комнат
+
+    append() вызывается под локом комнаты сразу после ее изменения и только
+    ставит копию состояния в очередь: порядок очереди — порядок изменений
+    каждой комнаты. flush() вызывается после отпускания лока и дописывает
+    всю очередь в файл под собственным локом журнала.
+
+    Пока журнал не открыт (load/rotate), append ничего не пишет — так
+    хранилище без восстановления (тесты, бенчмарки) не трогает диск.
+    """
+
+    def __init__(self, path: str, snapshot_interval: float = SNAPSHOT_INTERVAL):
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self.generation = 0
+        self._file = None
+        self._pending: Deque[Dict] = deque()
+        self._lock = Lock()
+        self._snapshot_lock = Lock()
+
+    @property
+    def snapshot_path(self) -> str:
+        return f'{self.path}.snapshot'
+
+    def _journal_path(self, generation: int) -> str:
+        return f'{self.path}.journal.{generation}'
+
+    def _generations(self) -> List[int]:
+        generations = []
+        for path in glob.glob(glob.escape(self.path) + '.journal.*'):
+            suffix = path.rsplit('.', 1)[1]
+            if suffix.isdigit():
+                generations.append(int(suffix))
+        return sorted(generations)
+
+    # Запись
+
+    def append(self, room: Room) -> None:
+        """Поставить в очередь новое состояние комнаты (под локом комнаты)"""
+        if self._file is not None:
+            self._pending.append(room.to_dict())
+
+    def append_removed(self, room_id: str) -> None:
+        """Поставить в очередь удаление комнаты (под локом комнаты)"""
+        if self._file is not None:
+            self._pending.append({'room_id': room_id, 'removed': True})
+
+    def flush(self) -> None:
+        """Дописать очередь в журнал (после отпускания лока комнаты)"""
+        with self._lock:
+            written = 0
+            while self._pending:
+                entry = self._pending.popleft()
+                if self._file is not None:
+                    self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                    written += 1
+            if written:
+                self._file.flush()
+        journal_entries.inc(written)
+
+    def rotate(self) -> int:
+        """
+        Начать новое поколение журнала
+        Снимок комнат, скопированных после этого вызова, соответствует
+        началу поколения. Возвращает номер поколения.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self.generation += 1
+            self._file = open(self._journal_path(self.generation), 'a', encoding='utf-8')
+            return self.generation
+
+    def write_snapshot(self, generation: int, rooms: List[Room]) -> None:
+        """Сохранить снимок на начало поколения generation и удалить журналы до него"""
+        with self._snapshot_lock:
+            tmp_path = f'{self.snapshot_path}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'generation': generation, 'rooms': [room.to_dict() for room in rooms]}, f,
+                          ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+
+            for old in self._generations():
+                if old < generation:
+                    os.remove(self._journal_path(old))
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # Восстановление
+
+    def load(self) -> Dict[str, Room]:
+        """Незавершенные комнаты из снимка и журналов после него (в порядке создания)"""
+        rooms: Dict[str, Dict] = {}
+        generation = 0
+        try:
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                data = json.load(f)
+            generation = data['generation']
+            rooms = {room['room_id']: room for room in data['rooms']}
+        except FileNotFoundError:
+            pass
+
+        generations = [g for g in self._generations() if g >= generation]
+        for g in generations:
+            self._replay(self._journal_path(g), rooms)
+
+        self.generation = max([generation, *generations])
+        logger.info(f"Loaded {len(rooms)} rooms from snapshot {generation} and {len(generations)} journal(s)")
+        # В Room — только последнее состояние каждой комнаты
+        return {room_id: Room.from_dict(data) for room_id, data in rooms.items()}
+
+    @staticmethod
+    def _replay(path: str, rooms: Dict[str, Dict]) -> None:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Недописанная строка в конце журнала (процесс упал во время записи)
+                    logger.warning(f"Skipping torn journal entry in {path}")
+                    break
+                if entry.get('removed') or entry['status'] in FINISHED_STATUSES:
+                    rooms.pop(entry['room_id'], None)
+                else:
+                    rooms[entry['room_id']] = entry
@@ -0,0 +1,173 @@
+"""
+Комнаты и участники в памяти
+
+Room и Participant — классы со __slots__ вместо словарей: у объекта нет
+собственного словаря атрибутов, время хранится числом (time.time()), а не
+ISO-строкой. У комнаты есть version — растет при каждом изменении, видимом
+снаружи, — и кэш публичного JSON: он строится при первом чтении и
+сбрасывается только вместе с version (touch). get_room_info и SSE-подписчики
+отдают одни и те же байты; payment_id и служебные времена наружу не попадают.
+
+Доступ по ключу (room['status'], participant['user_id']) оставлен для кода,
+который работает и с комнатами-словарями (draw_winner, RoomIndex, bot).
+"""
+import json
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
+
+
+def _timestamp(value: Union[None, int, float, str]) -> Optional[float]:
+    """Время из снимка, журнала или room_state: число или ISO-строка (формат до Room)"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return datetime.fromisoformat(value).timestamp()
+
+
+# Комната больше не меняется: разыграна или закрыта по возрасту (деньги возвращаются)
+FINISHED_STATUSES = ('completed', 'expired')
+
+_encode = json.JSONEncoder(ensure_ascii=False).encode  # Один энкодер: json.dumps с параметрами создает новый
+
+
+def _dumps(value: Any) -> bytes:
+    return _encode(value).encode()
+
+
+class _Record:
+    """Чтение и запись полей по ключу, как у словаря"""
+
+    __slots__ = ()
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        setattr(self, key, value)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+    def __eq__(self, other: Any) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+    def to_dict(self) -> Dict:
+        raise NotImplementedError
+
+
+class Participant(_Record):
+    """
+    Место в комнате
+    Публичные поля (user_id, username, first_name) после входа не меняются,
+    поэтому их JSON кэшируется навсегда; payment_id в него не входит.
+    """
+
+    __slots__ = ('user_id', 'username', 'first_name', 'payment_id', 'joined_at', '_json')
+
+    def __init__(self, user_id: int, username: str = '', first_name: str = '',
+                 payment_id: Optional[int] = None, joined_at: Optional[float] = None):
+        self.user_id = user_id
+        self.username = username
+        self.first_name = first_name
+        self.payment_id = payment_id
+        self.joined_at = time.time() if joined_at is None else joined_at
+        self._json: Optional[bytes] = None
+
+    def public_json(self) -> bytes:
+        if self._json is None:
+            self._json = _dumps({'user_id': self.user_id, 'username': self.username,
+                                 'first_name': self.first_name})
+        return self._json
+
+    def copy(self) -> 'Participant':
+        copy = Participant(self.user_id, self.username, self.first_name, self.payment_id, self.joined_at)
+        copy._json = self._json
+        return copy
+
+    def to_dict(self) -> Dict:
+        return {'user_id': self.user_id, 'username': self.username, 'first_name': self.first_name,
+                'payment_id': self.payment_id, 'joined_at': self.joined_at}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Participant':
+        return cls(data['user_id'], data.get('username') or '', data.get('first_name') or '',
+                   data.get('payment_id'), _timestamp(data.get('joined_at')))
+
+
+class Room(_Record):
+    """
+    Комната розыгрыша
+    Изменяет комнату только хранилище (RoomStore) и после каждого изменения,
+    видимого снаружи, вызывает touch(). Привязка платежа (payment_id) версию
+    не меняет: в публичном JSON ее нет.
+    """
+
+    __slots__ = ('room_id', 'entry_fee', 'status', 'participants', 'total_pool', 'winner',
+                 'max_participants', 'created_at', 'completed_at', 'version', '_json')
+
+    def __init__(self, room_id: str, entry_fee: int, max_participants: int, status: str = 'waiting',
+                 participants: Optional[List[Participant]] = None, total_pool: int = 0,
+                 winner: Optional[Dict] = None, created_at: Optional[float] = None,
+                 completed_at: Optional[float] = None, version: int = 1):
+        self.room_id = room_id
+        self.entry_fee = entry_fee
+        self.max_participants = max_participants
+        self.status = status  # waiting, drawing, completed, expired
+        self.participants: List[Participant] = participants if participants is not None else []
+        self.total_pool = total_pool
+        self.winner = winner
+        self.created_at = time.time() if created_at is None else created_at
+        self.completed_at = completed_at
+        self.version = version
+        self._json: Optional[bytes] = None
+
+    def touch(self) -> None:
+        """Комната изменилась: новая версия, публичный JSON построится заново"""
+        self.version += 1
+        self._json = None
+
+    def public_json(self) -> bytes:
+        """Состояние комнаты для клиентов (ответ /api/room/<id> и SSE-сообщение)"""
+        if self._json is None:
+            fields = _dumps({'room_id': self.room_id, 'version': self.version, 'entry_fee': self.entry_fee,
+                             'status': self.status, 'total_pool': self.total_pool, 'winner': self.winner,
+                             'max_participants': self.max_participants})
+            participants = b', '.join(p.public_json() for p in self.participants)
+            self._json = b''.join((fields[:-1], b', "participants": [', participants, b']}'))
+        return self._json
+
+    def copy(self) -> 'Room':
+        """Снимок, который можно отдавать наружу; готовый JSON переиспользуется"""
+        copy = Room(self.room_id, self.entry_fee, self.max_participants, self.status,
+                    [p.copy() for p in self.participants], self.total_pool,
+                    dict(self.winner) if self.winner else self.winner,
+                    self.created_at, self.completed_at, self.version)
+        copy._json = self._json
+        return copy
+
+    def to_dict(self) -> Dict:
+        """Полное состояние (с платежами) для журнала и room_state"""
+        return {'room_id': self.room_id, 'entry_fee': self.entry_fee, 'max_participants': self.max_participants,
+                'status': self.status, 'participants': [p.to_dict() for p in self.participants],
+                'total_pool': self.total_pool, 'winner': self.winner, 'created_at': self.created_at,
+                'completed_at': self.completed_at, 'version': self.version}
+
+    @classmethod
+    def from_dict(cls, data: Dict, max_participants: Optional[int] = None) -> 'Room':
+        """Комната из to_dict() или из словаря прежнего формата (max_participants — по умолчанию)"""
+        participants = [p if isinstance(p, Participant) else Participant.from_dict(p)
+                        for p in data.get('participants', ())]
+        return cls(data['room_id'], data.get('entry_fee', 0), data.get('max_participants', max_participants),
+                   data.get('status', 'waiting'), participants, data.get('total_pool', 0), data.get('winner'),
+                   _timestamp(data.get('created_at')), _timestamp(data.get('completed_at')),
+                   data.get('version', 1))
@@ -0,0 +1,618 @@
+"""
+Хранилище состояния комнат
+
+RoomStore — атомарные операции над комнатами: занять место, освободить,
+отметить оплату, сменить состояние (transition) и прочитать. Вызывающий
+код не держит собственных локов и не трогает комнаты напрямую.
+
+    MemoryRoomStore — словарь в памяти процесса, лок на комнату (по умолчанию);
+                      с RoomJournal восстанавливается после перезапуска
+    SQLiteRoomStore — таблицы room_state/room_members в общей базе: несколько
+                      воркеров (gunicorn -w N) видят одни и те же комнаты
+
+Комнаты (room_model.Room) отдаются снимками (копиями): изменения в них
+ничего не меняют в хранилище. Каждое изменение, видимое снаружи, повышает
+room.version; публичный JSON комнаты удобнее читать через
+read(room_id, Room.public_json) — без копии. on_change(room) вызывается
+после каждого изменения комнаты; у SQLite-хранилища — и для изменений,
+сделанных другими процессами.
+"""
+import os
+import json
+import time
+import secrets
+import logging
+from contextlib import contextmanager
+from threading import Lock, Thread, Event
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+import db
+from db import DB_PATH
+from room_index import RoomIndex
+from room_model import FINISHED_STATUSES, Participant, Room
+from room_journal import RoomJournal, restore_latency
+from locks import InstrumentedLock, StripedLock
+
+logger = logging.getLogger(__name__)
+
+MAX_ROOM_SIZE = 6
+POLL_INTERVAL = 0.2  # Секунд между проверками изменений других процессов (SQLiteRoomStore)
+UNPAID_SEAT_GRACE = 60  # Секунд, дольше которых неоплаченное место не может ждать записи платежа
+LOCK_STRIPES = int(os.environ.get('ROOM_LOCK_STRIPES', 64))  # Полос лока комнат (MemoryRoomStore)
+
+
+def new_room(entry_fee: int, max_room_size: int = MAX_ROOM_SIZE) -> Room:
+    """Новая пустая комната"""
+    return Room(secrets.token_urlsafe(16), entry_fee, max_room_size)
+
+
+class RoomStore:
+    """Интерфейс хранилища комнат"""
+
+    max_room_size: int
+
+    def get(self, room_id: str) -> Optional[Room]:
+        """Снимок комнаты (None — нет такой комнаты)"""
+        return self.read(room_id, Room.copy)
+
+    def read(self, room_id: str, func: Callable[[Room], Any]) -> Any:
+        """Вызвать func(комната) так, чтобы комната не менялась во время вызова"""
+        raise NotImplementedError
+
+    def open_room(self, entry_fee: int) -> Room:
+        """Самая старая незаполненная комната с такой ставкой или новая"""
+        raise NotImplementedError
+
+    def join(self, entry_fee: int, participant: Union[Participant, Dict]) -> Tuple[Room, bool]:
+        """
+        Занять место в открытой комнате
+        Возвращает (снимок комнаты, занято ли место); False — пользователь
+        уже в этой комнате. Заполненная комната переходит в статус drawing.
+        """
+        raise NotImplementedError
+
+    def leave(self, room_id: str, user_id: int) -> bool:
+        """Освободить место неоплаченного участника (платеж не записан)"""
+        raise NotImplementedError
+
+    def mark_paid(self, room_id: str, user_id: int, payment_id: int) -> bool:
+        """Привязать платеж к участнику; True — комната заполнена и оплачена целиком"""
+        raise NotImplementedError
+
+    def transition(self, room_id: str, func: Callable[[Room], Any]) -> Any:
+        """
+        Атомарно изменить комнату: func(комната) меняет ее на месте и
+        возвращает результат; None — изменений нет, ничего не сохраняется
+        """
+        raise NotImplementedError
+
+    def active_room_of(self, user_id: int) -> Optional[str]:
+        """Незавершенная комната, в которой участвует пользователь"""
+        raise NotImplementedError
+
+    def room_ids(self, status: Optional[str] = None) -> List[str]:
+        """Комнаты (в статусе status)"""
+        raise NotImplementedError
+
+    def remove(self, room_id: str) -> None:
+        """Удалить комнату"""
+        raise NotImplementedError
+
+    @staticmethod
+    def fully_paid(room: Room) -> bool:
+        """Комната заполнена и все ее платежи записаны — ее можно разыгрывать"""
+        return room['status'] == 'drawing' and all(p['payment_id'] is not None for p in room['participants'])
+
+    def restore(self, find_payment: Callable[[str, int], Optional[int]]) -> int:
+        """
+        Восстановить комнаты после перезапуска процесса (до старта планировщика)
+        find_payment(room_id, user_id) — id записанного платежа участника или None.
+        Возвращает число восстановленных комнат.
+        """
+        return 0
+
+    def start(self) -> 'RoomStore':
+        return self
+
+    def stop(self) -> None:
+        pass
+
+    # Общая логика изменения комнаты; бэкенды вызывают ее внутри своей атомарной секции
+
+    def _add(self, room: Room, participant: Union[Participant, Dict]) -> None:
+        if not isinstance(participant, Participant):
+            participant = Participant.from_dict(participant)
+        room['participants'].append(participant)
+        room['total_pool'] += room['entry_fee']
+        logger.info(f"Added user {participant['user_id']} to room {room['room_id']}. "
+                    f"Participants: {len(room['participants'])}/{self.max_room_size}")
+
+        # Заполненная комната закрывается для новых игроков сразу,
+        # а розыгрыш запускается, когда все платежи записаны (mark_paid)
+        if len(room['participants']) >= self.max_room_size:
+            room['status'] = 'drawing'
+            logger.info(f"Room {room['room_id']} is full. Waiting for payments to be committed...")
+
+    @staticmethod
+    def _remove_unpaid(room: Room, user_id: int) -> bool:
+        for participant in room['participants']:
+            if participant['user_id'] == user_id and participant['payment_id'] is None:
+                room['participants'].remove(participant)
+                room['total_pool'] -= room['entry_fee']
+                if room['status'] == 'drawing':
+                    room['status'] = 'waiting'
+                return True
+        return False
+
+    @staticmethod
+    def _set_paid(room: Room, user_id: int, payment_id: int) -> bool:
+        for participant in room['participants']:
+            if participant['user_id'] == user_id and participant['payment_id'] is None:
+                participant['payment_id'] = payment_id
+                return True
+        return False
+
+
+class MemoryRoomStore(RoomStore):
+    """
+    Комнаты в памяти процесса
+
+    Каждая комната защищена своей полосой лока (StripedLock по room_id):
+    изменения и чтения разных комнат не ждут друг друга. Отдельный
+    небольшой registry_lock защищает только словарь комнат и индексы
+    (подбор открытой комнаты, активная комната пользователя) и держится
+    лишь на время поиска или обновления индекса. Порядок захвата — всегда
+    полоса комнаты, затем registry_lock. Комната берется из словаря уже
+    под своей полосой: вставка и удаление идут под той же полосой.
+
+    rooms можно передать готовым словарем Room (тесты, conduct_lottery).
+    С journal каждое изменение ставится в очередь журнала под полосой, а
+    пишется в файл после ее отпускания (_flush); start() раз в
+    journal.snapshot_interval сохраняет снимок незавершенных комнат.
+    """
+
+    def __init__(self, max_room_size: int = MAX_ROOM_SIZE, on_change: Optional[Callable[[Room], None]] = None,
+                 rooms: Optional[Dict[str, Room]] = None, journal: Optional[RoomJournal] = None,
+                 stripes: int = LOCK_STRIPES):
+        self.max_room_size = max_room_size
+        self.on_change = on_change
+        self.rooms: Dict[str, Room] = rooms if rooms is not None else {}
+        self.registry_lock = InstrumentedLock('room_store.registry')
+        self.room_locks = StripedLock('room_store.room', stripes)
+        self.index = RoomIndex(max_room_size)
+        self.index.rebuild(self.rooms.values())
+        self.journal = journal
+        self._stopped = Event()
+        self._checkpointer: Optional[Thread] = None
+
+    def _changed(self, room: Room) -> None:
+        """Вызывается под полосой комнаты сразу после ее изменения"""
+        room.touch()
+        with self.registry_lock:
+            self.index.update(room)
+        self._notify(room)
+
+    def _notify(self, room: Room) -> None:
+        if self.journal is not None:
+            self.journal.append(room)
+        if self.on_change is not None:
+            self.on_change(room)
+
+    def _flush(self) -> None:
+        """Дописать журнал; вызывается после отпускания полосы комнаты"""
+        if self.journal is not None:
+            self.journal.flush()
+
+    def _open(self, entry_fee: int) -> Room:
+        with self.registry_lock:
+            room_id = self.index.find_open(entry_fee)
+            if room_id is not None:
+                return self.rooms[room_id]
+
+        room = new_room(entry_fee, self.max_room_size)
+        with self.room_locks.for_key(room['room_id']):
+            with self.registry_lock:
+                # Пока создавали комнату, открытую мог создать другой поток
+                room_id = self.index.find_open(entry_fee)
+                if room_id is not None:
+                    return self.rooms[room_id]
+                self.rooms[room['room_id']] = room
+                self.index.update(room)
+            self._notify(room)
+        self._flush()
+        logger.info(f"Created new room: {room['room_id']} with entry fee: {entry_fee}")
+        return room
+
+    def read(self, room_id: str, func: Callable[[Room], Any]) -> Any:
+        with self.room_locks.for_key(room_id):
+            room = self.rooms.get(room_id)
+            return None if room is None else func(room)
+
+    def open_room(self, entry_fee: int) -> Room:
+        room = self._open(entry_fee)
+        with self.room_locks.for_key(room['room_id']):
+            return room.copy()
+
+    def join(self, entry_fee: int, participant: Union[Participant, Dict]) -> Tuple[Room, bool]:
+        user_id = participant['user_id']
+        while True:
+            candidate = self._open(entry_fee)
+            with self.room_locks.for_key(candidate['room_id']):
+                room = self.rooms.get(candidate['room_id'])
+                if room is not candidate:
+                    continue  # Удалена, пока ждали лок
+                if any(p['user_id'] == user_id for p in room['participants']):
+                    logger.warning(f"User {user_id} already in room {room['room_id']}")
+                    return room.copy(), False
+                if room['status'] != 'waiting' or len(room['participants']) >= self.max_room_size:
+                    continue  # Заполнена параллельно — берем следующую открытую
+                self._add(room, participant)
+                self._changed(room)
+                joined = room.copy()
+            self._flush()
+            return joined, True
+
+    def leave(self, room_id: str, user_id: int) -> bool:
+        with self.room_locks.for_key(room_id):
+            room = self.rooms.get(room_id)
+            if room is None or not self._remove_unpaid(room, user_id):
+                return False
+            self._changed(room)
+        self._flush()
+        return True
+
+    def mark_paid(self, room_id: str, user_id: int, payment_id: int) -> bool:
+        with self.room_locks.for_key(room_id):
+            room = self.rooms.get(room_id)
+            if room is None or not self._set_paid(room, user_id, payment_id):
+                return False
+            # Подписчикам платеж не виден, но восстановлению после перезапуска нужен
+            if self.journal is not None:
+                self.journal.append(room)
+            paid = self.fully_paid(room)
+        self._flush()
+        return paid
+
+    def transition(self, room_id: str, func: Callable[[Room], Any]) -> Any:
+        with self.room_locks.for_key(room_id):
+            room = self.rooms.get(room_id)
+            if room is None:
+                return None
+            result = func(room)
+            if result is None:
+                return None
+            self._changed(room)
+        self._flush()
+        return result
+
+    def active_room_of(self, user_id: int) -> Optional[str]:
+        with self.registry_lock:
+            return self.index.active_room_of(user_id)
+
+    def room_ids(self, status: Optional[str] = None) -> List[str]:
+        with self.registry_lock:
+            return [room_id for room_id, room in self.rooms.items()
+                    if status is None or room['status'] == status]
+
+    def remove(self, room_id: str) -> None:
+        with self.room_locks.for_key(room_id):
+            room = self.rooms.get(room_id)
+            with self.registry_lock:
+                self.rooms.pop(room_id, None)
+                self.index.remove(room_id)
+            if room is not None and self.journal is not None:
+                self.journal.append_removed(room_id)
+        self._flush()
+
+    # Снимок и журнал
+
+    def restore(self, find_payment: Callable[[str, int], Optional[int]]) -> int:
+        """
+        Загрузить незавершенные комнаты из снимка и журнала
+        Место без привязанного платежа сверяется с базой: платеж записан —
+        привязываем, нет — место освобождается (обработчик обновлений
+        повторит необработанный платеж). Комнаты drawing разыграет первый
+        проход планировщика. Сразу после загрузки сохраняется новый снимок.
+        """
+        if self.journal is None:
+            return 0
+
+        with restore_latency.time():
+            rooms = self.journal.load()
+            for room in rooms.values():
+                if room.max_participants is None:
+                    room.max_participants = self.max_room_size  # Снимок до Room
+                for participant in list(room['participants']):
+                    if participant['payment_id'] is None:
+                        payment_id = find_payment(room['room_id'], participant['user_id'])
+                        if payment_id is None:
+                            self._remove_unpaid(room, participant['user_id'])
+                        else:
+                            participant['payment_id'] = payment_id
+
+            with self.registry_lock:
+                self.rooms.update(rooms)
+                self.index.rebuild(self.rooms.values())
+            self.checkpoint()
+
+        logger.info(f"Restored {len(rooms)} rooms")
+        return len(rooms)
+
+    def checkpoint(self) -> None:
+        """
+        Сохранить снимок незавершенных комнат и начать новый журнал
+        Журнал переключается до копирования комнат: изменение, не попавшее
+        в копию, уже записано в новый журнал полным состоянием комнаты.
+        """
+        generation = self.journal.rotate()
+        with self.registry_lock:
+            rooms = list(self.rooms.items())
+        copies = []
+        for room_id, room in rooms:
+            with self.room_locks.for_key(room_id):
+                if self.rooms.get(room_id) is room and room['status'] not in FINISHED_STATUSES:
+                    copies.append(room.copy())
+        self.journal.write_snapshot(generation, copies)
+
+    def start(self) -> 'MemoryRoomStore':
+        """Запустить периодические снимки (если есть журнал)"""
+        if self.journal is not None and self._checkpointer is None:
+            self._stopped.clear()
+            self._checkpointer = Thread(target=self._checkpoint_loop, daemon=True, name='room-store-snapshot')
+            self._checkpointer.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._checkpointer is not None:
+            self._checkpointer.join(timeout=5)
+            self._checkpointer = None
+            self.checkpoint()
+            self.journal.close()
+
+    def _checkpoint_loop(self) -> None:
+        while not self._stopped.wait(self.journal.snapshot_interval):
+            try:
+                self.checkpoint()
+            except Exception as e:
+                logger.error(f"Room snapshot error: {e}")
+
+
+class SQLiteRoomStore(RoomStore):
+    """
+    Комнаты в общей SQLite-базе: одно состояние для всех процессов
+
+    Каждая операция — транзакция BEGIN IMMEDIATE, поэтому два воркера не
+    займут одно и то же место. Комната хранится JSON-документом в
+    room_state, открытые комнаты ищутся по индексу (status, entry_fee,
+    created_at), активные участники — в room_members. Каждое изменение
+    получает номер из room_state_seq; фоновый поток (start) по этим номерам
+    находит изменения других процессов и вызывает для них on_change.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_room_size: int = MAX_ROOM_SIZE,
+                 on_change: Optional[Callable[[Room], None]] = None, poll_interval: float = POLL_INTERVAL):
+        self.db_path = db_path or DB_PATH
+        self.max_room_size = max_room_size
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        self._own_seqs = set()
+        self._own_lock = Lock()
+        self._stopped = Event()
+        self._watcher: Optional[Thread] = None
+
+    # Хранение
+
+    @staticmethod
+    def _load(conn, room_id: str) -> Optional[Room]:
+        row = conn.execute('SELECT data FROM room_state WHERE room_id = ?', (room_id,)).fetchone()
+        return None if row is None else Room.from_dict(json.loads(row[0]))
+
+    @contextmanager
+    def _transaction(self) -> Iterator[Tuple[Any, List[int]]]:
+        """Транзакция записи; номера изменений запоминаются как свои только после COMMIT"""
+        seqs: List[int] = []
+        with db.transaction(self.db_path) as conn:
+            yield conn, seqs
+        with self._own_lock:
+            self._own_seqs.update(seqs)
+
+    def _save(self, conn, seqs: List[int], room: Room, created: bool = False) -> None:
+        """Записать комнату и ее участников под новым номером изменения"""
+        conn.execute('UPDATE room_state_seq SET value = value + 1 WHERE id = 1')
+        seq = conn.execute('SELECT value FROM room_state_seq WHERE id = 1').fetchone()[0]
+        seqs.append(seq)
+        data = json.dumps(room.to_dict())
+        if created:
+            conn.execute('''INSERT INTO room_state (room_id, entry_fee, status, seats, data, created_at, seq)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                         (room['room_id'], room['entry_fee'], room['status'], len(room['participants']),
+                          data, time.time(), seq))
+        else:
+            conn.execute('UPDATE room_state SET status = ?, seats = ?, data = ?, seq = ? WHERE room_id = ?',
+                         (room['status'], len(room['participants']), data, seq, room['room_id']))
+
+        if room['status'] in FINISHED_STATUSES:
+            conn.execute('DELETE FROM room_members WHERE room_id = ?', (room['room_id'],))
+        else:
+            conn.executemany('INSERT OR REPLACE INTO room_members (user_id, room_id) VALUES (?, ?)',
+                             [(p['user_id'], room['room_id']) for p in room['participants']])
+
+    def _changed(self, room: Room) -> None:
+        """Вызывается после COMMIT"""
+        if self.on_change is not None:
+            self.on_change(room)
+
+    def _open(self, conn, seqs: List[int], entry_fee: int) -> Tuple[Room, bool]:
+        row = conn.execute('''SELECT data FROM room_state
+                              WHERE status = 'waiting' AND entry_fee = ? AND seats < ?
+                              ORDER BY created_at LIMIT 1''', (entry_fee, self.max_room_size)).fetchone()
+        if row is not None:
+            return Room.from_dict(json.loads(row[0])), False
+
+        room = new_room(entry_fee, self.max_room_size)
+        self._save(conn, seqs, room, created=True)
+        logger.info(f"Created new room: {room['room_id']} with entry fee: {entry_fee}")
+        return room, True
+
+    # Операции
+
+    def read(self, room_id: str, func: Callable[[Room], Any]) -> Any:
+        row = db.fetch_one('SELECT data FROM room_state WHERE room_id = ?', (room_id,), self.db_path)
+        return None if row is None else func(Room.from_dict(json.loads(row[0])))
+
+    def open_room(self, entry_fee: int) -> Room:
+        with self._transaction() as (conn, seqs):
+            room, created = self._open(conn, seqs, entry_fee)
+        if created:
+            self._changed(room)
+        return room
+
+    def join(self, entry_fee: int, participant: Union[Participant, Dict]) -> Tuple[Room, bool]:
+        with self._transaction() as (conn, seqs):
+            room, created = self._open(conn, seqs, entry_fee)
+            joined = conn.execute('SELECT 1 FROM room_members WHERE user_id = ? AND room_id = ?',
+                                  (participant['user_id'], room['room_id'])).fetchone() is None
+            if joined:
+                self._add(room, participant)
+                room.touch()
+                self._save(conn, seqs, room)
+            else:
+                logger.warning(f"User {participant['user_id']} already in room {room['room_id']}")
+        if joined or created:
+            self._changed(room)
+        return room.copy(), joined
+
+    def leave(self, room_id: str, user_id: int) -> bool:
+        with self._transaction() as (conn, seqs):
+            room = self._load(conn, room_id)
+            if room is None or not self._remove_unpaid(room, user_id):
+                return False
+            conn.execute('DELETE FROM room_members WHERE user_id = ? AND room_id = ?', (user_id, room_id))
+            room.touch()
+            self._save(conn, seqs, room)
+        self._changed(room)
+        return True
+
+    def mark_paid(self, room_id: str, user_id: int, payment_id: int) -> bool:
+        with self._transaction() as (conn, seqs):
+            room = self._load(conn, room_id)
+            if room is None or not self._set_paid(room, user_id, payment_id):
+                return False
+            self._save(conn, seqs, room)
+        return self.fully_paid(room)
+
+    def transition(self, room_id: str, func: Callable[[Room], Any]) -> Any:
+        with self._transaction() as (conn, seqs):
+            room = self._load(conn, room_id)
+            if room is None:
+                return None
+            result = func(room)
+            if result is None:
+                return None
+            room.touch()
+            self._save(conn, seqs, room)
+        self._changed(room)
+        return result
+
+    def active_room_of(self, user_id: int) -> Optional[str]:
+        return db.fetch_value('SELECT room_id FROM room_members WHERE user_id = ?', (user_id,), self.db_path)
+
+    def room_ids(self, status: Optional[str] = None) -> List[str]:
+        if status is None:
+            rows = db.fetch_all('SELECT room_id FROM room_state', db_path=self.db_path)
+        else:
+            rows = db.fetch_all('SELECT room_id FROM room_state WHERE status = ?', (status,), self.db_path)
+        return [row[0] for row in rows]
+
+    def remove(self, room_id: str) -> None:
+        with db.transaction(self.db_path) as conn:
+            conn.execute('DELETE FROM room_members WHERE room_id = ?', (room_id,))
+            conn.execute('DELETE FROM room_state WHERE room_id = ?', (room_id,))
+
+    def restore(self, find_payment: Callable[[str, int], Optional[int]],
+                grace: float = UNPAID_SEAT_GRACE) -> int:
+        """
+        Сверить места без привязанного платежа с базой (при старте воркера)
+        Платеж записан — привязываем, нет — место освобождается, но только
+        если занято дольше grace секунд: свежее место может сейчас оплачивать
+        другой воркер. Возвращает число активных комнат.
+        """
+        room_ids = [row[0] for row in db.fetch_all(
+            "SELECT room_id FROM room_state WHERE status IN ('waiting', 'drawing')", db_path=self.db_path)]
+        cutoff = time.time() - grace
+        for room_id in room_ids:
+            changed = False
+            with self._transaction() as (conn, seqs):
+                room = self._load(conn, room_id)
+                for participant in list(room['participants']) if room is not None else []:
+                    user_id = participant['user_id']
+                    if participant['payment_id'] is not None:
+                        continue
+                    payment_id = find_payment(room_id, user_id)
+                    if payment_id is not None:
+                        changed |= self._set_paid(room, user_id, payment_id)
+                    elif participant['joined_at'] < cutoff and self._remove_unpaid(room, user_id):
+                        conn.execute('DELETE FROM room_members WHERE user_id = ? AND room_id = ?', (user_id, room_id))
+                        room.touch()
+                        changed = True
+                if changed:
+                    self._save(conn, seqs, room)
+            if changed:
+                self._changed(room)
+
+        logger.info(f"Checked unpaid seats in {len(room_ids)} rooms")
+        return len(room_ids)
+
+    # Изменения других процессов
+
+    def start(self) -> 'SQLiteRoomStore':
+        """Запустить поток, доставляющий on_change для изменений других процессов"""
+        if self._watcher is None and self.on_change is not None:
+            self._stopped.clear()
+            last_seq = db.fetch_value('SELECT value FROM room_state_seq WHERE id = 1', db_path=self.db_path,
+                                      default=0)
+            self._watcher = Thread(target=self._watch, args=(last_seq,), daemon=True, name='room-store-watch')
+            self._watcher.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def _watch(self, last_seq: int) -> None:
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                rows = db.fetch_all('SELECT seq, data FROM room_state WHERE seq > ? ORDER BY seq',
+                                    (last_seq,), self.db_path)
+            except Exception as e:
+                logger.error(f"Room store watcher error: {e}")
+                continue
+            for seq, data in rows:
+                last_seq = seq
+                with self._own_lock:
+                    own = seq in self._own_seqs
+                    self._own_seqs.discard(seq)
+                if not own:
+                    self._changed(Room.from_dict(json.loads(data)))
+            with self._own_lock:
+                # Свои номера, которые уже перезаписаны следующими изменениями, больше не встретятся
+                self._own_seqs = {seq for seq in self._own_seqs if seq > last_seq}
+
+
+def create_room_store(backend: Optional[str] = None, db_path: Optional[str] = None,
+                      max_room_size: int = MAX_ROOM_SIZE,
+                      on_change: Optional[Callable[[Room], None]] = None,
+                      journal_path: Optional[str] = None) -> RoomStore:
+    """
+    Хранилище по имени бэкенда: memory (по умолчанию) или sqlite (переменная ROOM_STORE)
+    journal_path — снимок и журнал комнат для memory (SQLite-хранилище и так на диске).
+    """
+    backend = backend or os.environ.get('ROOM_STORE', 'memory')
+    if backend == 'memory':
+        journal = RoomJournal(journal_path) if journal_path else None
+        return MemoryRoomStore(max_room_size, on_change=on_change, journal=journal)
+    if backend == 'sqlite':
+        return SQLiteRoomStore(db_path, max_room_size, on_change=on_change)
+    raise ValueError(f"Unknown room store backend: {backend}")
@@ -1,75 +1,240 @@
 import time
+import heapq
+import sqlite3
 import logging
-from threading import Thread
-from lottery_engine import conduct_lottery
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Condition, Event
+from typing import Dict, List, Tuple
+import db
+from lottery_engine import completed_result, draw_winner, record_lottery_result
+from room_model import FINISHED_STATUSES, Participant, Room
+from room_store import RoomStore
+from db import DB_PATH
 from bot import notify_room_participants
+import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SAFETY_SCAN_INTERVAL = 30  # Секунд между страховочными проходами по всем комнатам
+POST_DRAW_WORKERS = 4      # Потоки для записи результатов в БД и уведомлений
+RECORD_RETRY_DELAY = 0.1  # Первая пауза между попытками записи результата, дальше вдвое длиннее
+RECORD_RETRY_MAX = 30     # Предел паузы: результат записывается, пока планировщик работает
+
+time_to_draw = metrics.latency('scheduler.time_to_draw_seconds')
+draws_total = metrics.counter('scheduler.draws_total')
+safety_net_draws = metrics.counter('scheduler.safety_net_draws_total')
+record_failures = metrics.counter('scheduler.record_failures_total')
+reconciled_draws = metrics.counter('scheduler.reconciled_draws_total')
+
 class LotteryScheduler:
-    """Планировщик для автоматического проведения розыгрышей"""
-    
-    def __init__(self, rooms, rooms_lock, db_path='lottery.db'):
-        self.rooms = rooms
-        self.rooms_lock = rooms_lock
+    """
+    Планировщик розыгрышей
+
+    Заполненные комнаты передаются напрямую через notify_room_full() и
+    разыгрываются сразу (или через draw_delay секунд — время на анимацию).
+    Периодический проход по всем комнатам остался только как страховка
+    для комнат, о которых планировщик не узнал.
+
+    Атомарно в хранилище комнат (RoomStore.transition) выполняется только
+    смена состояния комнаты; запись в БД и уведомления Telegram идут после
+    этого в пуле потоков. Комнату, уже разыгранную другим процессом с
+    общим хранилищем, transition не отдаст второй раз.
+
+    Запись результата повторяется, пока не удастся или планировщик не
+    остановится. Результат, не записанный до остановки или падения
+    процесса, при следующем старте находит _reconcile_draws по строкам
+    rooms без итога.
+    """
+
+    def __init__(self, store: RoomStore, db_path=DB_PATH,
+                 draw_delay: float = 0, safety_scan_interval: float = SAFETY_SCAN_INTERVAL,
+                 post_draw_workers: int = POST_DRAW_WORKERS):
+        self.store = store
         self.db_path = db_path
+        self.draw_delay = draw_delay
+        self.safety_scan_interval = safety_scan_interval
         self.running = False
-    
+        self._ready = Event()
+        self._post_draw = ThreadPoolExecutor(max_workers=post_draw_workers, thread_name_prefix='post-draw')
+
+        # Очередь розыгрышей: (время запуска, room_id); room_id -> время заполнения
+        self._cond = Condition()
+        self._due: List[Tuple[float, str]] = []
+        self._filled_at: Dict[str, float] = {}
+        metrics.gauge('scheduler.pending_draws', lambda: len(self._due))
+
     def start(self):
         """Запустить планировщик"""
         if self.running:
             logger.warning("Scheduler already running")
             return
-        
+
         self.running = True
         thread = Thread(target=self._run, daemon=True)
         thread.start()
+        # Ждем первого страховочного прохода, чтобы он не пересекся с очередью
+        self._ready.wait(timeout=5)
         logger.info("Lottery scheduler started")
-    
+
     def stop(self):
         """Остановить планировщик"""
-        self.running = False
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        # Дожидаемся записи уже разыгранных комнат; уведомления только ставятся в очередь
+        self._post_draw.shutdown(wait=True)
         logger.info("Lottery scheduler stopped")
-    
+
+    def notify_room_full(self, room_id: str):
+        """Комната заполнена: поставить розыгрыш в очередь (не блокирует)"""
+        if not self.running:
+            # Не запущен — комнату подберет страховочный проход после старта
+            return
+
+        now = time.monotonic()
+        with self._cond:
+            if room_id in self._filled_at:
+                return
+            self._filled_at[room_id] = now
+            heapq.heappush(self._due, (now + self.draw_delay, room_id))
+            self._cond.notify()
+
+    def _next_due(self, deadline: float) -> List[str]:
+        """Дождаться комнат, время розыгрыша которых наступило (или deadline)"""
+        with self._cond:
+            while self.running:
+                now = time.monotonic()
+                if self._due and self._due[0][0] <= now:
+                    ready = []
+                    while self._due and self._due[0][0] <= now:
+                        ready.append(heapq.heappop(self._due)[1])
+                    return ready
+                if now >= deadline:
+                    return []
+                wake_at = min(deadline, self._due[0][0]) if self._due else deadline
+                self._cond.wait(wake_at - now)
+            return []
+
     def _run(self):
         """Основной цикл планировщика"""
+        next_scan = time.monotonic() + self.safety_scan_interval
+        # Сразу после старта дописываем потерянные результаты и подбираем комнаты, заполненные до запуска
+        self._safe(self._reconcile_draws)
+        self._safe(self._check_and_conduct_lotteries)
+        self._ready.set()
+
         while self.running:
-            try:
-                self._check_and_conduct_lotteries()
-                time.sleep(5)  # Проверяем каждые 5 секунд
-            except Exception as e:
-                logger.error(f"Scheduler error: {e}")
-                time.sleep(5)
-    
+            for room_id in self._next_due(next_scan):
+                self._safe(self._conduct, room_id)
+
+            if time.monotonic() >= next_scan:
+                self._safe(self._check_and_conduct_lotteries)
+                next_scan = time.monotonic() + self.safety_scan_interval
+
+    def _safe(self, func, *args):
+        try:
+            func(*args)
+        except Exception as e:
+            logger.error(f"Scheduler error: {e}")
+
     def _check_and_conduct_lotteries(self):
-        """Проверить комнаты и провести розыгрыши"""
-        with self.rooms_lock:
-            rooms_to_draw = []
-            
-            # Находим комнаты готовые к розыгрышу
-            for room_id, room in self.rooms.items():
-                if room['status'] == 'drawing':
-                    # Проверяем, прошло ли достаточно времени для анимации
-                    # В реальности можно добавить задержку для анимации
-                    rooms_to_draw.append(room_id)
-            
-            # Проводим розыгрыши
-            for room_id in rooms_to_draw:
-                logger.info(f"Conducting lottery for room {room_id}")
-                result = conduct_lottery(room_id, self.rooms, self.db_path)
-                
-                if result:
-                    # Отправляем уведомления участникам
-                    try:
-                        notify_room_participants(result)
-                    except Exception as e:
-                        logger.error(f"Error notifying participants: {e}")
-                else:
-                    logger.error(f"Failed to conduct lottery for room {room_id}")
-
-def start_scheduler(rooms, rooms_lock, db_path='lottery.db'):
+        """Страховочный проход: разыграть комнаты в статусе drawing, не попавшие в очередь"""
+        with self._cond:
+            queued = set(self._filled_at)
+        # Комната в drawing с неоплаченным местом ждет записи платежа (mark_paid)
+        rooms_to_draw = [room_id for room_id in self.store.room_ids('drawing')
+                         if room_id not in queued and self.store.read(room_id, RoomStore.fully_paid)]
+
+        for room_id in rooms_to_draw:
+            logger.warning(f"Room {room_id} picked up by safety scan")
+            safety_net_draws.inc()
+            self._conduct(room_id)
+
+    def _reconcile_draws(self):
+        """
+        Комнаты, итог которых не попал в БД: разыгранные в хранилище
+        (completed) записываются, пропавшие из хранилища заполненные
+        разыгрываются заново — участники победителя еще не узнали.
+        """
+        rows = db.fetch_all(f'''
+            SELECT room_id, entry_fee, total_pool FROM rooms
+            WHERE status NOT IN ({', '.join('?' * len(FINISHED_STATUSES))})
+        ''', FINISHED_STATUSES, self.db_path)
+
+        for room_id, entry_fee, total_pool in rows:
+            status = self.store.read(room_id, lambda room: room['status'])
+            if status == 'completed':
+                result = self.store.read(room_id, completed_result)
+            elif status is None:
+                participants = [Participant(user_id, username or '', first_name or '', payment_id)
+                                for user_id, username, first_name, payment_id in db.fetch_all('''
+                    SELECT rp.user_id, u.username, u.first_name, rp.payment_id
+                    FROM room_participants rp LEFT JOIN users u ON u.user_id = rp.user_id
+                    WHERE rp.room_id = ? ORDER BY rp.id
+                ''', (room_id,), self.db_path)]
+                if len(participants) < self.store.max_room_size:
+                    continue
+                room = Room(room_id, entry_fee, self.store.max_room_size, 'drawing', participants, total_pool)
+                result = draw_winner(room_id, {room_id: room})
+            else:
+                continue  # Ждет игроков или розыгрыша
+
+            logger.warning(f"Room {room_id} has no recorded result, recording it now")
+            reconciled_draws.inc()
+            self._post_draw.submit(self._finish_draw, result)
+
+    @staticmethod
+    def _draw(room: Dict):
+        if not RoomStore.fully_paid(room):
+            # Уже разыграна (страховочным проходом или другим процессом) или еще не оплачена
+            return None
+        logger.info(f"Conducting lottery for room {room['room_id']}")
+        return draw_winner(room['room_id'], {room['room_id']: room})
+
+    def _conduct(self, room_id: str):
+        """Провести розыгрыш: смена состояния в хранилище, остальное — в пуле потоков"""
+        with self._cond:
+            filled_at = self._filled_at.pop(room_id, None)
+
+        result = self.store.transition(room_id, self._draw)
+        if result is None:
+            return
+
+        draws_total.inc()
+        if filled_at is not None:
+            time_to_draw.observe(time.monotonic() - filled_at)
+        self._post_draw.submit(self._finish_draw, result)
+
+    def _finish_draw(self, result: Dict):
+        """Записать результат в БД и уведомить участников (вне хранилища комнат)"""
+        room_id = result['room_id']
+        delay = RECORD_RETRY_DELAY
+        while True:
+            try:
+                recorded = record_lottery_result(result, self.db_path)
+                break
+            except sqlite3.Error as e:
+                logger.error(f"Error recording lottery for room {room_id}, retrying in {delay}s: {e}")
+                with self._cond:
+                    if not self.running:
+                        # Запишет _reconcile_draws при следующем старте
+                        record_failures.inc()
+                        return
+                    self._cond.wait(delay)
+                delay = min(delay * 2, RECORD_RETRY_MAX)
+
+        if not recorded:
+            return  # Уже записан (и участники уведомлены) другим проходом
+
+        # Отправляем уведомления участникам
+        try:
+            notify_room_participants(result)
+        except Exception as e:
+            logger.error(f"Error notifying participants: {e}")
+
+def start_scheduler(store: RoomStore, db_path=DB_PATH, draw_delay: float = 0):
     """Создать и запустить планировщик"""
-    scheduler = LotteryScheduler(rooms, rooms_lock, db_path)
+    scheduler = LotteryScheduler(store, db_path, draw_delay=draw_delay)
     scheduler.start()
     return scheduler
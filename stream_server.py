@@ -0,0 +1,190 @@
+import re
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Callable, Optional
+
+from broadcast import RoomBroadcaster, Subscription
+
+logger = logging.getLogger(__name__)
+
+STREAM_PATH = re.compile(r'^/api/room/([A-Za-z0-9_\-]+)/stream$')
+REQUEST_TIMEOUT = 10      # Секунд на получение заголовков запроса
+MAX_HEADER_LINES = 64
+READ_BUFFER_LIMIT = 8192  # Ограничение буфера StreamReader на соединение
+
+_CORS_HEADERS = (
+    'Access-Control-Allow-Origin: *\r\n'
+    'Access-Control-Allow-Methods: GET, OPTIONS\r\n'
+    'Access-Control-Allow-Headers: Content-Type, Last-Event-ID\r\n'
+)
+
+
+class AsyncSubscription(Subscription):
+    """
+    Подписка, которую обслуживает event loop
+    deliver() вызывается из потоков-издателей и передает сообщение в loop
+    через call_soon_threadsafe; ожидание — asyncio.Event без потоков.
+    """
+
+    def __init__(self, hub: RoomBroadcaster, room_id: str, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.hub = hub
+        self.room_id = room_id
+        self.loop = loop
+        self._messages = deque(maxlen=maxsize)
+        self._ready = asyncio.Event()
+
+    def deliver(self, message: Optional[str]) -> None:
+        try:
+            self.loop.call_soon_threadsafe(self._push, message)
+        except RuntimeError:
+            # loop уже остановлен — соединение все равно будет закрыто
+            pass
+
+    def _push(self, message: Optional[str]) -> None:
+        self._messages.append(message)
+        self._ready.set()
+
+    async def next(self, timeout: float) -> Optional[str]:
+        """Следующее сообщение; '' если за timeout ничего не пришло"""
+        if not self._messages:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return ''
+        return self._messages.popleft()
+
+
+class StreamServer:
+    """
+    Асинхронный сервер SSE-потоков /api/room/<room_id>/stream
+
+    Работает рядом с Flask API в том же процессе (отдельный поток с event
+    loop) и использует тот же RoomBroadcaster. Каждое соединение — корутина,
+    а не поток воркера, поэтому ожидающие игроки не занимают пул gunicorn.
+
+    open_stream(room_id, subscription) подписывает subscription на комнату
+    и возвращает ее или None, если комната не найдена. reuse_port —
+    SO_REUSEPORT: несколько воркеров слушают один порт.
+    """
+
+    def __init__(self, hub: RoomBroadcaster, open_stream: Callable[[str, Subscription], Optional[Subscription]],
+                 host: str = '0.0.0.0', port: int = 0, heartbeat_interval: Optional[float] = None,
+                 reuse_port: bool = False):
+        self.hub = hub
+        self.open_stream = open_stream
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port
+        self.heartbeat_interval = heartbeat_interval or hub.heartbeat_interval
+        self.active_streams = 0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+
+    def start(self) -> 'StreamServer':
+        """Запустить сервер в фоновом потоке и дождаться привязки порта"""
+        self._thread = threading.Thread(target=self._run, name='stream-server', daemon=True)
+        self._thread.start()
+        self._started.wait()
+        if self._server is None:
+            raise RuntimeError('Stream server failed to start')
+        logger.info(f"Stream server listening on {self.host}:{self.port}")
+        return self
+
+    def stop(self) -> None:
+        """Остановить сервер и закрыть все потоки"""
+        if self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self._server = self.loop.run_until_complete(asyncio.start_server(
+                self._handle, self.host, self.port, limit=READ_BUFFER_LIMIT, backlog=4096,
+                reuse_port=self.reuse_port or None))
+            self.port = self._server.sockets[0].getsockname()[1]
+        except OSError as e:
+            logger.error(f"Stream server error: {e}")
+            return
+        finally:
+            self._started.set()
+
+        try:
+            self.loop.run_forever()
+        finally:
+            self._server.close()
+            # Закрываем открытые потоки: отменяем корутины соединений
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        """Прочитать строку запроса и пропустить заголовки"""
+        request_line = await reader.readline()
+        for _ in range(MAX_HEADER_LINES):
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+        method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        return method, target.split('?', 1)[0]
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            method, path = await asyncio.wait_for(self._read_request(reader), REQUEST_TIMEOUT)
+            match = STREAM_PATH.match(path)
+
+            if method == 'OPTIONS':
+                writer.write(f'HTTP/1.1 204 No Content\r\n{_CORS_HEADERS}Connection: close\r\n\r\n'.encode())
+            elif method != 'GET' or not match:
+                writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            else:
+                await self._stream(match.group(1), writer)
+            await writer.drain()
+        except (ConnectionError, asyncio.TimeoutError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _stream(self, room_id: str, writer: asyncio.StreamWriter) -> None:
+        writer.write((
+            'HTTP/1.1 200 OK\r\n'
+            'Content-Type: text/event-stream\r\n'
+            'Cache-Control: no-cache\r\n'
+            'X-Accel-Buffering: no\r\n'
+            f'{_CORS_HEADERS}'
+            'Connection: close\r\n\r\n'
+        ).encode())
+
+        subscription = AsyncSubscription(self.hub, room_id, self.loop, self.hub.queue_size)
+        # Хранилище комнат блокирует (лок или SQLite), поэтому не вызываем его в event loop
+        if await self.loop.run_in_executor(None, self.open_stream, room_id, subscription) is None:
+            writer.write(RoomBroadcaster.format_message({'error': 'Room not found'}).encode())
+            return
+
+        self.active_streams += 1
+        try:
+            while True:
+                message = await subscription.next(self.heartbeat_interval)
+                if message is None:
+                    break
+                writer.write((message or ': ping\n\n').encode())
+                await writer.drain()
+        finally:
+            self.active_streams -= 1
+            subscription.close()
+
+
+def start_stream_server(hub: RoomBroadcaster, open_stream, host: str = '0.0.0.0', port: int = 0,
+                        reuse_port: bool = False) -> StreamServer:
+    """Создать и запустить асинхронный сервер потоков"""
+    return StreamServer(hub, open_stream, host, port, reuse_port=reuse_port).start()
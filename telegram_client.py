@@ -0,0 +1,162 @@
+import os
+import logging
+from threading import Lock
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BOT_TOKEN = os.environ.get('BOT_TOKEN', '')
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')
+
+POOL_SIZE = 32          # Keep-alive соединений на хост (потоки вебхука + отправители уведомлений)
+CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10
+LONG_POLL_MARGIN = 10   # getUpdates: сверх timeout long polling
+
+# Таймаут чтения по методам. На pre_checkout_query Telegram ждет ответа не больше 10 секунд.
+METHOD_TIMEOUTS = {
+    'answerPreCheckoutQuery': 5,
+    'sendMessage': 10,
+    'createInvoiceLink': 10,
+    'setMyCommands': 15,
+    'setWebhook': 30,
+    'refundStarPayment': 15,
+}
+
+api_errors = metrics.counter('telegram.api_errors_total')
+
+
+class TelegramError(Exception):
+    """Bot API вернул ошибку (ok=false)"""
+
+    def __init__(self, method: str, description: str, error_code: Optional[int] = None):
+        super().__init__(f'{method}: {description}')
+        self.method = method
+        self.description = description
+        self.error_code = error_code
+
+
+class TelegramRetryAfter(TelegramError):
+    """429 Too Many Requests: повторить не раньше чем через retry_after секунд"""
+
+    def __init__(self, method: str, description: str, retry_after: float):
+        super().__init__(method, description, 429)
+        self.retry_after = retry_after
+
+
+class TelegramServerError(TelegramError):
+    """5xx на стороне Telegram или прокси — запрос можно повторить"""
+
+
+class TelegramNetworkError(TelegramError):
+    """Таймаут или ошибка соединения — запрос можно повторить"""
+
+
+class TelegramClient:
+    """
+    Клиент Bot API с общим пулом keep-alive соединений
+
+    Все вызовы идут через один requests.Session, поэтому TLS-рукопожатие
+    выполняется один раз на соединение, а не на каждый запрос. У каждого
+    метода свой таймаут; ошибки поднимаются типизированными исключениями.
+    """
+
+    def __init__(self, token: str = BOT_TOKEN, api_url: str = TELEGRAM_API_URL,
+                 pool_size: int = POOL_SIZE, timeouts: Optional[Dict[str, float]] = None):
+        self.base_url = f'{api_url.rstrip("/")}/bot{token}'
+        self.timeouts = dict(METHOD_TIMEOUTS, **(timeouts or {}))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def call(self, method: str, params: Optional[Dict] = None, timeout: Optional[float] = None):
+        """Вызвать метод Bot API и вернуть поле result"""
+        read_timeout = timeout if timeout is not None else self.timeouts.get(method, DEFAULT_READ_TIMEOUT)
+        try:
+            with metrics.latency(f'telegram.{method}_seconds').time():
+                response = self.session.post(f'{self.base_url}/{method}', json=params or {},
+                                             timeout=(CONNECT_TIMEOUT, read_timeout))
+        except requests.RequestException as e:
+            api_errors.inc()
+            raise TelegramNetworkError(method, str(e)) from e
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = {'ok': False, 'error_code': response.status_code,
+                    'description': f'HTTP {response.status_code}'}
+
+        if data.get('ok'):
+            return data.get('result')
+
+        api_errors.inc()
+        error_code = data.get('error_code') or response.status_code
+        description = data.get('description', '')
+        retry_after = (data.get('parameters') or {}).get('retry_after')
+        if error_code == 429 and retry_after is not None:
+            raise TelegramRetryAfter(method, description, retry_after)
+        if error_code >= 500:
+            raise TelegramServerError(method, description, error_code)
+        raise TelegramError(method, description, error_code)
+
+    def send_message(self, chat_id, text: str, reply_markup: Optional[Dict] = None,
+                     parse_mode: Optional[str] = 'HTML'):
+        params = {'chat_id': chat_id, 'text': text}
+        if parse_mode:
+            params['parse_mode'] = parse_mode
+        if reply_markup:
+            params['reply_markup'] = reply_markup
+        return self.call('sendMessage', params)
+
+    def create_invoice_link(self, invoice: Dict) -> str:
+        return self.call('createInvoiceLink', invoice)
+
+    def answer_pre_checkout_query(self, query_id: str, ok: bool, error_message: Optional[str] = None):
+        params = {'pre_checkout_query_id': query_id, 'ok': ok}
+        if error_message:
+            params['error_message'] = error_message
+        return self.call('answerPreCheckoutQuery', params)
+
+    def refund_star_payment(self, user_id: int, telegram_payment_charge_id: str):
+        return self.call('refundStarPayment', {'user_id': user_id,
+                                               'telegram_payment_charge_id': telegram_payment_charge_id})
+
+    def set_webhook(self, url: str):
+        return self.call('setWebhook', {'url': url})
+
+    def set_my_commands(self, commands):
+        return self.call('setMyCommands', {'commands': commands})
+
+    def get_updates(self, offset: int = 0, timeout: int = 30):
+        return self.call('getUpdates', {'offset': offset, 'timeout': timeout},
+                         timeout=timeout + LONG_POLL_MARGIN)
+
+
+_client: Optional[TelegramClient] = None
+_client_lock = Lock()
+
+
+def get_client() -> TelegramClient:
+    """Общий клиент процесса (BOT_TOKEN и TELEGRAM_API_URL из окружения)"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = TelegramClient()
+        return _client
+
+
+def set_client(client: Optional[TelegramClient]) -> Optional[TelegramClient]:
+    """Подменить общий клиент (тесты, бенчмарки); вернуть предыдущий"""
+    global _client
+    with _client_lock:
+        previous, _client = _client, client
+        return previous
@@ -0,0 +1,14 @@
+import pytest
+
+@pytest.fixture
+def stop_after():
+    """Register background components (anything with stop()) to be stopped after the test"""
+    registered = []
+
+    def register(instance):
+        registered.append(instance)
+        return instance
+
+    yield register
+    for instance in reversed(registered):
+        instance.stop()
@@ -52,3 +52,90 @@ def test_webhook_missing_data(client):
     response = client.post('/webhook', json={})
     # Should return 200 even with invalid data (Telegram requirement)
     assert response.status_code == 200
+
+def test_current_room_invalid_init_data(client):
+    """Test current room endpoint rejects unsigned init data"""
+    response = client.post('/api/user/current-room', json={'initData': 'test_data'})
+    assert response.status_code == 401
+
+@pytest.fixture
+def room(monkeypatch):
+    """Open room with one seat taken, removed after the test"""
+    import app as app_module
+    monkeypatch.setattr(app_module.limiter, 'enabled', False)
+    room, _ = app_module.reserve_seat(250, {'id': 1, 'first_name': 'User1'})
+    yield room
+    app_module.room_store.remove(room['room_id'])
+
+def test_room_etag_not_modified(client, room):
+    """Test that the room ETag is its version and a matching If-None-Match gets 304"""
+    import app as app_module
+    url = f"/api/room/{room['room_id']}"
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers['ETag'] == f'"{room["version"]}"'
+    assert response.json['participants'] == [{'user_id': 1, 'username': '', 'first_name': 'User1'}]
+
+    cached = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304 and cached.data == b''
+
+    app_module.reserve_seat(250, {'id': 2, 'first_name': 'User2'})
+    changed = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+    assert changed.status_code == 200
+    assert changed.json['version'] == room['version'] + 1
+
+def test_room_long_poll(client, room, monkeypatch):
+    """Test that ?since= waits for the next version and times out with 304"""
+    import threading
+    import time
+    import app as app_module
+    url = f"/api/room/{room['room_id']}?since={room['version']}"
+
+    monkeypatch.setattr(app_module, 'ROOM_POLL_TIMEOUT', 0.1)
+    assert client.get(url).status_code == 304
+
+    monkeypatch.setattr(app_module, 'ROOM_POLL_TIMEOUT', 5)
+    timer = threading.Timer(0.2, app_module.reserve_seat, (250, {'id': 2, 'first_name': 'User2'}))
+    started = time.monotonic()
+    timer.start()
+    response = client.get(url)
+    timer.join()
+    assert response.status_code == 200
+    assert response.json['version'] == room['version'] + 1
+    assert time.monotonic() - started < 2
+
+    # An older version is answered immediately
+    assert client.get(f"/api/room/{room['room_id']}?since=0").json['version'] == room['version'] + 1
+
+def test_long_poll_sees_change_published_during_read(client, room, monkeypatch):
+    """Test that a change published outside the read lock (as the SQLite watcher does) wakes the poll"""
+    import app as app_module
+    real_read = app_module.room_store.read
+    reads = []
+
+    def racing_read(room_id, func):
+        stale = real_read(room_id, lambda current: current.copy())
+        if not reads:
+            app_module.reserve_seat(250, {'id': 2, 'first_name': 'User2'})
+        reads.append(room_id)
+        return None if stale is None else func(stale)
+
+    monkeypatch.setattr(app_module.room_store, 'read', racing_read)
+    monkeypatch.setattr(app_module, 'ROOM_POLL_TIMEOUT', 5)
+    response = client.get(f"/api/room/{room['room_id']}?since={room['version']}")
+    assert response.status_code == 200
+    assert response.json['version'] == room['version'] + 1
+
+def test_metrics_require_admin_token(client, monkeypatch):
+    """Test that /api/metrics is hidden behind X-Admin-Token like /api/stats"""
+    import app as app_module
+
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', '')
+    assert client.get('/api/metrics', headers={'X-Admin-Token': ''}).status_code == 403
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', 'secret')
+    assert client.get('/api/metrics').status_code == 403
+    assert client.get('/api/metrics', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+
+    response = client.get('/api/metrics', headers={'X-Admin-Token': 'secret'})
+    assert response.status_code == 200
+    assert 'webhook.updates_total' in response.json
@@ -0,0 +1,78 @@
+import pytest
+import sys
+import os
+import json
+import threading
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from broadcast import RoomBroadcaster
+
+def read_event(message):
+    """Decode SSE data message"""
+    assert message.startswith('data: ')
+    return json.loads(message[len('data: '):])
+
+def test_publish_fans_out_same_payload():
+    """Test that one publish reaches every subscriber with one serialization"""
+    hub = RoomBroadcaster()
+    first = hub.subscribe('room')
+    second = hub.subscribe('room')
+
+    assert hub.publish('room', {'status': 'waiting', 'participants': []}) == 2
+
+    a = first.get(timeout=1)
+    b = second.get(timeout=1)
+    assert a is b
+    assert read_event(a)['status'] == 'waiting'
+
+def test_new_subscriber_gets_current_state():
+    """Test that a late subscriber receives the last published state first"""
+    hub = RoomBroadcaster()
+    hub.subscribe('room')
+    hub.publish('room', {'status': 'drawing'})
+
+    late = hub.subscribe('room')
+    assert read_event(late.get(timeout=1))['status'] == 'drawing'
+
+def test_publish_without_subscribers_is_free():
+    """Test that nothing is serialized for rooms nobody listens to"""
+    hub = RoomBroadcaster()
+    assert hub.publish('room', {'status': 'waiting'}) == 0
+
+    subscription = hub.subscribe('room', current={'status': 'drawing'})
+    assert read_event(subscription.get(timeout=1))['status'] == 'drawing'
+
+def test_stream_heartbeat_and_close():
+    """Test that idle streams send heartbeats and final state closes them"""
+    hub = RoomBroadcaster(heartbeat_interval=0.05)
+    subscription = hub.subscribe('room')
+    stream = hub.stream(subscription)
+
+    assert next(stream) == ': ping\n\n'
+
+    hub.publish('room', {'status': 'completed'}, final=True)
+    assert read_event(next(stream))['status'] == 'completed'
+    with pytest.raises(StopIteration):
+        next(stream)
+    assert hub.subscriber_count('room') == 0
+
+def test_slow_subscriber_keeps_latest_state():
+    """Test that a full queue drops the oldest messages, not the newest"""
+    hub = RoomBroadcaster(queue_size=2)
+    subscription = hub.subscribe('room')
+    for i in range(10):
+        hub.publish('room', {'version': i})
+
+    assert read_event(subscription.get(timeout=1))['version'] == 8
+    assert read_event(subscription.get(timeout=1))['version'] == 9
+
+def test_waiting_stream_wakes_on_publish():
+    """Test that a blocked stream is woken by a publish from another thread"""
+    hub = RoomBroadcaster(heartbeat_interval=5)
+    stream = hub.stream(hub.subscribe('room'))
+    timer = threading.Timer(0.05, hub.publish, args=('room', {'status': 'waiting'}))
+    timer.start()
+    assert read_event(next(stream))['status'] == 'waiting'
+    timer.join()
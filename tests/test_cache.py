@@ -0,0 +1,94 @@
+import pytest
+import sys
+import os
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app as app_module
+from cache import TTLCache
+from tests.test_migrations import make_init_data
+
+@pytest.fixture
+def verified(monkeypatch):
+    """Empty initData cache and a known bot token"""
+    monkeypatch.setattr(app_module, 'BOT_TOKEN', 'test-token')
+    cache = TTLCache(maxsize=100)
+    monkeypatch.setattr(app_module, 'verified_init_data', cache)
+    return cache
+
+def test_ttl_cache_expiry_and_eviction():
+    """Test that entries expire at their own deadline and the oldest entry is evicted"""
+    cache = TTLCache(maxsize=2)
+    cache.set('a', 1, expires_at=time.time() + 60)
+    cache.set('b', 2, expires_at=time.time() - 1)  # already expired, not stored
+    cache.set('c', 3)
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+
+    cache.set('d', 4)  # 'c' is least recently used
+    assert cache.get('c') is None
+    assert cache.get('a') == 1 and cache.get('d') == 4
+
+    cache.set('e', 5, expires_at=time.time() + 0.05)
+    time.sleep(0.06)
+    assert cache.get('e') is None
+
+def test_repeat_init_data_served_from_cache(verified):
+    """Test that the second validation of the same initData is a cache hit"""
+    init_data = make_init_data({'id': 1, 'first_name': 'Ann'}, 'test-token')
+
+    assert app_module.validate_telegram_init_data(init_data)['id'] == 1
+    assert verified.misses == 1
+    user = app_module.validate_telegram_init_data(init_data)
+    assert user == {'id': 1, 'first_name': 'Ann'}
+    assert verified.hits == 1
+
+    # Callers get a copy, the cached entry stays intact
+    user['id'] = 2
+    assert app_module.validate_telegram_init_data(init_data)['id'] == 1
+
+def test_tampered_or_expired_init_data_not_cached(verified, monkeypatch):
+    """Test that only verified, unexpired initData is cached"""
+    init_data = make_init_data({'id': 1}, 'test-token')
+    tampered = init_data.replace('"id": 1', '"id": 2')
+    assert app_module.validate_telegram_init_data(tampered) is None
+    assert len(verified) == 0
+
+    assert app_module.validate_telegram_init_data(init_data) is not None
+    assert len(verified) == 1
+
+    # An hour later the cached entry expires together with auth_date
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + app_module.INIT_DATA_MAX_AGE + 1)
+    assert app_module.validate_telegram_init_data(init_data) is None
+
+def test_known_users_skip_database(tmp_path, monkeypatch):
+    """Test that returning users are not written again and profile changes are upserted"""
+    import db
+    import group_commit
+
+    db_path = str(tmp_path / 'lottery.db')
+    monkeypatch.setattr(app_module, 'DB_PATH', db_path)
+    monkeypatch.setattr(app_module, 'known_users', TTLCache(maxsize=100))
+    writer = group_commit.get_writer(db_path)
+    submitted = []
+    original_submit = writer.submit
+    monkeypatch.setattr(writer, 'submit', lambda fn: submitted.append(fn) or original_submit(fn))
+
+    user = {'id': 7, 'username': 'ann', 'first_name': 'Ann'}
+    try:
+        app_module.get_or_create_user(user)
+        app_module.get_or_create_user(user)
+        assert len(submitted) == 1
+
+        app_module.get_or_create_user(dict(user, first_name='Anna'))
+        assert len(submitted) == 2
+        original_submit(lambda conn: None).result(timeout=5)  # wait for the queued upserts
+
+        assert db.fetch_all('SELECT user_id, username, first_name, last_name FROM users',
+                            db_path=db_path) == [(7, 'ann', 'Anna', '')]
+    finally:
+        group_commit.stop_all()
+        db.close_all()
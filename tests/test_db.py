@@ -0,0 +1,59 @@
+import pytest
+import sys
+import os
+import threading
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Temporary database file"""
+    path = str(tmp_path / 'test.db')
+    db.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)', db_path=path)
+    yield path
+    db.close_all()
+
+def test_wal_and_pragmas(db_path):
+    """Test that pooled connections are configured with WAL and busy_timeout"""
+    assert db.fetch_value('PRAGMA journal_mode', db_path=db_path) == 'wal'
+    assert db.fetch_value('PRAGMA busy_timeout', db_path=db_path) == db.get_settings()['busy_timeout_ms']
+
+def test_connection_reused_per_thread(db_path):
+    """Test that each thread keeps its own pooled connection"""
+    assert db.get_connection(db_path) is db.get_connection(db_path)
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(db.get_connection(db_path)))
+    thread.start()
+    thread.join()
+    assert other[0] is not db.get_connection(db_path)
+
+def test_transaction_rollback(db_path):
+    """Test that a failed unit of work leaves no partial writes"""
+    with pytest.raises(RuntimeError):
+        with db.transaction(db_path) as c:
+            c.execute("INSERT INTO items (name) VALUES ('a')")
+            raise RuntimeError('boom')
+
+    assert db.fetch_value('SELECT COUNT(*) FROM items', db_path=db_path) == 0
+
+def test_nested_transaction_savepoint(db_path):
+    """Test that nested transactions roll back only the inner block"""
+    with db.transaction(db_path) as c:
+        c.execute("INSERT INTO items (name) VALUES ('outer')")
+        with pytest.raises(RuntimeError):
+            with db.transaction(db_path) as inner:
+                inner.execute("INSERT INTO items (name) VALUES ('inner')")
+                raise RuntimeError('boom')
+
+    assert db.fetch_all('SELECT name FROM items', db_path=db_path) == [('outer',)]
+
+def test_configure_rejects_unknown_setting():
+    """Test that invalid settings are rejected"""
+    with pytest.raises(ValueError):
+        db.configure(synchronous='SOMETIMES')
+    with pytest.raises(ValueError):
+        db.configure(no_such_setting=1)
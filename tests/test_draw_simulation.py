@@ -0,0 +1,65 @@
+import pytest
+import sys
+import os
+import random
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+from draw_simulation import chi_square, reconcile_ledger, reconcile_pools, rng_baseline, simulate_draws, simulate_engine
+
+FEES = (50, 100, 250, 500)
+SIZES = range(2, 7)
+ALPHA = 1e-4
+
+@pytest.fixture
+def seeded():
+    """Fixed global random state for conduct_lottery, restored after the test"""
+    state = random.getstate()
+    random.seed(25)
+    yield
+    random.setstate(state)
+
+def test_chi_square_flags_biased_seats():
+    """Test that the uniformity test accepts even counts and rejects a favoured seat"""
+    assert chi_square([1000] * 6)[1] > 0.99
+    assert chi_square([1200, 1000, 1000, 1000, 1000, 800])[1] < 1e-6
+
+def test_engine_selection_is_uniform(seeded):
+    """Test that pick_winner, the draw_winner selection, passes chi-square per room size"""
+    report = simulate_draws(5000, SIZES, FEES)
+    assert report['draws'] == 5000 * len(SIZES) * len(FEES)
+    assert all(sum(seat['counts']) == 5000 * len(FEES) for seat in report['seats'].values())
+    assert all(seat['p_value'] > ALPHA for seat in report['seats'].values())
+    assert report['mismatches'] == []
+
+def test_rng_baseline_is_uniform():
+    """Test that the generator-only baseline samples every seat evenly"""
+    report = rng_baseline(20000, SIZES, seed=25)
+    assert all(seat['p_value'] > ALPHA for seat in report['seats'].values())
+
+def test_engine_draws_reconcile_in_memory_db(seeded):
+    """Test that conduct_lottery picks seats uniformly and its ledger matches every pool"""
+    try:
+        report = simulate_engine(60, SIZES, FEES)
+        assert report['failed'] == 0
+        assert all(seat['p_value'] > ALPHA for seat in report['seats'].values())
+        assert report['mismatches'] == []
+        assert report['ledger_rooms'] == 60 * len(FEES) * len(SIZES)
+    finally:
+        db.close_all()
+
+def test_pool_split_never_leaks_stars():
+    """Test that the 80/20 split matches exact integer math for every pool up to 100k"""
+    assert reconcile_pools(range(1, 100001)) == []
+
+def test_ledger_check_catches_wrong_rows(seeded):
+    """Test that the ledger reconciliation flags a payout that does not match the 80/20 split"""
+    try:
+        assert simulate_engine(1, [2], [50])['mismatches'] == []
+        db.execute("UPDATE transactions SET amount = amount - 1 WHERE transaction_type = 'winner_payout'", db_path=':memory:')
+        rooms, mismatches = reconcile_ledger(':memory:')
+        assert rooms == 1 and [m['room_id'] for m in mismatches] == ['sim-50-2-0']
+    finally:
+        db.close_all()
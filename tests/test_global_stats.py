@@ -0,0 +1,93 @@
+import pytest
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+import app as app_module
+from global_stats import GlobalStats, COUNTERS
+from lottery_engine import record_lottery_result
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'lottery.db')
+    db.migrate(path)
+    yield path
+    db.close_all()
+
+def play_room(db_path, room_id, fee=100, players=6):
+    """Write a full room and its draw the way ingestion and the scheduler do"""
+    with db.transaction(db_path) as conn:
+        conn.execute("INSERT INTO rooms (room_id, entry_fee, status, total_pool) VALUES (?, ?, 'waiting', ?)",
+                     (room_id, fee, fee * players))
+        for user_id in range(players):
+            conn.execute('INSERT INTO room_participants (room_id, user_id) VALUES (?, ?)', (room_id, user_id))
+    pool = fee * players
+    record_lottery_result({'room_id': room_id, 'winner': {'user_id': 0}, 'winner_amount': int(pool * 0.8),
+                           'admin_amount': pool - int(pool * 0.8), 'completed_at': '2024-01-01 00:00:00',
+                           'participants': [{'user_id': user_id} for user_id in range(players)]},
+                          db_path)
+
+def aggregate(db_path):
+    """The full-table aggregates the counters replace"""
+    return {
+        'total_rooms': db.fetch_value('SELECT COUNT(*) FROM rooms', db_path=db_path),
+        'completed_rooms': db.fetch_value("SELECT COUNT(*) FROM rooms WHERE status = 'completed'", db_path=db_path),
+        'total_pool': db.fetch_value("SELECT SUM(total_pool) FROM rooms WHERE status = 'completed'",
+                                     db_path=db_path, default=0),
+        'total_participants': db.fetch_value('SELECT COUNT(*) FROM room_participants', db_path=db_path),
+        'total_admin_fees': db.fetch_value("SELECT SUM(amount) FROM transactions WHERE transaction_type = 'admin_fee'",
+                                           db_path=db_path, default=0),
+    }
+
+def counters(stats):
+    return {name: stats.snapshot()[name] for name in COUNTERS}
+
+def test_counters_follow_ledger(db_path):
+    """Test that counters advance with new rooms, joins and draws"""
+    stats = GlobalStats(db_path, max_age=60)
+    assert counters(stats) == dict.fromkeys(COUNTERS, 0)
+
+    play_room(db_path, 'r1')
+    db.execute("INSERT INTO rooms (room_id, entry_fee, status, total_pool) VALUES ('r2', 50, 'waiting', 50)",
+               db_path=db_path)
+    db.execute("INSERT INTO room_participants (room_id, user_id) VALUES ('r2', 7)", db_path=db_path)
+
+    # Served from memory until max_age passes or the ledger is marked as changed
+    assert counters(stats)['total_rooms'] == 0
+    stats.mark_stale()
+    assert counters(stats) == aggregate(db_path) == {
+        'total_rooms': 2, 'completed_rooms': 1, 'total_pool': 600,
+        'total_participants': 7, 'total_admin_fees': 120,
+    }
+
+def test_restart_resumes_from_checkpoint(db_path):
+    """Test that a new instance starts from the checkpoint and reads only the ledger tail"""
+    stats = GlobalStats(db_path, checkpoint_interval=3600)
+    play_room(db_path, 'r1')
+    stats.checkpoint()
+    play_room(db_path, 'r2', fee=250)
+
+    # Counters are taken from the checkpoint, not recomputed: a marker value survives
+    db.execute('UPDATE stats_checkpoint SET total_admin_fees = total_admin_fees + 1000', db_path=db_path)
+    restarted = GlobalStats(db_path)
+    expected = aggregate(db_path)
+    expected['total_admin_fees'] += 1000
+    assert counters(restarted) == expected
+
+def test_admin_stats_endpoint(db_path, monkeypatch):
+    """Test that /api/stats requires the admin token and sets cache headers"""
+    monkeypatch.setattr(app_module, 'DB_PATH', db_path)
+    monkeypatch.setattr(app_module, 'ADMIN_TOKEN', 'secret')
+    play_room(db_path, 'r1')
+    client = app_module.app.test_client()
+
+    assert client.get('/api/stats').status_code == 403
+    assert client.get('/api/stats', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+
+    response = client.get('/api/stats', headers={'X-Admin-Token': 'secret'})
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'].startswith('private, max-age=')
+    assert {name: response.json[name] for name in COUNTERS} == aggregate(db_path)
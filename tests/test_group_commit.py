@@ -0,0 +1,156 @@
+import pytest
+import sys
+import os
+import sqlite3
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+import group_commit
+from group_commit import GroupCommitWriter
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'lottery.db')
+    db.migrate(path)
+    yield path
+    group_commit.stop_all()
+    db.close_all()
+
+@pytest.fixture
+def writer(db_path):
+    instance = GroupCommitWriter(db_path, batch_window=0.02).start()
+    yield instance
+    instance.stop()
+
+def insert_user(user_id):
+    def job(conn):
+        conn.execute('INSERT INTO users (user_id, first_name) VALUES (?, ?)', (user_id, f'User{user_id}'))
+        return user_id
+    return job
+
+def test_concurrent_jobs_share_commits(db_path, writer):
+    """Test that concurrent submissions are committed together and visible once resolved"""
+    before = group_commit.batch_sizes.count
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda i: writer.submit(insert_user(i)).result(timeout=5), range(64)))
+
+    assert results == list(range(64))
+    # Read through a separate connection: everything is already committed
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 64
+    conn.close()
+    assert group_commit.batch_sizes.count - before < 64
+
+def test_failed_job_rolled_back_alone(db_path, writer):
+    """Test that one failing job does not abort the rest of its batch"""
+    def failing(conn):
+        conn.execute('INSERT INTO users (user_id, first_name) VALUES (?, ?)', (99, 'Ghost'))
+        raise ValueError('boom')
+
+    futures = [writer.submit(insert_user(1)), writer.submit(failing), writer.submit(insert_user(2))]
+
+    assert futures[0].result(timeout=5) == 1
+    with pytest.raises(ValueError):
+        futures[1].result(timeout=5)
+    assert futures[2].result(timeout=5) == 2
+    assert db.fetch_all('SELECT user_id FROM users ORDER BY user_id', db_path=db_path) == [(1,), (2,)]
+
+def test_payment_ingestion_is_atomic(db_path, monkeypatch):
+    """Test that a payment and its seat are written together or not at all"""
+    import app as app_module
+
+    monkeypatch.setattr(app_module, 'DB_PATH', db_path)
+    user = {'id': 4242, 'first_name': 'Payer'}
+    room_id, payment_id = app_module.ingest_payment(user, 250, 'charge-atomic')
+
+    assert db.fetch_one('SELECT room_id FROM payments WHERE id = ?', (payment_id,), db_path) == (room_id,)
+    assert db.fetch_one('SELECT total_pool FROM rooms WHERE room_id = ?', (room_id,), db_path) == (250,)
+    assert db.fetch_value('SELECT COUNT(*) FROM room_participants WHERE room_id = ?', (room_id,), db_path) == 1
+
+    # A repeated charge_id violates UNIQUE: the seat is released and nothing is written
+    with pytest.raises(sqlite3.IntegrityError):
+        app_module.ingest_payment({'id': 4243, 'first_name': 'Other'}, 250, 'charge-atomic')
+    room = app_module.room_store.get(room_id)
+    app_module.room_store.remove(room_id)
+    assert [p['user_id'] for p in room['participants']] == [4242]
+    assert room['total_pool'] == 250
+    assert db.fetch_value('SELECT COUNT(*) FROM room_participants WHERE room_id = ?', (room_id,), db_path) == 1
+
+def test_timed_out_payment_released_only_if_cancelled(db_path, monkeypatch):
+    """Test that a payment still queued at timeout is cancelled and its seat released"""
+    import app as app_module
+
+    monkeypatch.setattr(app_module, 'DB_PATH', db_path)
+    monkeypatch.setattr(app_module, 'PAYMENT_WRITE_TIMEOUT', 0.05)
+    gate = threading.Event()
+    group_commit.get_writer(db_path).submit(lambda conn: gate.wait(5))
+    with pytest.raises(TimeoutError):
+        app_module.ingest_payment({'id': 5151, 'first_name': 'Late'}, 500, 'charge-queued')
+    gate.set()
+    group_commit.get_writer(db_path).submit(lambda conn: None).result(timeout=5)
+
+    assert db.fetch_value('SELECT COUNT(*) FROM payments WHERE user_id = 5151', db_path=db_path) == 0
+    assert app_module.room_store.active_room_of(5151) is None
+
+def test_timed_out_payment_settled_by_running_write(db_path, monkeypatch):
+    """Test that a payment already being written at timeout fails fast, then its commit marks the seat paid"""
+    import app as app_module
+
+    monkeypatch.setattr(app_module, 'DB_PATH', db_path)
+    monkeypatch.setattr(app_module, 'PAYMENT_WRITE_TIMEOUT', 0.05)
+    writer = group_commit.get_writer(db_path)
+    original_submit = writer.submit
+    monkeypatch.setattr(writer, 'submit', lambda fn: original_submit(lambda conn: time.sleep(0.3) or fn(conn)))
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        app_module.ingest_payment({'id': 5252, 'first_name': 'Slow'}, 500, 'charge-running')
+    assert time.monotonic() - started < 0.25
+
+    room_id = app_module.room_store.active_room_of(5252)
+    payment_id = None
+    deadline = time.monotonic() + 5
+    while payment_id is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+        payment_id = next(p['payment_id'] for p in app_module.room_store.get(room_id)['participants']
+                          if p['user_id'] == 5252)
+    assert payment_id is not None
+
+    # The update pipeline retries the update: the recorded payment is returned, nothing is written twice
+    monkeypatch.setattr(writer, 'submit', original_submit)
+    assert app_module.ingest_payment({'id': 5252, 'first_name': 'Slow'}, 500, 'charge-running') == (room_id, payment_id)
+    app_module.room_store.remove(room_id)
+    assert db.fetch_value("SELECT COUNT(*) FROM payments WHERE user_id = 5252", db_path=db_path) == 1
+
+def test_failed_commit_rolls_back_connection(db_path, writer, monkeypatch):
+    """Test that a failing COMMIT fails its batch and leaves the connection usable for the next one"""
+    real_connection = db.connection
+    failures = [sqlite3.OperationalError('disk I/O error')]
+
+    class FailingCommit:
+        def __init__(self, conn):
+            self.conn = conn
+
+        def __getattr__(self, name):
+            return getattr(self.conn, name)
+
+        def commit(self):
+            if failures:
+                raise failures.pop()
+            self.conn.commit()
+
+    @contextmanager
+    def connection(path=None):
+        with real_connection(path) as conn:
+            yield FailingCommit(conn)
+
+    monkeypatch.setattr(group_commit.db, 'connection', connection)
+    with pytest.raises(sqlite3.OperationalError):
+        writer.submit(insert_user(1)).result(timeout=5)
+    assert writer.submit(insert_user(2)).result(timeout=5) == 2
+    assert db.fetch_all('SELECT user_id FROM users', db_path=db_path) == [(2,)]
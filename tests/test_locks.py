@@ -0,0 +1,43 @@
+import sys
+import os
+import time
+from threading import Thread, Event
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import locks
+import metrics
+from locks import InstrumentedLock, StripedLock
+
+def test_lock_records_wait_and_hold(monkeypatch):
+    """Test that waiting on a held lock is counted as contention with its wait and hold time"""
+    monkeypatch.setattr(locks, 'SAMPLE_EVERY', 1)
+    lock = InstrumentedLock('test.instrumented')
+    held = Event()
+
+    def holder():
+        with lock:
+            held.set()
+            time.sleep(0.05)
+
+    thread = Thread(target=holder)
+    thread.start()
+    held.wait()
+    with lock:
+        pass
+    thread.join()
+
+    assert lock.acquisitions == 2
+    assert lock.contended == 1
+    assert lock.wait_max >= 0.03
+    assert lock.hold_max >= 0.05
+    stats = metrics.snapshot()
+    assert stats['locks.test.instrumented']['contended'] >= 1
+    assert stats['locks.test.instrumented.hold_seconds']['max'] >= 0.05
+
+def test_striped_lock_is_stable_per_key():
+    """Test that a key always maps to the same stripe and keys spread over stripes"""
+    striped = StripedLock('test.striped', 16)
+    assert striped.for_key('room-a') is striped.for_key('room-a')
+    assert len({id(striped.for_key(f'room-{n}')) for n in range(200)}) == 16
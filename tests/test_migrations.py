@@ -0,0 +1,77 @@
+import pytest
+import sys
+import os
+import re
+import hmac
+import json
+import time
+import hashlib
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+import migrations
+import app as app_module
+from lottery_engine import get_room_statistics, get_user_statistics
+
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+def make_init_data(user: dict, bot_token: str) -> str:
+    """Build signed Telegram WebApp initData"""
+    params = {'auth_date': str(int(time.time())), 'user': json.dumps(user)}
+    data_check_string = '\n'.join(f"{k}={v}" for k, v in sorted(params.items()))
+    secret_key = hmac.new(b'WebAppData', bot_token.encode(), hashlib.sha256).digest()
+    params['hash'] = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return '&'.join(f"{k}={v}" for k, v in params.items())
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Migrated temporary database used by app and lottery engine"""
+    path = str(tmp_path / 'lottery.db')
+    monkeypatch.setattr(app_module, 'DB_PATH', path)
+    monkeypatch.setattr(app_module, 'BOT_TOKEN', 'test-token')
+    db.migrate(path)
+    yield path
+    db.close_all()
+
+def capture_selects(db_path, func):
+    """Run func and collect every SELECT it sends to the pooled connection"""
+    statements = []
+    conn = db.get_connection(db_path)
+    conn.set_trace_callback(statements.append)
+    try:
+        func()
+    finally:
+        conn.set_trace_callback(None)
+    return [s for s in statements if s.lstrip().upper().startswith('SELECT')]
+
+def full_scans(db_path, statement):
+    """Tables that the query plan reads without any index"""
+    plan = db.fetch_all(f'EXPLAIN QUERY PLAN {statement}', db_path=db_path)
+    return [m.group(1) for row in plan for m in [FULL_SCAN.match(row[3])] if m]
+
+def test_migrations_are_versioned(db_path):
+    """Test that all migrations are recorded and re-running is a no-op"""
+    latest = migrations.MIGRATIONS[-1][0]
+    assert db.fetch_value('SELECT MAX(version) FROM schema_version', db_path=db_path) == latest
+    assert db.migrate(db_path) == latest
+    assert db.fetch_value('SELECT COUNT(*) FROM schema_version', db_path=db_path) == latest
+
+def test_hot_path_queries_use_indexes(db_path):
+    """Test that statistics queries never fall back to a full table scan"""
+    client = app_module.app.test_client()
+    init_data = make_init_data({'id': 42, 'first_name': 'Test'}, 'test-token')
+
+    def run_queries():
+        get_user_statistics(42, db_path)
+        get_room_statistics(db_path)
+        assert client.post('/api/user/info', json={'initData': init_data}).status_code == 200
+        assert client.post('/api/referral/link', json={'initData': init_data}).status_code == 200
+        assert client.post('/api/referral/stats', json={'initData': init_data}).status_code == 200
+
+    statements = capture_selects(db_path, run_queries)
+    assert len(statements) >= 10
+
+    for statement in statements:
+        assert full_scans(db_path, statement) == [], statement
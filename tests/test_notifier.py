@@ -0,0 +1,97 @@
+import pytest
+import sys
+import os
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import notifier
+from notifier import NotificationDispatcher
+from telegram_client import TelegramClient
+from fake_bot_api import FakeBotApi
+
+@pytest.fixture
+def api():
+    """Local Telegram Bot API stub"""
+    server = FakeBotApi().start()
+    yield server
+    server.stop()
+
+def stub_sender(api):
+    """sendMessage through a client bound to the stub"""
+    client = TelegramClient('TEST', api.url)
+    return lambda payload: client.call('sendMessage', payload)
+
+@pytest.fixture
+def make_dispatcher(api, stop_after):
+    """Create dispatchers against the stub that are stopped after the test"""
+    def factory(**kwargs):
+        kwargs.setdefault('backoff_base', 0.05)
+        return stop_after(NotificationDispatcher(stub_sender(api), **kwargs)).start()
+
+    return factory
+
+def test_messages_delivered(api, make_dispatcher):
+    """Test that queued messages reach the Bot API with the expected payload"""
+    dispatcher = make_dispatcher()
+    before = notifier.send_latency.count
+
+    for chat_id in range(1, 7):
+        assert dispatcher.submit(chat_id, f'Hello {chat_id}', {'inline_keyboard': []})
+    assert dispatcher.join(timeout=5)
+
+    calls = api.calls_to('sendMessage')
+    assert sorted(c['params']['chat_id'] for c in calls) == list(range(1, 7))
+    assert calls[0]['params']['parse_mode'] == 'HTML'
+    assert 'reply_markup' in calls[0]['params']
+    assert notifier.send_latency.count >= before + 6
+
+def test_retry_after_honoured(api, make_dispatcher):
+    """Test that a 429 pauses sending for retry_after seconds and the message is retried"""
+    dispatcher = make_dispatcher()
+    api.fail_next(1, status=429, retry_after=1)
+
+    started = time.monotonic()
+    dispatcher.submit(1, 'Hello')
+    assert dispatcher.join(timeout=5)
+
+    assert len(api.calls_to('sendMessage')) == 1
+    assert len(api.calls) == 2
+    assert api.calls[1]['time'] - api.calls[0]['time'] >= 0.95
+    assert time.monotonic() - started >= 0.95
+
+def test_per_chat_interval(api, make_dispatcher):
+    """Test that messages to one chat are spaced out while other chats are not delayed"""
+    dispatcher = make_dispatcher(per_chat_interval=0.3)
+    dispatcher.submit(1, 'first')
+    dispatcher.submit(1, 'second')
+    dispatcher.submit(2, 'other')
+    assert dispatcher.join(timeout=5)
+
+    to_chat = [c['time'] for c in api.calls_to('sendMessage') if c['params']['chat_id'] == 1]
+    other = [c['time'] for c in api.calls_to('sendMessage') if c['params']['chat_id'] == 2]
+    assert len(to_chat) == 2
+    assert to_chat[1] - to_chat[0] >= 0.25
+    assert other[0] - to_chat[0] < 0.2
+
+def test_transient_errors_retried(api, make_dispatcher):
+    """Test that 5xx responses are retried with backoff and permanent errors are not"""
+    dispatcher = make_dispatcher(max_attempts=3, per_chat_interval=0)
+    api.fail_next(2, status=502, description='Bad Gateway')
+    dispatcher.submit(1, 'retried')
+    assert dispatcher.join(timeout=5)
+    assert len(api.calls_to('sendMessage')) == 1
+
+    api.fail_next(1, status=403, description='Forbidden: bot was blocked by the user')
+    dispatcher.submit(2, 'blocked')
+    assert dispatcher.join(timeout=5)
+    assert [c['params']['chat_id'] for c in api.calls if c['params']['chat_id'] == 2] == [2]
+
+def test_queue_is_bounded(api):
+    """Test that submit refuses new messages instead of blocking when the queue is full"""
+    dispatcher = NotificationDispatcher(stub_sender(api), queue_size=3)
+    results = [dispatcher.submit(i, 'Hello') for i in range(5)]
+
+    assert results == [True, True, True, False, False]
+    assert dispatcher.depth() == 3
@@ -0,0 +1,87 @@
+import pytest
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+import user_stats
+import app as app_module
+from lottery_engine import record_lottery_result
+from tests.test_migrations import make_init_data
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'lottery.db')
+    monkeypatch.setattr(app_module, 'DB_PATH', path)
+    monkeypatch.setattr(app_module, 'BOT_TOKEN', 'test-token')
+    monkeypatch.setattr(app_module.limiter, 'enabled', False)
+    db.migrate(path)
+    yield path
+    db.close_all()
+
+@pytest.fixture
+def client(db_path):
+    return app_module.app.test_client()
+
+def add_users(db_path, user_ids):
+    for user_id in user_ids:
+        db.execute('INSERT INTO users (user_id, first_name) VALUES (?, ?)', (user_id, f'User{user_id}'), db_path)
+
+def test_referral_pages_cover_all_referrals(db_path, client):
+    """Test that keyset pages return every referral once, newest first, even with equal created_at"""
+    add_users(db_path, range(1, 121))
+    with db.transaction(db_path) as conn:
+        for user_id in range(2, 121):
+            # Three referrals per second: the id breaks ties inside a second
+            conn.execute('''INSERT INTO referrals (referrer_user_id, referred_user_id, created_at)
+                            VALUES (1, ?, datetime('2024-01-01', ? || ' seconds'))''', (user_id, user_id // 3))
+    init_data = make_init_data({'id': 1, 'first_name': 'Referrer'}, 'test-token')
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        body = {'initData': init_data, 'limit': 50}
+        if cursor:
+            body['cursor'] = cursor
+        response = client.post('/api/referral/stats', json=body)
+        assert response.status_code == 200
+        seen += [r['user_id'] for r in response.json['referrals']]
+        cursor, pages = response.json['next_cursor'], pages + 1
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert seen == list(range(120, 1, -1))
+
+    response = client.post('/api/referral/stats', json={'initData': init_data, 'cursor': 'garbage'})
+    assert response.status_code == 400
+    response = client.post('/api/referral/stats', json={'initData': init_data, 'limit': 1000})
+    assert response.status_code == 400
+
+def test_referral_activity_rollup(db_path, client):
+    """Test that draws update referral activity and the link counts come from the rollup"""
+    add_users(db_path, range(1, 4))
+    for user_id in (2, 3):
+        init_data = make_init_data({'id': user_id, 'first_name': f'User{user_id}'}, 'test-token')
+        assert client.post('/api/referral/register',
+                           json={'initData': init_data, 'referrerId': 1}).status_code == 200
+
+    for room_id, winner in (('r1', 2), ('r2', 5)):
+        with db.transaction(db_path) as conn:
+            conn.execute("INSERT INTO rooms (room_id, entry_fee, status, total_pool) VALUES (?, 100, 'drawing', 200)",
+                         (room_id,))
+            for user_id in (2, 5):
+                conn.execute('INSERT INTO room_participants (room_id, user_id) VALUES (?, ?)', (room_id, user_id))
+        record_lottery_result({'room_id': room_id, 'winner': {'user_id': winner}, 'winner_amount': 160,
+                               'admin_amount': 40, 'completed_at': '2024-01-01 00:00:00',
+                               'participants': [{'user_id': 2}, {'user_id': 5}]}, db_path)
+
+    init_data = make_init_data({'id': 1, 'first_name': 'Referrer'}, 'test-token')
+    referrals = client.post('/api/referral/stats', json={'initData': init_data}).json['referrals']
+    activity = {r['user_id']: (r['games_played'], r['wins']) for r in referrals}
+    assert activity == {2: (2, 1), 3: (0, 0)}
+
+    assert client.post('/api/referral/link', json={'initData': init_data}).json['total_referrals'] == 2
+    # Seats were written directly, so only the referral rollup is expected to match here
+    assert [m for m in user_stats.check(db_path) if m['field'].startswith('referral_')] == []
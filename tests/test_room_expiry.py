@@ -0,0 +1,157 @@
+import pytest
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import sqlite3
+from threading import Thread
+
+import db
+import refunds
+import user_stats
+from refunds import send_pending_refunds
+from room_expiry import RoomExpiry
+from room_store import create_room_store
+from telegram_client import TelegramClient
+from fake_bot_api import FakeBotApi
+
+GRACE = 60
+MAX_AGE = 3600
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def expiry(request, tmp_path):
+    """Room store whose changes feed a (not started) RoomExpiry"""
+    path = str(tmp_path / 'lottery.db')
+    db.migrate(path)
+    removed = []
+    instance = RoomExpiry(None, path, on_removed=removed.append, completed_grace=GRACE, waiting_max_age=MAX_AGE)
+    instance.store = create_room_store(request.param, path, on_change=instance.track)
+    instance.removed = removed
+    yield instance
+    db.close_all()
+
+def pay(expiry, user_id, entry_fee=100):
+    """Seat a user and record the payment the way ingest_payment does"""
+    room, _ = expiry.store.join(entry_fee, {'user_id': user_id, 'first_name': f'User{user_id}'})
+    with db.transaction(expiry.db_path) as conn:
+        payment_id = conn.execute('''INSERT INTO payments (user_id, amount, telegram_payment_charge_id, status, room_id)
+                                     VALUES (?, ?, ?, 'completed', ?)''',
+                                  (user_id, entry_fee, f'charge-{user_id}', room['room_id'])).lastrowid
+        conn.execute("INSERT OR IGNORE INTO rooms (room_id, entry_fee, status, total_pool) VALUES (?, ?, 'waiting', 0)",
+                     (room['room_id'], entry_fee))
+        conn.execute('INSERT INTO room_participants (room_id, user_id, payment_id) VALUES (?, ?, ?)',
+                     (room['room_id'], user_id, payment_id))
+        user_stats.record_payment(conn, user_id, entry_fee)
+    expiry.store.mark_paid(room['room_id'], user_id, payment_id)
+    return room
+
+def test_completed_room_evicted_after_grace(expiry):
+    """Test that a drawn room stays readable for the grace period and is then removed"""
+    room_id = pay(expiry, 1)['room_id']
+
+    def complete(room):
+        room['status'] = 'completed'
+        room['completed_at'] = 1000.0
+        return True
+
+    expiry.store.transition(room_id, complete)
+    assert expiry.run_due(1000.0 + GRACE - 1) == 0
+    assert expiry.store.get(room_id)['status'] == 'completed'
+
+    # The stale waiting deadline is skipped, only the completed one fires
+    assert expiry.run_due(1000.0 + GRACE) == 1
+    assert expiry.store.get(room_id) is None
+    assert expiry.removed == [room_id]
+    assert expiry.run_due(1e12) == 0
+
+def test_stale_waiting_room_refunded(expiry):
+    """Test that a room waiting past its max age is closed and its paid seats queued for refund"""
+    room = pay(expiry, 1)
+    pay(expiry, 2)
+    expiry.store.join(100, {'user_id': 3, 'first_name': 'User3'})  # Payment still being written
+    room_id, expires_at = room['room_id'], room['created_at'] + MAX_AGE
+
+    # An unpaid seat postpones the expiry instead of stranding the payment
+    assert expiry.run_due(expires_at) == 1
+    assert expiry.store.get(room_id)['status'] == 'waiting'
+    expiry.store.leave(room_id, 3)
+
+    assert expiry.run_due(expires_at + 10) == 1
+    assert expiry.store.get(room_id)['status'] == 'expired'
+    assert expiry.store.active_room_of(1) is None
+    assert expiry.store.open_room(100)['room_id'] != room_id
+    assert db.fetch_all('SELECT status FROM payments ORDER BY id', db_path=expiry.db_path) == \
+        [('refund_pending',), ('refund_pending',)]
+    assert db.fetch_value("SELECT status FROM rooms WHERE room_id = ?", (room_id,), expiry.db_path) == 'expired'
+    assert user_stats.get_user_stats(1, expiry.db_path)['total_spent'] == 0
+    assert user_stats.check(expiry.db_path) == []
+
+    # Then it is evicted like any finished room
+    assert expiry.run_due(expires_at + 10 + GRACE) >= 1
+    assert expiry.store.get(room_id) is None
+
+def test_refunds_recorded_outside_room_lock_and_retried(expiry, monkeypatch):
+    """Test that refunds are written after the room lock is released and retried before eviction"""
+    room = pay(expiry, 1)
+    room_id, expires_at = room['room_id'], room['created_at'] + MAX_AGE
+    seen = []
+    record_refunds = refunds.record_refunds
+
+    def flaky(room_id, participants, closed_at, db_path):
+        # Another thread can read the room, so its lock is not held
+        reader = Thread(target=lambda: seen.append(expiry.store.read(room_id, lambda room: room['status'])))
+        reader.start()
+        reader.join(timeout=2)
+        if len(seen) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        return record_refunds(room_id, participants, closed_at, db_path)
+
+    monkeypatch.setattr(refunds, 'record_refunds', flaky)
+    assert expiry.run_due(expires_at) == 1
+    assert seen == ['expired']
+    assert db.fetch_value('SELECT status FROM payments', db_path=expiry.db_path) == 'completed'
+
+    assert expiry.run_due(expires_at + GRACE) == 1
+    assert seen == ['expired', 'expired']
+    assert db.fetch_value('SELECT status FROM payments', db_path=expiry.db_path) == 'refund_pending'
+    assert expiry.store.get(room_id) is None
+
+def test_lost_waiting_rooms_refunded_on_start(expiry):
+    """Test that a stale waiting room missing from the store gets its paid seats refunded"""
+    room_id = pay(expiry, 1)['room_id']
+    pay(expiry, 2)
+    expiry.store.remove(room_id)  # Process died before the refund was written
+    db.execute("UPDATE rooms SET created_at = datetime('now', '-2 hours')", db_path=expiry.db_path)
+
+    assert expiry.reconcile_refunds() == 2
+    assert db.fetch_all('SELECT status FROM payments ORDER BY id', db_path=expiry.db_path) == \
+        [('refund_pending',), ('refund_pending',)]
+    assert db.fetch_value('SELECT status FROM rooms WHERE room_id = ?', (room_id,), expiry.db_path) == 'expired'
+    assert expiry.reconcile_refunds() == 0
+
+def test_send_pending_refunds(tmp_path):
+    """Test that refunds are sent once, retried after server errors and parked when rejected"""
+    path = str(tmp_path / 'lottery.db')
+    db.migrate(path)
+    for user_id in (1, 2, 3):
+        db.execute('''INSERT INTO payments (user_id, amount, telegram_payment_charge_id, status)
+                      VALUES (?, 100, ?, 'refund_pending')''', (user_id, f'charge-{user_id}'), path)
+    api = FakeBotApi().start()
+    try:
+        client = TelegramClient('TEST', api.url)
+        api.fail_next(1, status=502, description='Bad Gateway')
+        api.fail_next(1, status=400, description='Bad Request: CHARGE_ALREADY_REFUNDED')
+        api.fail_next(1, status=400, description='Bad Request: CHARGE_NOT_FOUND')
+        assert send_pending_refunds(path, client) == 1
+
+        assert send_pending_refunds(path, client) == 1
+        assert db.fetch_all('SELECT status FROM payments ORDER BY id', db_path=path) == \
+            [('refunded',), ('refunded',), ('refund_failed',)]
+        assert api.calls_to('refundStarPayment')[-1]['params'] == {'user_id': 1,
+                                                                  'telegram_payment_charge_id': 'charge-1'}
+        assert send_pending_refunds(path, client) == 0
+    finally:
+        api.stop()
+        db.close_all()
@@ -0,0 +1,74 @@
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from room_index import RoomIndex
+
+def make_room(room_id, entry_fee=100, status='waiting', participants=0):
+    """Create room dict in the same shape as the room store keeps"""
+    return {
+        'room_id': room_id,
+        'entry_fee': entry_fee,
+        'status': status,
+        'participants': [{'user_id': i} for i in range(participants)],
+        'total_pool': entry_fee * participants,
+    }
+
+def test_find_open_by_fee():
+    """Test that open rooms are found by entry fee, oldest first"""
+    index = RoomIndex(max_room_size=6)
+    index.update(make_room('a', entry_fee=100))
+    index.update(make_room('b', entry_fee=100))
+    index.update(make_room('c', entry_fee=250))
+
+    assert index.find_open(100) == 'a'
+    assert index.find_open(250) == 'c'
+    assert index.find_open(500) is None
+    assert index.open_count() == 3
+
+def test_full_and_drawing_rooms_leave_index():
+    """Test that filled rooms and state transitions update the index"""
+    index = RoomIndex(max_room_size=6)
+    room = make_room('a', participants=5)
+    index.update(room)
+    assert index.find_open(100) == 'a'
+
+    room['participants'].append({'user_id': 99})
+    room['status'] = 'drawing'
+    index.update(room)
+    assert index.find_open(100) is None
+    assert index.open_count(100) == 0
+
+def test_rebuild_ignores_completed_history():
+    """Test that rebuilding from history keeps only open rooms"""
+    index = RoomIndex(max_room_size=6)
+    history = [make_room(f'done_{i}', status='completed', participants=6) for i in range(100)]
+    index.rebuild(history + [make_room('open')])
+
+    assert index.open_count() == 1
+    assert index.find_open(100) == 'open'
+
+    index.remove('open')
+    assert index.find_open(100) is None
+
+def test_active_room_by_user():
+    """Test that users map to their unfinished room until it completes"""
+    index = RoomIndex(max_room_size=6)
+    room = make_room('a', participants=6, status='drawing')
+    index.update(room)
+    assert index.active_room_of(3) == 'a'
+    assert index.active_room_of(42) is None
+
+    room['status'] = 'completed'
+    index.update(room)
+    assert index.active_room_of(3) is None
+
+def test_active_room_released_on_remove():
+    """Test that removing a room frees its participants"""
+    index = RoomIndex(max_room_size=6)
+    index.update(make_room('a', participants=2))
+    index.remove('a')
+    assert index.active_room_of(0) is None
+    assert index.active_room_of(1) is None
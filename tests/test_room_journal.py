@@ -0,0 +1,118 @@
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from room_journal import RoomJournal
+from room_store import MemoryRoomStore
+
+def participant(user_id):
+    return {'user_id': user_id, 'username': '', 'first_name': f'User{user_id}', 'payment_id': None,
+            'joined_at': '2024-01-01T00:00:00'}
+
+def make_store(path):
+    return MemoryRoomStore(journal=RoomJournal(path))
+
+def draw(room):
+    if room['status'] != 'drawing':
+        return None
+    room['status'] = 'completed'
+    return room['room_id']
+
+def start_draw(room):
+    room['status'] = 'drawing'
+    return room['room_id']
+
+def test_restart_restores_active_rooms(tmp_path):
+    """Test that a restarted store gets back waiting and drawing rooms from snapshot plus journal"""
+    path = str(tmp_path / 'rooms')
+    store = make_store(path)
+    assert store.restore(lambda room_id, user_id: None) == 0
+
+    # A drawn room, captured by the first snapshot and completed in the journal
+    drawn = store.join(50, participant(1))[0]['room_id']
+    for user_id in range(2, 7):
+        store.join(50, participant(user_id))
+    for user_id in range(1, 7):
+        store.mark_paid(drawn, user_id, user_id)
+    store.checkpoint()
+    store.transition(drawn, draw)
+
+    # A full, fully paid room stuck in drawing when the process died
+    stuck = store.join(100, participant(11))[0]['room_id']
+    for user_id in range(12, 17):
+        store.join(100, participant(user_id))
+    for user_id in range(11, 17):
+        store.mark_paid(stuck, user_id, user_id)
+
+    # A waiting room: one paid seat, one seat whose payment committed before
+    # mark_paid reached the journal and one seat whose payment never committed
+    waiting = store.join(250, participant(21))[0]['room_id']
+    store.mark_paid(waiting, 21, 21)
+    store.join(250, participant(22))
+    store.join(250, participant(23))
+    # No stop(): the process crashes
+
+    restored = make_store(path)
+    committed = {(waiting, 22): 122}
+    assert restored.restore(lambda room_id, user_id: committed.get((room_id, user_id))) == 2
+
+    assert restored.get(drawn) is None
+    assert restored.room_ids('drawing') == [stuck]
+    assert restored.get(stuck)['total_pool'] == 600
+    room = restored.get(waiting)
+    assert [(p['user_id'], p['payment_id']) for p in room['participants']] == [(21, 21), (22, 122)]
+    assert room['total_pool'] == 500
+    assert restored.active_room_of(23) is None
+    assert restored.active_room_of(22) == waiting
+    assert restored.open_room(250)['room_id'] == waiting
+
+    # Restore compacted everything into a fresh snapshot: a second restart sees the same rooms
+    restored.join(250, participant(24))
+    again = make_store(path)
+    assert again.restore(lambda room_id, user_id: None) == 2
+    assert [p['user_id'] for p in again.get(waiting)['participants']] == [21, 22]
+
+def test_snapshot_drops_old_journals_and_torn_tail(tmp_path):
+    """Test that a snapshot removes journals it covers and a torn last line is ignored"""
+    path = str(tmp_path / 'rooms')
+    store = make_store(path)
+    store.restore(lambda room_id, user_id: None)
+    room_id = store.join(50, participant(1))[0]['room_id']
+    store.checkpoint()
+    store.checkpoint()
+    assert sorted(os.listdir(tmp_path)) == ['rooms.journal.3', 'rooms.snapshot']
+
+    store.join(50, participant(2))
+    with open(path + '.journal.3', 'a') as f:
+        f.write('{"room_id": "half')
+
+    restored = make_store(path)
+    restored.restore(lambda room_id, user_id: 7)
+    assert [p['payment_id'] for p in restored.get(room_id)['participants']] == [7, 7]
+
+def test_journal_written_after_room_lock_released(tmp_path):
+    """Test that room changes reach the journal file only after the room's stripe lock is released"""
+    store = make_store(str(tmp_path / 'rooms'))
+    store.restore(lambda room_id, user_id: None)
+    room_id = store.join(50, participant(1))[0]['room_id']
+    lock = store.room_locks.for_key(room_id)
+    held = []
+    flush = store.journal.flush
+
+    def checked_flush():
+        held.append(lock._lock.locked())
+        flush()
+
+    store.journal.flush = checked_flush
+    store.mark_paid(room_id, 1, 7)
+    store.join(50, participant(2))
+    store.leave(room_id, 2)
+    store.transition(room_id, start_draw)
+    assert held == [False] * 4
+
+    restored = make_store(str(tmp_path / 'rooms'))
+    restored.restore(lambda room_id, user_id: None)
+    assert restored.get(room_id)['status'] == 'drawing'
+    assert [p['payment_id'] for p in restored.get(room_id)['participants']] == [7]
@@ -0,0 +1,46 @@
+import pytest
+import sys
+import os
+import json
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from room_model import Participant, Room
+
+def make_room():
+    return Room('r1', 100, 6, participants=[Participant(1, 'alice', 'Alice', payment_id=10),
+                                            Participant(2, '', 'Bob')], total_pool=200)
+
+def test_public_json_cached_until_touch():
+    """Test that the public JSON is built once per version and copies share it"""
+    room = make_room()
+    body = room.public_json()
+    assert json.loads(body) == {
+        'room_id': 'r1', 'version': 1, 'entry_fee': 100, 'status': 'waiting', 'total_pool': 200,
+        'winner': None, 'max_participants': 6,
+        'participants': [{'user_id': 1, 'username': 'alice', 'first_name': 'Alice'},
+                         {'user_id': 2, 'username': '', 'first_name': 'Bob'}],
+    }
+    assert room.public_json() is body
+    assert room.copy().public_json() is body
+
+    room['status'] = 'drawing'
+    room.touch()
+    assert room['version'] == 2
+    assert json.loads(room.public_json())['status'] == 'drawing'
+
+def test_dict_round_trip_and_legacy_timestamps():
+    """Test that to_dict keeps private fields and ISO timestamps from older snapshots are converted"""
+    room = make_room()
+    assert Room.from_dict(json.loads(json.dumps(room.to_dict()))) == room
+
+    legacy = Room.from_dict({'room_id': 'r2', 'entry_fee': 50, 'status': 'waiting', 'total_pool': 50,
+                             'winner': None, 'created_at': '2024-01-01T12:00:00',
+                             'participants': [{'user_id': 3, 'first_name': 'Carol', 'payment_id': None,
+                                               'joined_at': '2024-01-01T12:00:05'}]},
+                            max_participants=6)
+    assert legacy['participants'][0]['joined_at'] - legacy['created_at'] == 5
+    assert legacy['participants'][0]['username'] == ''
+    with pytest.raises(KeyError):
+        legacy['missing']
@@ -0,0 +1,185 @@
+import pytest
+import sys
+import os
+import time
+import json
+import multiprocessing
+from collections import Counter
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+from room_store import MemoryRoomStore, SQLiteRoomStore, create_room_store
+from room_model import Room
+
+FEES = (50, 100)
+
+def participant(user_id):
+    return {'user_id': user_id, 'username': '', 'first_name': f'User{user_id}', 'payment_id': None,
+            'joined_at': '2024-01-01T00:00:00'}
+
+def join_users(db_path, user_ids):
+    """Worker process: join every user through its own SQLite store"""
+    store = SQLiteRoomStore(db_path)
+    for user_id in user_ids:
+        store.join(FEES[user_id % len(FEES)], participant(user_id))
+    db.close_all()
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    path = str(tmp_path / 'lottery.db')
+    db.migrate(path)
+    changed = []
+    instance = create_room_store(request.param, path, on_change=changed.append)
+    instance.changed = changed
+    yield instance
+    db.close_all()
+
+def test_seat_lifecycle(store):
+    """Test that both backends fill, release, pay and draw a room the same way"""
+    joined = [store.join(100, participant(user_id)) for user_id in range(1, 7)]
+    room_id = joined[0][0]['room_id']
+    assert all(room['room_id'] == room_id and ok for room, ok in joined)
+    assert joined[-1][0]['status'] == 'drawing'
+    assert store.active_room_of(3) == room_id
+
+    # Releasing an unpaid seat reopens the room; the next player takes the seat
+    assert store.leave(room_id, 6)
+    assert store.get(room_id)['status'] == 'waiting'
+    assert store.active_room_of(6) is None
+    assert store.join(100, participant(7)) == (store.get(room_id), True)
+
+    paid = [store.mark_paid(room_id, user_id, user_id) for user_id in (1, 2, 3, 4, 5, 7)]
+    assert paid == [False] * 5 + [True]
+    assert store.room_ids('drawing') == [room_id]
+
+    def draw(room):
+        if room['status'] != 'drawing':
+            return None
+        room['status'] = 'completed'
+        return room['room_id']
+
+    assert store.transition(room_id, draw) == room_id
+    assert store.transition(room_id, draw) is None
+    assert store.active_room_of(1) is None
+    assert store.changed[-1]['status'] == 'completed'
+
+    # Snapshots are copies: changing one does not touch the store
+    store.get(room_id)['participants'].clear()
+    assert len(store.get(room_id)['participants']) == 6
+
+def test_processes_share_rooms(tmp_path):
+    """Test that worker processes never overfill a room or seat a user twice"""
+    db_path = str(tmp_path / 'lottery.db')
+    db.migrate(db_path)
+    db.close_all()
+
+    users = list(range(1, 241))
+    workers = 4
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=join_users, args=(db_path, users[n::workers])) for n in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    store = SQLiteRoomStore(db_path)
+    rooms = [store.get(room_id) for room_id in store.room_ids()]
+    seats = Counter(p['user_id'] for room in rooms for p in room['participants'])
+    assert seats == Counter(users)
+    assert all(len(room['participants']) == room['total_pool'] // room['entry_fee'] <= 6 for room in rooms)
+    # Only the last room of each fee may still be waiting for players
+    assert sum(room['status'] == 'waiting' for room in rooms) <= len(FEES)
+    db.close_all()
+
+def test_changes_from_other_processes_are_delivered(tmp_path):
+    """Test that the watcher reports rooms changed by another store instance, not its own changes"""
+    db_path = str(tmp_path / 'lottery.db')
+    db.migrate(db_path)
+    seen = []
+    watched = SQLiteRoomStore(db_path, on_change=seen.append, poll_interval=0.02).start()
+    try:
+        watched.join(50, participant(1))
+        own = len(seen)
+        room, _ = SQLiteRoomStore(db_path).join(50, participant(2))
+
+        deadline = time.monotonic() + 2
+        while len(seen) == own and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert [r['participants'] for r in seen[own:]] == [room['participants']]
+    finally:
+        watched.stop()
+        db.close_all()
+
+def test_sqlite_restore_reconciles_unpaid_seats(tmp_path):
+    """Test that a worker start binds committed payments and frees only stale unpaid seats"""
+    db_path = str(tmp_path / 'lottery.db')
+    db.migrate(db_path)
+    store = SQLiteRoomStore(db_path)
+    try:
+        room_id = store.join(50, participant(1))[0]['room_id']
+        store.join(50, participant(2))
+        store.join(50, dict(participant(3), joined_at=time.time()))  # Payment still being written elsewhere
+
+        committed = {(room_id, 1): 101}
+        assert SQLiteRoomStore(db_path).restore(lambda room_id, user_id: committed.get((room_id, user_id))) == 1
+
+        room = store.get(room_id)
+        assert [(p['user_id'], p['payment_id']) for p in room['participants']] == [(1, 101), (3, None)]
+        assert room['total_pool'] == 100
+        assert store.active_room_of(2) is None
+        assert store.active_room_of(3) == room_id
+    finally:
+        db.close_all()
+
+def test_memory_store_wraps_existing_rooms():
+    """Test that a memory store built over a dict indexes the rooms already in it"""
+    rooms = {'r1': Room.from_dict({'room_id': 'r1', 'entry_fee': 100, 'status': 'waiting',
+                                   'participants': [participant(1)], 'total_pool': 100, 'winner': None})}
+    store = MemoryRoomStore(rooms=rooms)
+    assert store.open_room(100)['room_id'] == 'r1'
+    assert store.active_room_of(1) == 'r1'
+
+def test_memory_store_threads_fill_rooms_in_parallel():
+    """Test that striped room locks never overfill a room or seat a user twice"""
+    from threading import Thread
+    store = MemoryRoomStore(stripes=8)
+    users = list(range(1, 601))
+
+    def worker(user_ids):
+        for user_id in user_ids:
+            room, _ = store.join(FEES[user_id % len(FEES)], participant(user_id))
+            store.mark_paid(room['room_id'], user_id, user_id)
+
+    threads = [Thread(target=worker, args=(users[n::8],)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    rooms = [store.get(room_id) for room_id in store.room_ids()]
+    assert Counter(p['user_id'] for room in rooms for p in room['participants']) == Counter(users)
+    assert all(len(room['participants']) == 6 and room['status'] == 'drawing' for room in rooms)
+    assert all(store.active_room_of(user_id) is not None for user_id in users)
+
+def test_version_and_public_json(store):
+    """Test that visible changes bump the room version and the public JSON hides payments"""
+    room, _ = store.join(100, participant(1))
+    room_id, version = room['room_id'], room['version']
+    body = store.read(room_id, Room.public_json)
+    assert json.loads(body)['participants'] == [{'user_id': 1, 'username': '', 'first_name': 'User1'}]
+    if isinstance(store, MemoryRoomStore):
+        assert store.read(room_id, Room.public_json) is body
+
+    # The payment is not visible to clients: same version, same bytes
+    store.mark_paid(room_id, 1, 11)
+    assert store.get(room_id)['version'] == version
+    assert store.read(room_id, Room.public_json) == body
+
+    store.join(100, participant(2))
+    state = json.loads(store.read(room_id, Room.public_json))
+    assert state['version'] == version + 1 == store.changed[-1]['version']
+    assert [p['user_id'] for p in state['participants']] == [1, 2]
+    assert 'payment_id' not in store.read(room_id, Room.public_json).decode()
@@ -0,0 +1,218 @@
+import pytest
+import sys
+import os
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import scheduler as scheduler_module
+from scheduler import LotteryScheduler
+from room_store import MemoryRoomStore
+from room_model import Room
+
+def make_room(room_id, status='drawing'):
+    """Full room in the same shape as the room store keeps"""
+    return Room.from_dict({
+        'room_id': room_id,
+        'entry_fee': 100,
+        'status': status,
+        'participants': [
+            {'user_id': i, 'first_name': f'User{i}', 'payment_id': i}
+            for i in range(1, 7)
+        ],
+        'total_pool': 600
+    }, max_participants=6)
+
+def wait_for(predicate, timeout=2.0):
+    """Poll until predicate is true"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+@pytest.fixture
+def notified(monkeypatch):
+    """Capture participant notifications instead of calling Telegram"""
+    results = []
+    monkeypatch.setattr(scheduler_module, 'notify_room_participants', results.append)
+    return results
+
+@pytest.fixture
+def make_scheduler(stop_after):
+    """Create schedulers that are stopped after the test"""
+    def factory(rooms, on_change=None, **kwargs):
+        kwargs.setdefault('safety_scan_interval', 60)
+        store = MemoryRoomStore(rooms=rooms, on_change=on_change)
+        instance = stop_after(LotteryScheduler(store, ':memory:', **kwargs))
+        instance.start()
+        return instance
+
+    return factory
+
+def test_full_room_drawn_immediately(make_scheduler, notified):
+    """Test that a room handed to the scheduler is drawn without waiting for a scan"""
+    rooms = {}
+    instance = make_scheduler(rooms)
+    before = scheduler_module.time_to_draw.count
+
+    rooms['r1'] = make_room('r1')
+    started = time.monotonic()
+    instance.notify_room_full('r1')
+
+    assert wait_for(lambda: rooms['r1']['status'] == 'completed')
+    assert time.monotonic() - started < 1
+    assert wait_for(lambda: len(notified) == 1)
+    assert scheduler_module.time_to_draw.count == before + 1
+
+def test_draw_delay(make_scheduler, notified):
+    """Test that the optional animation delay postpones the draw"""
+    rooms = {}
+    instance = make_scheduler(rooms, draw_delay=0.3)
+    rooms['r1'] = make_room('r1')
+    instance.notify_room_full('r1')
+
+    time.sleep(0.1)
+    assert rooms['r1']['status'] == 'drawing'
+    assert wait_for(lambda: rooms['r1']['status'] == 'completed')
+
+def test_safety_scan_picks_up_missed_rooms(make_scheduler, notified):
+    """Test that rooms never handed to the scheduler are still drawn"""
+    rooms = {'r1': make_room('r1')}
+    changed = []
+    make_scheduler(rooms, on_change=changed.append)
+
+    assert wait_for(lambda: rooms['r1']['status'] == 'completed')
+    assert changed[-1]['room_id'] == 'r1'
+
+def test_unpaid_rooms_not_drawn(make_scheduler, notified):
+    """Test that a full room with an unrecorded payment waits for mark_paid"""
+    room = make_room('r1')
+    room.participants[-1].payment_id = None
+    rooms = {'r1': room}
+    instance = make_scheduler(rooms)
+
+    instance.notify_room_full('r1')
+    time.sleep(0.1)
+    instance._check_and_conduct_lotteries()
+    assert rooms['r1']['status'] == 'drawing'
+
+    instance.store.mark_paid('r1', 6, 6)
+    instance.notify_room_full('r1')
+    assert wait_for(lambda: rooms['r1']['status'] == 'completed')
+
+def test_record_retried_until_it_succeeds(make_scheduler, notified, monkeypatch):
+    """Test that a failing result write is retried and participants are notified only after it lands"""
+    import sqlite3
+    attempts = []
+
+    def flaky_record(result, db_path):
+        attempts.append(result['room_id'])
+        if len(attempts) < 4:
+            raise sqlite3.OperationalError('database is locked')
+        return True
+
+    monkeypatch.setattr(scheduler_module, 'RECORD_RETRY_DELAY', 0.01)
+    monkeypatch.setattr(scheduler_module, 'record_lottery_result', flaky_record)
+    rooms = {}
+    instance = make_scheduler(rooms)
+    rooms['r1'] = make_room('r1')
+    instance.notify_room_full('r1')
+
+    assert wait_for(lambda: len(notified) == 1)
+    assert attempts == ['r1'] * 4
+
+def test_unrecorded_draws_reconciled_at_start(tmp_path, notified):
+    """Test that a full room lost before its result was written is drawn and recorded once at startup"""
+    import db
+    db_path = str(tmp_path / 'lottery.db')
+    db.migrate(db_path)
+    with db.transaction(db_path) as conn:
+        for room_id in ('lost', 'done', 'short'):
+            conn.execute("INSERT INTO rooms (room_id, entry_fee, status, total_pool) VALUES (?, 100, 'waiting', 600)",
+                         (room_id,))
+            for user_id in range(1, 7 if room_id != 'short' else 4):
+                conn.execute('INSERT INTO room_participants (room_id, user_id, payment_id) VALUES (?, ?, ?)',
+                             (room_id, user_id, user_id))
+    store = MemoryRoomStore(rooms={'done': make_room('done')}, max_room_size=6)
+    store.transition('done', lambda room: scheduler_module.draw_winner('done', {'done': room}))
+
+    try:
+        for _ in range(2):
+            instance = LotteryScheduler(store, db_path, safety_scan_interval=60)
+            instance.start()
+            instance.stop()
+
+        statuses = dict(db.fetch_all('SELECT room_id, status FROM rooms', db_path=db_path))
+        assert statuses == {'lost': 'completed', 'done': 'completed', 'short': 'waiting'}
+        assert db.fetch_value("SELECT COUNT(*) FROM transactions WHERE transaction_type = 'winner_payout'",
+                              db_path=db_path) == 2
+        assert sorted(result['room_id'] for result in notified) == ['done', 'lost']
+    finally:
+        db.close_all()
+
+def test_payments_and_reads_flat_while_draw_bookkeeping_blocks(tmp_path, monkeypatch):
+    """Test that payment processing and room reads stay fast while post-draw writes are stuck"""
+    import json
+    from threading import Event
+    import db
+    import app as app_module
+    import telegram_client
+    from fake_bot_api import FakeBotApi
+
+    release = Event()
+    recording, notifications = [], []
+
+    def blocked_record(result, db_path):
+        recording.append(result['room_id'])
+        release.wait(10)  # Result write stuck (locked database, slow disk)
+        return record_lottery_result(result, db_path)
+
+    record_lottery_result = scheduler_module.record_lottery_result
+    db_path = str(tmp_path / 'lottery.db')
+    monkeypatch.setattr(app_module, 'DB_PATH', db_path)
+    api = FakeBotApi().start()
+    monkeypatch.setattr(telegram_client, '_client', telegram_client.TelegramClient('TEST', api.url))
+    monkeypatch.setattr(scheduler_module, 'notify_room_participants', lambda result: notifications.append(result))
+    monkeypatch.setattr(scheduler_module, 'record_lottery_result', blocked_record)
+
+    instance = LotteryScheduler(app_module.room_store, db_path, safety_scan_interval=60)
+    instance.start()
+    monkeypatch.setattr(app_module, 'scheduler', instance)
+    client = app_module.app.test_client()
+
+    payment_latencies, read_latencies = [], []
+    try:
+        for i in range(36):
+            user_id = 5000 + i
+            update = {'update_id': i, 'message': {
+                'from': {'id': user_id, 'first_name': f'User{user_id}'},
+                'successful_payment': {
+                    'invoice_payload': json.dumps({'user_id': user_id, 'entry_fee': 50}),
+                    'telegram_payment_charge_id': f'latency_{i}',
+                },
+            }}
+            started = time.perf_counter()
+            app_module.process_update(update)
+            payment_latencies.append(time.perf_counter() - started)
+
+            room_id = db.fetch_value('SELECT room_id FROM payments WHERE user_id = ?', (user_id,), db_path)
+            started = time.perf_counter()
+            assert client.get(f'/api/room/{room_id}').status_code == 200
+            read_latencies.append(time.perf_counter() - started)
+
+        # Every post-draw thread was stuck on a result write while the work above ran
+        assert wait_for(lambda: len(recording) == scheduler_module.POST_DRAW_WORKERS)
+        assert notifications == []
+    finally:
+        release.set()
+        instance.stop()
+        api.stop()
+        for room_id in app_module.room_store.room_ids():
+            app_module.room_store.remove(room_id)
+
+    assert len(notifications) == 6
+    assert max(payment_latencies) < 0.2
+    assert max(read_latencies) < 0.2
@@ -0,0 +1,103 @@
+import pytest
+import sys
+import os
+import json
+import asyncio
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from broadcast import RoomBroadcaster
+from stream_server import StreamServer
+
+@pytest.fixture
+def server():
+    """Stream server with one known room"""
+    hub = RoomBroadcaster(heartbeat_interval=0.2)
+    rooms = {'room1': {'room_id': 'room1', 'status': 'waiting', 'participants': []}}
+
+    def open_stream(room_id, subscription):
+        if room_id not in rooms:
+            return None
+        return hub.subscribe(room_id, current=rooms[room_id], subscription=subscription)
+
+    server = StreamServer(hub, open_stream, host='127.0.0.1').start()
+    yield server
+    server.stop()
+
+async def open_stream(port, room_id):
+    """Connect and read response headers"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET /api/room/{room_id}/stream HTTP/1.1\r\nHost: test\r\n\r\n'.encode())
+    status = await reader.readline()
+    while await reader.readline() not in (b'\r\n', b''):
+        pass
+    return status, reader, writer
+
+async def read_event(reader):
+    """Read one SSE message"""
+    data = await asyncio.wait_for(reader.readuntil(b'\n\n'), 2)
+    return data.decode()
+
+def test_streams_receive_current_state_and_updates(server):
+    """Test that many concurrent streams get the initial state and each publish"""
+    async def scenario():
+        streams = [await open_stream(server.port, 'room1') for _ in range(50)]
+        for status, reader, _ in streams:
+            assert b'200' in status
+            assert json.loads((await read_event(reader))[6:])['status'] == 'waiting'
+
+        assert server.active_streams == 50
+        server.hub.publish('room1', {'status': 'completed'}, final=True)
+
+        for _, reader, writer in streams:
+            assert json.loads((await read_event(reader))[6:])['status'] == 'completed'
+            assert await reader.read() == b''
+            writer.close()
+
+    asyncio.run(scenario())
+
+def test_idle_stream_gets_heartbeat(server):
+    """Test that idle connections receive heartbeat comments"""
+    async def scenario():
+        _, reader, writer = await open_stream(server.port, 'room1')
+        await read_event(reader)
+        assert await read_event(reader) == ': ping\n\n'
+        writer.close()
+
+    asyncio.run(scenario())
+
+def test_unknown_room(server):
+    """Test that unknown rooms get an error event"""
+    async def scenario():
+        status, reader, writer = await open_stream(server.port, 'missing')
+        assert b'200' in status
+        assert 'Room not found' in await read_event(reader)
+        writer.close()
+
+    asyncio.run(scenario())
+
+def test_start_worker_starts_stream_server(monkeypatch):
+    """Test that each worker's start_worker brings the stream server up on STREAM_PORT"""
+    import app as app_module
+
+    monkeypatch.setenv('STREAM_PORT', '0')
+    monkeypatch.setattr(app_module, '_worker_started', False)
+    monkeypatch.setattr(app_module, 'stream_server', None)
+    for component in (app_module.room_store, app_module.scheduler, app_module.room_expiry, app_module.updates):
+        monkeypatch.setattr(component, 'start', lambda: None)
+    monkeypatch.setattr(app_module.room_store, 'restore', lambda find_payment: 0)
+
+    app_module.start_worker()
+    try:
+        assert app_module.stream_server is not None and app_module.stream_server.reuse_port
+
+        async def scenario():
+            status, reader, writer = await open_stream(app_module.stream_server.port, 'missing')
+            assert b'200' in status
+            assert 'Room not found' in await read_event(reader)
+            writer.close()
+
+        asyncio.run(scenario())
+    finally:
+        app_module.stream_server.stop()
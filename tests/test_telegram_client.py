@@ -0,0 +1,77 @@
+import pytest
+import sys
+import os
+import json
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import telegram_client
+from telegram_client import (TelegramClient, TelegramError, TelegramNetworkError,
+                             TelegramRetryAfter, TelegramServerError)
+from fake_bot_api import FakeBotApi
+
+@pytest.fixture
+def api():
+    """Local Telegram Bot API stub"""
+    server = FakeBotApi().start()
+    yield server
+    server.stop()
+
+def test_call_returns_result(api):
+    """Test that successful calls return the result field and reuse one client"""
+    api.handlers['createInvoiceLink'] = lambda params: f"https://t.me/invoice/{params['payload']}"
+    client = TelegramClient('TEST', api.url)
+
+    assert client.create_invoice_link({'payload': 'abc'}) == 'https://t.me/invoice/abc'
+    assert client.send_message(1, 'Hello') is True
+    assert [c['method'] for c in api.calls] == ['createInvoiceLink', 'sendMessage']
+    assert api.calls[1]['params'] == {'chat_id': 1, 'text': 'Hello', 'parse_mode': 'HTML'}
+
+def test_typed_errors(api):
+    """Test that API failures are raised as typed exceptions"""
+    client = TelegramClient('TEST', api.url)
+
+    api.fail_next(1, status=429, retry_after=7)
+    with pytest.raises(TelegramRetryAfter) as excinfo:
+        client.send_message(1, 'Hello')
+    assert excinfo.value.retry_after == 7
+
+    api.fail_next(1, status=502, description='Bad Gateway')
+    with pytest.raises(TelegramServerError):
+        client.send_message(1, 'Hello')
+
+    api.fail_next(1, status=400, description='Bad Request: chat not found')
+    with pytest.raises(TelegramError) as excinfo:
+        client.send_message(1, 'Hello')
+    assert excinfo.value.error_code == 400
+    assert not isinstance(excinfo.value, (TelegramRetryAfter, TelegramServerError))
+
+def test_per_method_timeout(api):
+    """Test that a slow response fails with a network error after the method timeout"""
+    api.latency = 0.5
+    client = TelegramClient('TEST', api.url, timeouts={'sendMessage': 0.1})
+
+    with pytest.raises(TelegramNetworkError):
+        client.send_message(1, 'Hello')
+    assert client.answer_pre_checkout_query('q1', True) is True
+
+def test_webhook_answers_pre_checkout(api, monkeypatch, tmp_path):
+    """Test that the webhook answers pre-checkout queries through the shared client"""
+    import app as app_module
+    from update_pipeline import UpdatePipeline
+
+    db_path = str(tmp_path / 'lottery.db')
+    pipeline = UpdatePipeline(app_module.process_update, db_path)
+    monkeypatch.setattr(app_module, 'updates', pipeline)
+    monkeypatch.setattr(telegram_client, '_client', TelegramClient('TEST', api.url))
+    update = {'update_id': 1, 'pre_checkout_query': {
+        'id': 'query-1',
+        'invoice_payload': json.dumps({'user_id': 777001, 'entry_fee': 50}),
+    }}
+    response = app_module.app.test_client().post('/webhook', json=update)
+    assert pipeline.join(timeout=5)
+    pipeline.stop()
+
+    assert response.status_code == 200
+    assert api.calls_to('answerPreCheckoutQuery')[0]['params'] == {'pre_checkout_query_id': 'query-1', 'ok': True}
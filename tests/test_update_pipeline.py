@@ -0,0 +1,149 @@
+import pytest
+import sys
+import os
+import json
+import time
+from threading import Event, Lock, Thread
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+import update_pipeline
+from update_pipeline import UpdatePipeline
+
+def make_update(update_id, user_id, text='hi'):
+    return {'update_id': update_id, 'message': {'from': {'id': user_id}, 'text': text}}
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'lottery.db')
+    db.migrate(path)
+    yield path
+    db.close_all()
+
+@pytest.fixture
+def make_pipeline(db_path, stop_after):
+    """Create pipelines that are stopped after the test"""
+    def factory(handler, **kwargs):
+        return stop_after(UpdatePipeline(handler, db_path, **kwargs))
+
+    return factory
+
+def test_duplicates_ignored(db_path, make_pipeline):
+    """Test that a redelivered update_id is stored and processed only once"""
+    handled = []
+    pipeline = make_pipeline(handled.append)
+
+    assert pipeline.submit(make_update(1, 10)) is True
+    assert pipeline.submit(make_update(1, 10)) is False
+    assert pipeline.submit({'message': {}}) is False
+    assert pipeline.join(timeout=5)
+
+    assert [u['update_id'] for u in handled] == [1]
+    assert db.fetch_all('SELECT update_id, status FROM webhook_updates', db_path=db_path) == [(1, 'done')]
+
+def test_per_user_order(make_pipeline):
+    """Test that updates of one user are processed in order while users run in parallel"""
+    seen = {}
+    lock = Lock()
+
+    def handler(update):
+        user_id = update['message']['from']['id']
+        time.sleep(0.001 * (update['update_id'] % 3))
+        with lock:
+            seen.setdefault(user_id, []).append(update['update_id'])
+
+    pipeline = make_pipeline(handler, workers=4)
+    update_id = 0
+    for _ in range(20):
+        for user_id in range(8):
+            update_id += 1
+            pipeline.submit(make_update(update_id, user_id))
+    assert pipeline.join(timeout=10)
+
+    assert len(seen) == 8
+    for ids in seen.values():
+        assert ids == sorted(ids)
+        assert len(ids) == 20
+
+def test_submit_does_not_wait_for_processing(db_path, make_pipeline):
+    """Test that submit returns while the handler is still busy, and lag is recorded"""
+    release = Event()
+    pipeline = make_pipeline(lambda update: release.wait(5))
+    before = update_pipeline.processing_lag.count
+
+    started = time.perf_counter()
+    pipeline.submit(make_update(1, 10))
+    assert time.perf_counter() - started < 0.1
+    assert pipeline.depth() == 1
+
+    release.set()
+    assert pipeline.join(timeout=5)
+    assert pipeline.depth() == 0
+    assert update_pipeline.processing_lag.count == before + 1
+
+def test_failed_and_pending_updates(db_path, make_pipeline):
+    """Test that failures are retried with backoff, fail only after max attempts, and pending updates replay"""
+    calls = []
+
+    def flaky(update):
+        calls.append(update['update_id'])
+        if update['update_id'] == 3 or calls.count(update['update_id']) < 3:
+            raise ValueError('boom')
+
+    pipeline = make_pipeline(flaky, max_attempts=3, retry_delay=0.01)
+    pipeline.submit(make_update(1, 10))
+    pipeline.submit(make_update(3, 12))
+
+    def statuses():
+        return db.fetch_all('SELECT update_id, status, attempts FROM webhook_updates ORDER BY update_id',
+                            db_path=db_path)
+
+    deadline = time.monotonic() + 5
+    while statuses() != [(1, 'done', 3), (3, 'failed', 3)] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert statuses() == [(1, 'done', 3), (3, 'failed', 3)]
+    assert db.fetch_value('SELECT error FROM webhook_updates WHERE update_id = 3',
+                          db_path=db_path) == 'boom (after 3 attempts)'
+    assert calls.count(1) == calls.count(3) == 3
+    pipeline.stop()
+
+    # Accepted, but the process died before handling it
+    db.execute('INSERT INTO webhook_updates (update_id, user_id, payload, received_at) VALUES (?, ?, ?, ?)',
+               (2, 11, json.dumps(make_update(2, 11)), time.time() - 60), db_path)
+    handled = []
+    make_pipeline(handled.append).start().join(timeout=5)
+
+    assert [u['update_id'] for u in handled] == [2]
+
+def test_workers_claim_stored_updates_once(db_path, make_pipeline):
+    """Test that concurrently starting workers replay each stored update once and skip live leases"""
+    def store(update_id, status='pending', owner=None, lease_until=None):
+        db.execute('''INSERT INTO webhook_updates (update_id, user_id, payload, received_at, status, owner, lease_until)
+                      VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                   (update_id, update_id, json.dumps(make_update(update_id, update_id)), time.time() - 60,
+                    status, owner, lease_until), db_path)
+
+    for update_id in range(1, 101):
+        store(update_id)
+    store(101, 'processing', 'dead-worker', time.time() - 1)
+    store(102, 'processing', 'live-worker', time.time() + 300)
+
+    handled, lock = [], Lock()
+
+    def handler(update):
+        with lock:
+            handled.append(update['update_id'])
+
+    pipelines = [make_pipeline(handler) for _ in range(4)]
+    threads = [Thread(target=pipeline.start) for pipeline in pipelines]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(pipeline.join(timeout=5) for pipeline in pipelines)
+
+    assert sorted(handled) == list(range(1, 102))
+    assert db.fetch_one("SELECT status, owner FROM webhook_updates WHERE update_id = 102",
+                        db_path=db_path) == ('processing', 'live-worker')
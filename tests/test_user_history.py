@@ -0,0 +1,95 @@
+import pytest
+import sys
+import os
+import json
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+import app as app_module
+from lottery_engine import record_lottery_result
+from tests.test_migrations import make_init_data
+
+USER_ID = 42
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'lottery.db')
+    monkeypatch.setattr(app_module, 'DB_PATH', path)
+    monkeypatch.setattr(app_module, 'BOT_TOKEN', 'test-token')
+    monkeypatch.setattr(app_module.limiter, 'enabled', False)
+    db.migrate(path)
+    yield path
+    db.close_all()
+
+@pytest.fixture
+def client(db_path):
+    return app_module.app.test_client()
+
+def play_games(db_path, count):
+    """USER_ID plays count rooms against user 7 and wins every third one"""
+    for n in range(count):
+        room_id = f'room_{n}'
+        with db.transaction(db_path) as conn:
+            conn.execute("INSERT INTO rooms (room_id, entry_fee, status, total_pool) VALUES (?, 100, 'drawing', 200)",
+                         (room_id,))
+            for user_id in (USER_ID, 7):
+                conn.execute('INSERT INTO room_participants (room_id, user_id) VALUES (?, ?)', (room_id, user_id))
+        winner = USER_ID if n % 3 == 0 else 7
+        record_lottery_result({'room_id': room_id, 'winner': {'user_id': winner}, 'winner_amount': 160,
+                               'admin_amount': 40, 'completed_at': '2024-01-01 00:00:00',
+                               'participants': [{'user_id': USER_ID}, {'user_id': 7}]}, db_path)
+
+def test_history_pages(db_path, client):
+    """Test that cursor pages list every game once, newest first, with outcome and payout"""
+    play_games(db_path, 120)
+    init_data = make_init_data({'id': USER_ID, 'first_name': 'Player'}, 'test-token')
+
+    games, cursor, pages = [], None, 0
+    while True:
+        body = {'initData': init_data, 'limit': 50}
+        if cursor:
+            body['cursor'] = cursor
+        response = client.post('/api/user/history', json=body)
+        assert response.status_code == 200
+        games += response.json['games']
+        cursor, pages = response.json['next_cursor'], pages + 1
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert [g['room_id'] for g in games] == [f'room_{n}' for n in range(119, -1, -1)]
+    assert games[-1] == {'room_id': 'room_0', 'joined_at': games[-1]['joined_at'], 'entry_fee': 100,
+                         'status': 'completed', 'total_pool': 200, 'won': True, 'payout': 160,
+                         'completed_at': '2024-01-01 00:00:00'}
+    assert games[-2]['won'] is False and games[-2]['payout'] == 0
+
+    response = client.post('/api/user/history', json={'initData': init_data, 'cursor': 'WyJ4Il0'})
+    assert response.status_code == 400
+
+def test_history_ndjson_export(db_path, client, monkeypatch):
+    """Test that the NDJSON export streams the whole history in chunks"""
+    monkeypatch.setattr(app_module, 'HISTORY_EXPORT_CHUNK', 7)
+    play_games(db_path, 20)
+    init_data = make_init_data({'id': USER_ID, 'first_name': 'Player'}, 'test-token')
+
+    response = client.post('/api/user/history', json={'initData': init_data, 'format': 'ndjson'})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line)['room_id'] for line in lines] == [f'room_{n}' for n in range(19, -1, -1)]
+
+def test_history_page_uses_indexes_only(db_path):
+    """Test that a page is an index range: no table scan and no sort, however long the history"""
+    statements = []
+    conn = db.get_connection(db_path)
+    conn.set_trace_callback(statements.append)
+    try:
+        app_module.lottery_engine.get_user_history(USER_ID, 1000, 50, db_path)
+    finally:
+        conn.set_trace_callback(None)
+
+    plan = [row[3] for row in db.fetch_all(f'EXPLAIN QUERY PLAN {statements[0]}', db_path=db_path)]
+    assert not [step for step in plan if step.startswith('SCAN') or 'TEMP B-TREE' in step], plan
+    assert any('COVERING INDEX idx_room_participants_user_history' in step for step in plan), plan
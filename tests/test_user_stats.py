@@ -0,0 +1,90 @@
+import pytest
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import db
+import group_commit
+import user_stats
+from lottery_engine import conduct_lottery, get_user_statistics
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'lottery.db')
+    db.migrate(path)
+    yield path
+    group_commit.stop_all()
+    db.close_all()
+
+def test_payments_and_draw_update_stats(db_path, monkeypatch):
+    """Test that ingestion and the draw keep user_stats equal to the raw tables"""
+    import app as app_module
+
+    full_rooms = []
+    monkeypatch.setattr(app_module, 'DB_PATH', db_path)
+    monkeypatch.setattr(app_module.scheduler, 'notify_room_full', full_rooms.append)
+
+    for user_id in range(1, 7):
+        room_id, _ = app_module.ingest_payment({'id': user_id, 'first_name': f'User{user_id}'},
+                                               500, f'charge-{user_id}')
+    assert full_rooms == [room_id]
+
+    result = conduct_lottery(room_id, app_module.room_store, db_path)
+    app_module.room_store.remove(room_id)
+
+    winner_id = result['winner']['user_id']
+    loser_id = 1 if winner_id != 1 else 2
+    assert get_user_statistics(winner_id, db_path) == {
+        'total_games': 1, 'total_wins': 1, 'win_rate': 100.0,
+        'total_winnings': 2400, 'total_spent': 500, 'net_profit': 1900, 'total_referrals': 0
+    }
+    assert get_user_statistics(loser_id, db_path)['net_profit'] == -500
+    assert user_stats.check(db_path) == []
+
+def test_backfill_and_check(db_path):
+    """Test that backfill rebuilds the table from history and check reports drift"""
+    db.execute('''INSERT INTO rooms (room_id, entry_fee, status, total_pool, winner_user_id)
+                  VALUES ('old', 100, 'completed', 200, 1)''', db_path=db_path)
+    for user_id in (1, 2):
+        cursor = db.execute('''INSERT INTO payments (user_id, amount, telegram_payment_charge_id, status, room_id)
+                               VALUES (?, 100, ?, 'completed', 'old')''', (user_id, f'old-{user_id}'), db_path)
+        db.execute('INSERT INTO room_participants (room_id, user_id, payment_id) VALUES (?, ?, ?)',
+                   ('old', user_id, cursor.lastrowid), db_path)
+    db.execute('''INSERT INTO transactions (room_id, to_user_id, amount, transaction_type)
+                  VALUES ('old', 1, 160, 'winner_payout')''', db_path=db_path)
+
+    # Rows written before the table existed are reported as missing
+    assert {(m['user_id'], m['field']) for m in user_stats.check(db_path)} == {
+        (1, 'total_games'), (1, 'total_wins'), (1, 'total_winnings'), (1, 'total_spent'),
+        (2, 'total_games'), (2, 'total_spent'),
+    }
+
+    assert user_stats.backfill(db_path) == 2
+    assert user_stats.check(db_path) == []
+    assert user_stats.get_user_stats(1, db_path)['total_winnings'] == 160
+
+    db.execute('UPDATE user_stats SET total_spent = 0 WHERE user_id = 2', db_path=db_path)
+    assert user_stats.check(db_path) == [{'user_id': 2, 'field': 'total_spent', 'expected': 100, 'actual': 0}]
+    assert user_stats.main(['check', '--db', db_path]) == 1
+
+def test_stats_command_reads_table(db_path, monkeypatch):
+    """Test that /stats replies with the user's counters instead of zeros"""
+    import bot
+
+    with db.transaction(db_path) as conn:
+        user_stats.record_payment(conn, 42, 100)
+        user_stats.record_payment(conn, 42, 100)
+        user_stats.record_win(conn, 42, 480)
+    monkeypatch.setattr(bot, 'DB_PATH', db_path)
+    sent = []
+    monkeypatch.setattr(bot, 'send_message', lambda chat_id, text, markup=None: sent.append((chat_id, text)))
+
+    bot.handle_stats_command(42)
+
+    assert sent[0][0] == 42
+    assert 'Игр сыграно: 2' in sent[0][1]
+    assert 'Побед: 1' in sent[0][1]
+    assert 'Процент побед: 50.0%' in sent[0][1]
+    assert 'Всего выиграно: 480 ⭐' in sent[0][1]
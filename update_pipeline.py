@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import queue
+import sqlite3
+import secrets
+import logging
+from threading import Condition, Event, Lock, Thread
+from typing import Callable, Dict, List, Optional
+
+import db
+import metrics
+from db import DB_PATH
+
+logger = logging.getLogger(__name__)
+
+UPDATE_WORKERS = 8
+PROCESSED_RETENTION_HOURS = 24  # Telegram повторяет доставку не дольше суток
+UPDATE_LEASE = 300  # Секунд, после которых необработанное обновление упавшего процесса забирает другой
+UPDATE_ATTEMPTS = 5  # Попыток обработки до статуса failed: Telegram после ответа 200 обновление не повторит
+RETRY_DELAY = 5      # Секунд до второй попытки, дальше вдвое больше (не дольше аренды)
+
+_STOP = object()
+
+processing_lag = metrics.latency('webhook.processing_lag_seconds')
+received_total = metrics.counter('webhook.updates_total')
+duplicates_total = metrics.counter('webhook.duplicate_updates_total')
+failed_total = metrics.counter('webhook.failed_updates_total')
+reclaimed_total = metrics.counter('webhook.reclaimed_updates_total')
+retried_total = metrics.counter('webhook.retried_updates_total')
+
+# Разделы update, в которых Telegram передает отправителя
+_SENDER_KEYS = ('message', 'edited_message', 'pre_checkout_query', 'callback_query', 'shipping_query')
+
+
+def update_user_id(update: Dict) -> Optional[int]:
+    """Пользователь, от которого пришло обновление (None — неизвестен)"""
+    for key in _SENDER_KEYS:
+        item = update.get(key)
+        if isinstance(item, dict):
+            sender = item.get('from')
+            if isinstance(sender, dict) and 'id' in sender:
+                return sender['id']
+    return None
+
+
+class UpdatePipeline:
+    """
+    Фоновая обработка обновлений вебхука
+
+    submit() сохраняет сырое обновление в webhook_updates (повтор update_id
+    отбрасывается) и ставит его в очередь, после чего вебхук сразу отвечает
+    Telegram. Обработчики разбиты на шарды по user_id: обновления одного
+    пользователя обрабатываются строго по порядку одним потоком, разных —
+    параллельно.
+
+    Запись принадлежит процессу, который ее принял (status = 'processing',
+    owner, lease_until). Необработанные записи упавшего процесса — pending
+    до миграции 10 или с истекшей арендой — забирает start() и затем раз в
+    lease/2 секунд фоновый поток: выбор и захват идут одной транзакцией
+    BEGIN IMMEDIATE, поэтому несколько воркеров не обработают одну запись.
+
+    Вебхук уже ответил 200, поэтому ошибка обработки не теряет обновление:
+    запись возвращается в pending и забирается снова не раньше retry_at
+    (платежи повторять безопасно — charge_id уникален). failed — только
+    после max_attempts попыток или если повтор ничего не изменит
+    (IntegrityError: платеж уже записан).
+    """
+
+    def __init__(self, handler: Callable[[Dict], None], db_path: str = DB_PATH,
+                 workers: int = UPDATE_WORKERS, lease: float = UPDATE_LEASE,
+                 max_attempts: int = UPDATE_ATTEMPTS, retry_delay: float = RETRY_DELAY):
+        self.handler = handler
+        self.db_path = db_path
+        self.workers = workers
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.owner = f'{os.getpid()}-{secrets.token_hex(4)}'
+        self.running = False
+        self._stopped = Event()
+        self._start_lock = Lock()
+        self._queues: List[queue.Queue] = [queue.Queue() for _ in range(workers)]
+        self._threads: List[Thread] = []
+        self._idle = Condition()
+        self._pending = 0
+        metrics.gauge('webhook.queue_depth', self.depth)
+
+    def start(self) -> 'UpdatePipeline':
+        """Запустить обработчики и дообработать обновления, не обработанные упавшими процессами"""
+        with self._start_lock:
+            if self.running:
+                return self
+            self.running = True
+            self._stopped.clear()
+            self._threads = [Thread(target=self._worker, args=(q,), name=f'updates-{i}', daemon=True)
+                             for i, q in enumerate(self._queues)]
+            self._threads.append(Thread(target=self._reclaim_loop, name='updates-reclaim', daemon=True))
+            for thread in self._threads:
+                thread.start()
+
+        self.purge_processed()
+        claimed = self.reclaim()
+        if claimed:
+            logger.warning(f"Recovered {claimed} unprocessed webhook updates")
+        logger.info(f"Update pipeline started with {self.workers} workers")
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Остановить обработчики (очередь дообрабатывается до маркера остановки)"""
+        with self._start_lock:
+            if not self.running:
+                return
+            self.running = False
+        self._stopped.set()
+        for q in self._queues:
+            q.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def depth(self) -> int:
+        """Обновлений в очереди и в обработке"""
+        return self._pending
+
+    def submit(self, update: Dict) -> bool:
+        """Сохранить и поставить обновление в очередь; False — повтор или некорректный update"""
+        update_id = update.get('update_id')
+        if not isinstance(update_id, int):
+            logger.warning(f"Ignoring update without update_id: {update}")
+            return False
+
+        if not self.running:
+            self.start()
+
+        received_at = time.time()
+        cursor = db.execute('''INSERT OR IGNORE INTO webhook_updates
+                               (update_id, user_id, payload, received_at, status, owner, lease_until)
+                               VALUES (?, ?, ?, ?, 'processing', ?, ?)''',
+                            (update_id, update_user_id(update), json.dumps(update), received_at,
+                             self.owner, received_at + self.lease), self.db_path)
+        if cursor.rowcount == 0:
+            duplicates_total.inc()
+            logger.info(f"Duplicate update {update_id} ignored")
+            return False
+
+        received_total.inc()
+        self._enqueue(update, received_at)
+        return True
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Дождаться обработки всех принятых обновлений (тесты, бенчмарки)"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def reclaim(self) -> int:
+        """
+        Захватить и поставить в очередь необработанные обновления: pending
+        (время повтора наступило) или processing другого процесса с истекшей
+        арендой. Свои processing не захватываются — они уже в очереди.
+        """
+        now = time.time()
+        claimable = '''FROM webhook_updates
+                       WHERE (status = 'pending' AND (retry_at IS NULL OR retry_at <= ?))
+                          OR (status = 'processing' AND lease_until < ? AND owner IS NOT ?)'''
+        params = (now, now, self.owner)
+        # Пустой проход не берет блокировку записи
+        if not db.fetch_value(f'SELECT EXISTS (SELECT 1 {claimable})', params, self.db_path):
+            return 0
+        with db.transaction(self.db_path) as conn:
+            rows = conn.execute(f'SELECT update_id, payload, received_at {claimable} ORDER BY update_id',
+                                params).fetchall()
+            conn.executemany('''UPDATE webhook_updates SET status = 'processing', owner = ?, lease_until = ?
+                                WHERE update_id = ?''',
+                             [(self.owner, now + self.lease, row[0]) for row in rows])
+        for update_id, payload, received_at in rows:
+            self._enqueue(json.loads(payload), received_at)
+        reclaimed_total.inc(len(rows))
+        return len(rows)
+
+    def purge_processed(self, max_age_hours: float = PROCESSED_RETENTION_HOURS) -> int:
+        """Удалить обработанные обновления старше max_age_hours (окно дедупликации)"""
+        cursor = db.execute('''DELETE FROM webhook_updates
+                               WHERE status IN ('done', 'failed') AND received_at < ?''',
+                            (time.time() - max_age_hours * 3600,), self.db_path)
+        return cursor.rowcount
+
+    def _enqueue(self, update: Dict, received_at: float) -> None:
+        user_id = update_user_id(update)
+        shard = hash(user_id) % self.workers if user_id is not None else 0
+        with self._idle:
+            self._pending += 1
+        self._queues[shard].put((update, received_at))
+
+    def _reclaim_loop(self) -> None:
+        while not self._stopped.wait(min(self.lease / 2, self.retry_delay)):
+            try:
+                claimed = self.reclaim()
+            except Exception as e:
+                logger.error(f"Error reclaiming webhook updates: {e}")
+                continue
+            if claimed:
+                logger.warning(f"Reclaimed {claimed} webhook updates for retry or with expired leases")
+
+    def _worker(self, q: queue.Queue) -> None:
+        while True:
+            item = q.get()
+            if item is _STOP:
+                return
+            update, received_at = item
+            update_id = update['update_id']
+            try:
+                self.handler(update)
+            except sqlite3.IntegrityError as e:
+                # Повтор уже записанного (UNIQUE): следующая попытка упадет так же
+                self._finish(update_id, received_at, 'failed', str(e))
+            except Exception as e:
+                logger.error(f"Error processing update {update_id}: {e}")
+                self._retry_or_fail(update_id, received_at, str(e))
+            else:
+                self._finish(update_id, received_at, 'done', None)
+            finally:
+                with self._idle:
+                    self._pending -= 1
+                    if self._pending == 0:
+                        self._idle.notify_all()
+
+    def _finish(self, update_id: int, received_at: float, status: str, error: Optional[str]) -> None:
+        processed_at = time.time()
+        processing_lag.observe(processed_at - received_at)
+        if status == 'failed':
+            failed_total.inc()
+            logger.error(f"Update {update_id} FAILED permanently, needs manual review: {error}")
+        try:
+            db.execute('''UPDATE webhook_updates SET status = ?, processed_at = ?, error = ?, attempts = attempts + 1
+                          WHERE update_id = ?''', (status, processed_at, error, update_id), self.db_path)
+        except Exception as e:
+            logger.error(f"Error marking update {update_id} as {status}: {e}")
+
+    def _retry_or_fail(self, update_id: int, received_at: float, error: str) -> None:
+        """Вернуть обновление в pending с паузой; после max_attempts попыток — failed"""
+        try:
+            attempts = db.fetch_value('SELECT attempts FROM webhook_updates WHERE update_id = ?',
+                                      (update_id,), self.db_path, default=0) + 1
+            if attempts >= self.max_attempts:
+                self._finish(update_id, received_at, 'failed', f'{error} (after {attempts} attempts)')
+                return
+            delay = min(self.retry_delay * 2 ** (attempts - 1), self.lease)
+            db.execute('''UPDATE webhook_updates SET status = 'pending', owner = NULL, lease_until = NULL,
+                          attempts = ?, retry_at = ?, error = ? WHERE update_id = ?''',
+                       (attempts, time.time() + delay, error, update_id), self.db_path)
+            retried_total.inc()
+            logger.warning(f"Update {update_id} will be retried in {delay}s (attempt {attempts}/{self.max_attempts})")
+        except Exception as e:
+            # Запись осталась processing: ее заберут после истечения аренды
+            logger.error(f"Error scheduling retry of update {update_id}: {e}")
@@ -0,0 +1,180 @@
+"""
+Статистика пользователей (таблица user_stats) и активность рефералов
+
+Счетчики обновляются в тех же транзакциях, что и записи в payments,
+room_participants, rooms, transactions и referrals, поэтому чтение — один
+поиск по первичному ключу. Завершенные игры и победы приглашенного хранятся
+в его строке referrals (games_played, wins). Для уже существующих данных
+и для проверки:
+
+    python user_stats.py backfill [--db lottery.db]
+    python user_stats.py check [--db lottery.db]
+"""
+import sys
+import sqlite3
+import logging
+import argparse
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+import db
+from db import DB_PATH
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('total_games', 'total_wins', 'total_winnings', 'total_spent', 'total_referrals')
+REFERRAL_FIELDS = ('games_played', 'wins')
+
+# Те же значения, посчитанные по исходным таблицам
+_AGGREGATE_SQL = '''
+    WITH games AS (SELECT user_id, COUNT(*) AS n FROM room_participants GROUP BY user_id),
+         wins AS (SELECT winner_user_id AS user_id, COUNT(*) AS n FROM rooms
+                  WHERE winner_user_id IS NOT NULL GROUP BY winner_user_id),
+         winnings AS (SELECT to_user_id AS user_id, SUM(amount) AS n FROM transactions
+                      WHERE transaction_type = 'winner_payout' AND to_user_id IS NOT NULL
+                      GROUP BY to_user_id),
+         spent AS (SELECT user_id, SUM(amount) AS n FROM payments
+                   WHERE status = 'completed' GROUP BY user_id),
+         invited AS (SELECT referrer_user_id AS user_id, COUNT(*) AS n FROM referrals
+                     GROUP BY referrer_user_id),
+         ids AS (SELECT user_id FROM games UNION SELECT user_id FROM wins
+                 UNION SELECT user_id FROM winnings UNION SELECT user_id FROM spent
+                 UNION SELECT user_id FROM invited)
+    SELECT ids.user_id, COALESCE(games.n, 0), COALESCE(wins.n, 0),
+           COALESCE(winnings.n, 0), COALESCE(spent.n, 0), COALESCE(invited.n, 0)
+    FROM ids
+    LEFT JOIN games USING (user_id)
+    LEFT JOIN wins USING (user_id)
+    LEFT JOIN winnings USING (user_id)
+    LEFT JOIN spent USING (user_id)
+    LEFT JOIN invited USING (user_id)
+    WHERE ids.user_id IS NOT NULL
+'''
+
+# Активность каждого реферала по исходным таблицам
+_REFERRAL_AGGREGATE_SQL = '''
+    SELECT r.referred_user_id,
+           (SELECT COUNT(*) FROM room_participants rp JOIN rooms ro ON ro.room_id = rp.room_id
+            WHERE rp.user_id = r.referred_user_id AND ro.status = 'completed'),
+           (SELECT COUNT(*) FROM rooms WHERE winner_user_id = r.referred_user_id)
+    FROM referrals r
+'''
+
+
+def _increment(conn: sqlite3.Connection, user_id: int, games: int = 0, wins: int = 0,
+               winnings: int = 0, spent: int = 0, referrals: int = 0) -> None:
+    conn.execute('''INSERT INTO user_stats
+                        (user_id, total_games, total_wins, total_winnings, total_spent, total_referrals)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        total_games = total_games + excluded.total_games,
+                        total_wins = total_wins + excluded.total_wins,
+                        total_winnings = total_winnings + excluded.total_winnings,
+                        total_spent = total_spent + excluded.total_spent,
+                        total_referrals = total_referrals + excluded.total_referrals,
+                        updated_at = CURRENT_TIMESTAMP''',
+                 (user_id, games, wins, winnings, spent, referrals))
+
+
+def record_payment(conn: sqlite3.Connection, user_id: int, amount: int, joined_room: bool = True) -> None:
+    """Учесть оплату (вызывать в транзакции, записывающей платеж)"""
+    _increment(conn, user_id, games=1 if joined_room else 0, spent=amount)
+
+
+def record_refund(conn: sqlite3.Connection, user_id: int, amount: int) -> None:
+    """Платеж уходит на возврат (вызывать в транзакции, меняющей его статус); игра остается в истории"""
+    _increment(conn, user_id, spent=-amount)
+
+
+def record_win(conn: sqlite3.Connection, user_id: int, amount: int) -> None:
+    """Учесть выигрыш (вызывать в транзакции, записывающей результат розыгрыша)"""
+    _increment(conn, user_id, wins=1, winnings=amount)
+
+
+def record_referral(conn: sqlite3.Connection, referrer_user_id: int) -> None:
+    """Учесть нового приглашенного (в транзакции, записывающей referrals)"""
+    _increment(conn, referrer_user_id, referrals=1)
+
+
+def record_completed_game(conn: sqlite3.Connection, user_ids: Iterable[int], winner_user_id: int) -> None:
+    """Учесть завершенную игру у рефералов среди участников (в транзакции розыгрыша)"""
+    conn.executemany('''UPDATE referrals SET games_played = games_played + ?, wins = wins + ?
+                        WHERE referred_user_id = ?''',
+                     [(games, int(user_id == winner_user_id), user_id)
+                      for user_id, games in Counter(user_ids).items()])
+
+
+def get_user_stats(user_id: int, db_path: Optional[str] = None) -> Dict:
+    """Статистика пользователя одним запросом по первичному ключу"""
+    row = db.fetch_one(f'SELECT {", ".join(FIELDS)} FROM user_stats WHERE user_id = ?', (user_id,), db_path)
+    total_games, total_wins, total_winnings, total_spent, total_referrals = row or (0,) * len(FIELDS)
+    win_rate = (total_wins / total_games * 100) if total_games > 0 else 0
+
+    return {
+        'total_games': total_games,
+        'total_wins': total_wins,
+        'win_rate': round(win_rate, 2),
+        'total_winnings': total_winnings,
+        'total_spent': total_spent,
+        'net_profit': total_winnings - total_spent,
+        'total_referrals': total_referrals
+    }
+
+
+def backfill(db_path: Optional[str] = None) -> int:
+    """Пересчитать user_stats и активность рефералов по исходным таблицам, вернуть число пользователей"""
+    with db.transaction(db_path) as conn:
+        conn.execute('DELETE FROM user_stats')
+        conn.execute(f'INSERT INTO user_stats (user_id, {", ".join(FIELDS)}) {_AGGREGATE_SQL}')
+        conn.executemany('UPDATE referrals SET games_played = ?, wins = ? WHERE referred_user_id = ?',
+                         [(games, wins, user_id)
+                          for user_id, games, wins in conn.execute(_REFERRAL_AGGREGATE_SQL).fetchall()])
+        return conn.execute('SELECT COUNT(*) FROM user_stats').fetchone()[0]
+
+
+def check(db_path: Optional[str] = None) -> List[Dict]:
+    """Сравнить user_stats и активность рефералов с исходными таблицами, вернуть расхождения"""
+    # Одна read-транзакция: все выборки видят один и тот же снимок базы
+    with db.transaction(db_path, immediate=False) as conn:
+        expected = {row[0]: row[1:] for row in conn.execute(_AGGREGATE_SQL)}
+        actual = {row[0]: row[1:] for row in conn.execute(f'SELECT user_id, {", ".join(FIELDS)} FROM user_stats')}
+        referrals_expected = {row[0]: row[1:] for row in conn.execute(_REFERRAL_AGGREGATE_SQL)}
+        referrals_actual = {row[0]: row[1:] for row in conn.execute(
+            'SELECT referred_user_id, games_played, wins FROM referrals')}
+
+    return (_compare(expected, actual, FIELDS)
+            + _compare(referrals_expected, referrals_actual, REFERRAL_FIELDS, prefix='referral_'))
+
+
+def _compare(expected: Dict, actual: Dict, fields: tuple, prefix: str = '') -> List[Dict]:
+    mismatches = []
+    zeros = (0,) * len(fields)
+    for user_id in sorted(expected.keys() | actual.keys()):
+        want, have = expected.get(user_id, zeros), actual.get(user_id, zeros)
+        for field, want_value, have_value in zip(fields, want, have):
+            if want_value != have_value:
+                mismatches.append({'user_id': user_id, 'field': prefix + field,
+                                   'expected': want_value, 'actual': have_value})
+    return mismatches
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Обслуживание таблицы user_stats')
+    parser.add_argument('command', choices=['backfill', 'check'])
+    parser.add_argument('--db', default=DB_PATH, help='Путь к базе данных')
+    args = parser.parse_args(argv)
+
+    if args.command == 'backfill':
+        print(f"user_stats rebuilt for {backfill(args.db)} users")
+        return 0
+
+    mismatches = check(args.db)
+    for mismatch in mismatches[:50]:
+        print(f"user {mismatch['user_id']}: {mismatch['field']} expected {mismatch['expected']}, "
+              f"got {mismatch['actual']}")
+    print(f"{len(mismatches)} mismatches")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())